@@ -0,0 +1,90 @@
+import threading
+import time
+from typing import Callable, Generic, List, Optional, TypeVar
+
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class _Submission(Generic[T, R]):
+    def __init__(self, item: T):
+        self.item: T = item
+        self.result: Optional[R] = None
+        self.error: Optional[BaseException] = None
+        self.done = threading.Event()
+
+
+class WriteBatcher(Generic[T, R]):
+    """
+    Combines the writes that concurrent threads submit close together into one call of `apply`
+
+    The first thread that submits an item while no batch is collected becomes
+    the leader of the next batch: It waits `window` seconds for more items,
+    then applies all collected items with one call of `apply`, while the other
+    threads wait for their results. Batches are applied one after another, so
+    `apply` never runs concurrently, and items that arrive while a batch is
+    applied form the next batch. This way, e.g. one fsync of the
+    :class:`wal.MutationLog` covers many posts.
+
+    If `apply` raises for a batch, its items are applied one by one, so that
+    an item that cannot be applied only fails its own submission. `apply`
+    therefore needs to either apply all items or none.
+
+    :ivar apply: Applies a list of items and returns one result per item
+    :ivar window: The time in seconds a leader waits for more items
+    """
+    def __init__(self, apply: Callable[[List[T]], List[R]], window: float = 0.):
+        self.apply: Callable[[List[T]], List[R]] = apply
+        self.window: float = window
+        self._lock = threading.Lock()
+        self._apply_lock = threading.Lock()
+        self._queue: List[_Submission[T, R]] = []
+        self._collecting: bool = False
+        self.num_batches: int = 0
+        self.num_items: int = 0
+
+    def submit(self, item: T) -> R:
+        """
+        Applies `item` together with the items submitted at the same time and returns its result
+
+        :raises: What `apply` raised for `item` alone
+        """
+        submission: _Submission[T, R] = _Submission(item)
+        with self._lock:
+            self._queue.append(submission)
+            leader = not self._collecting
+            self._collecting = True
+        if leader:
+            if self.window > 0:
+                time.sleep(self.window)
+            with self._apply_lock:
+                with self._lock:
+                    batch, self._queue = self._queue, []
+                    self._collecting = False
+                self._apply_batch(batch)
+        submission.done.wait()
+        if submission.error is not None:
+            raise submission.error
+        return submission.result
+
+    def _apply_batch(self, batch: List[_Submission[T, R]]) -> None:
+        self.num_batches += 1
+        self.num_items += len(batch)
+        try:
+            results = self.apply([submission.item for submission in batch])
+        except Exception as e:
+            if len(batch) == 1:
+                batch[0].error = e
+            else:
+                for submission in batch:
+                    try:
+                        submission.result = self.apply([submission.item])[0]
+                    except Exception as item_error:
+                        submission.error = item_error
+        else:
+            for submission, result in zip(batch, results):
+                submission.result = result
+        finally:
+            for submission in batch:
+                submission.done.set()
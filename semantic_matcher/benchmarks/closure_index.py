@@ -0,0 +1,76 @@
+"""
+Compares the per-query latency and memory of :func:`model.EquivalenceTable.get_local_matches` with and without the
+:class:`closure.ClosureIndex`.
+
+Run with `python -m semantic_matcher.benchmarks.closure_index`
+"""
+import argparse
+import random
+import time
+import tracemalloc
+from typing import List
+
+from semantic_matcher.model import SemanticMatch, EquivalenceTable
+
+
+def generate_table(num_ids: int, fan_out: int, seed: int) -> EquivalenceTable:
+    rng = random.Random(seed)
+    table = EquivalenceTable(matches={})
+    semantic_ids = [f"benchmark.com/semanticID/{i}" for i in range(num_ids)]
+    for base_semantic_id in semantic_ids:
+        for match_semantic_id in rng.sample(semantic_ids, fan_out):
+            if match_semantic_id == base_semantic_id:
+                continue
+            table.add_semantic_match(SemanticMatch(
+                base_semantic_id=base_semantic_id,
+                match_semantic_id=match_semantic_id,
+                score=rng.uniform(0.5, 1.),
+                meta_information={"matchSource": "Benchmark"}
+            ))
+    return table
+
+
+def time_queries(table: EquivalenceTable, queries: List[str], score_limit: float) -> float:
+    """
+    Returns the mean latency of a query in milliseconds
+    """
+    start = time.perf_counter()
+    for semantic_id in queries:
+        table.get_local_matches(semantic_id, score_limit)
+    return (time.perf_counter() - start) / len(queries) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--ids", type=int, default=5000)
+    parser.add_argument("--fan-out", type=int, default=4)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--hot-ids", type=int, default=200)
+    parser.add_argument("--score-limit", type=float, default=0.6)
+    parser.add_argument("--floor-score", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    table = generate_table(args.ids, args.fan_out, args.seed)
+    rng = random.Random(args.seed)
+    hot_ids = rng.sample(list(table.matches.keys()), args.hot_ids)
+    queries = [rng.choice(hot_ids) for _ in range(args.queries)]
+
+    traversal_ms = time_queries(table, queries, args.score_limit)
+
+    tracemalloc.start()
+    table.enable_closure_index(args.floor_score)
+    cold_ms = time_queries(table, hot_ids, args.score_limit)
+    index_memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    warm_ms = time_queries(table, queries, args.score_limit)
+
+    print(f"Table: {args.ids} semantic IDs, {sum(len(m) for m in table.matches.values())} matches")
+    print(f"Traversal:              {traversal_ms:.3f} ms/query")
+    print(f"Closure index (cold):   {cold_ms:.3f} ms/query")
+    print(f"Closure index (warm):   {warm_ms:.3f} ms/query")
+    print(f"Closure index memory:   {index_memory / 1024 / 1024:.2f} MiB for {args.hot_ids} base semantic IDs")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,254 @@
+"""
+Measures the end-to-end throughput and latency of `/get_matches` in a local federation of semantic matching services
+
+A synthetic table with one namespace per service is generated and split by the namespace of the base semantic IDs.
+Every service runs in its own process with the matches of its namespace, next to a stand-in resolver that maps each
+namespace to its service. Client threads then send federated (`local_only=False`) requests for random semantic IDs
+to random services.
+
+Run with `python -m semantic_matcher.benchmarks.federation`, the results are written as JSON.
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import requests
+import uvicorn
+from fastapi import FastAPI, HTTPException
+from pydantic import BaseModel
+
+from semantic_matcher import model, service, service_model
+from semantic_matcher.benchmarks import generator, results
+
+
+HOST = "127.0.0.1"
+
+
+class ResolverRequest(BaseModel):
+    semantic_id: str
+
+
+def run_resolver(port: int, endpoints: Dict[str, str]) -> None:
+    """
+    Serves a resolver that answers with the endpoint of the namespace of a semantic ID from `endpoints`
+    """
+    app = FastAPI()
+
+    @app.get("/get_semantic_matching_service")
+    def get_semantic_matching_service(request_body: ResolverRequest) -> Dict[str, str]:
+        endpoint = endpoints.get(request_body.semantic_id.split("/")[0])
+        if endpoint is None:
+            raise HTTPException(status_code=404, detail="Unknown namespace")
+        return {"semantic_matching_service_endpoint": endpoint}
+
+    uvicorn.run(app, host=HOST, port=port, log_level="error")
+
+
+def run_service(port: int, table_file: str, resolver_endpoint: str, remote_timeout: float) -> None:
+    semantic_matching_service = service.SemanticMatchingService(
+        endpoint=f"http://{HOST}:{port}",
+        equivalences=model.EquivalenceTable.from_file(table_file),
+        federation_options=service.FederationOptions(
+            remote_timeout=remote_timeout,
+            resolver_endpoint=resolver_endpoint
+        )
+    )
+    uvicorn.run(service.create_app(semantic_matching_service), host=HOST, port=port, log_level="error")
+
+
+def wait_until_ready(url: str, timeout: float = 30.) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            if requests.get(url, timeout=1.).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"{url} did not become ready within {timeout} seconds")
+        time.sleep(0.1)
+
+
+class LoadResult:
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.num_errors: int = 0
+        self.num_cut_off: int = 0
+        self.num_matches: int = 0
+        self._lock = threading.Lock()
+
+    def add(self, latency: float, response: Optional[service_model.MatchesList]) -> None:
+        with self._lock:
+            if response is None:
+                self.num_errors += 1
+                return
+            self.latencies.append(latency)
+            self.num_matches += len(response.matches)
+            if response.cut_off_services:
+                self.num_cut_off += 1
+
+
+def send_requests(
+        endpoints: List[str],
+        base_semantic_ids: List[List[str]],
+        args: argparse.Namespace,
+        num_requests: int,
+        seed: int,
+        load_result: LoadResult
+) -> None:
+    rng = random.Random(seed)
+    session = requests.Session()
+    for _ in range(num_requests):
+        service_number = rng.randrange(len(endpoints))
+        request_body = service_model.MatchRequest(
+            semantic_id=rng.choice(base_semantic_ids[service_number]),
+            score_limit=args.score_limit,
+            local_only=False,
+            max_results=args.max_results,
+            timeout=args.timeout
+        )
+        start = time.perf_counter()
+        try:
+            response = session.get(
+                f"{endpoints[service_number]}/get_matches",
+                data=request_body.model_dump_json(exclude_none=True),
+                headers={"Content-Type": "application/json"},
+                timeout=60.
+            )
+        except requests.RequestException:
+            load_result.add(0., None)
+            continue
+        latency = time.perf_counter() - start
+        if response.status_code != 200:
+            load_result.add(latency, None)
+            continue
+        load_result.add(latency, service_model.MatchesList.model_validate_json(response.text))
+
+
+def run_load(
+        endpoints: List[str],
+        base_semantic_ids: List[List[str]],
+        args: argparse.Namespace,
+        num_requests: int,
+        seed: int
+) -> Dict[str, Any]:
+    """
+    Sends `num_requests` requests from `args.clients` concurrent client threads and returns their statistics
+    """
+    load_result = LoadResult()
+    threads = [
+        threading.Thread(
+            target=send_requests,
+            args=(
+                endpoints,
+                base_semantic_ids,
+                args,
+                num_requests // args.clients + (client < num_requests % args.clients),
+                seed + client,
+                load_result
+            )
+        )
+        for client in range(args.clients)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall_seconds = time.perf_counter() - start
+    num_ok = len(load_result.latencies)
+    return {
+        "requests": num_requests,
+        "errors": load_result.num_errors,
+        "cut_off": load_result.num_cut_off,
+        "wall_seconds": wall_seconds,
+        "throughput_rps": num_ok / wall_seconds,
+        "mean_matches": load_result.num_matches / num_ok if num_ok else 0.,
+        **results.summarize_latencies(load_result.latencies),
+    }
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    matches = generator.generate_matches(
+        num_ids=args.ids,
+        fan_out=args.fan_out,
+        cycle_density=args.cycle_density,
+        score_distribution=args.score_distribution,
+        num_namespaces=args.services,
+        cross_namespace_ratio=args.cross_namespace_ratio,
+        seed=args.seed
+    )
+    tables = [model.EquivalenceTable(matches={}) for _ in range(args.services)]
+    namespace_numbers = {generator.namespace(number): number for number in range(args.services)}
+    for match in matches:
+        tables[namespace_numbers[match.base_semantic_id.split("/")[0]]].add_semantic_match(match)
+    base_semantic_ids = [list(table.matches.keys()) for table in tables]
+    resolver_port = args.base_port
+    endpoints = [f"http://{HOST}:{args.base_port + 1 + number}" for number in range(args.services)]
+    resolver_endpoint = f"http://{HOST}:{resolver_port}"
+
+    context = multiprocessing.get_context("spawn")
+    processes = [context.Process(
+        target=run_resolver,
+        args=(resolver_port, {generator.namespace(number): endpoints[number] for number in range(args.services)}),
+        daemon=True
+    )]
+    with tempfile.TemporaryDirectory() as directory:
+        for number, table in enumerate(tables):
+            table_file = os.path.join(directory, f"{generator.namespace(number)}.json")
+            table.to_file(table_file)
+            processes.append(context.Process(
+                target=run_service,
+                args=(args.base_port + 1 + number, table_file, resolver_endpoint, args.remote_timeout),
+                daemon=True
+            ))
+        for process in processes:
+            process.start()
+        try:
+            for endpoint in endpoints:
+                wait_until_ready(f"{endpoint}/cache_stats")
+            if args.warmup:
+                run_load(endpoints, base_semantic_ids, args, args.warmup, args.seed + args.clients)
+            return {
+                "matches": len(matches),
+                **run_load(endpoints, base_semantic_ids, args, args.requests, args.seed),
+            }
+        finally:
+            for process in processes:
+                process.terminate()
+            for process in processes:
+                process.join()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--services", type=int, default=3)
+    parser.add_argument("--ids", type=int, default=3000)
+    parser.add_argument("--fan-out", type=int, default=3)
+    parser.add_argument("--cycle-density", type=float, default=0.1)
+    parser.add_argument("--score-distribution", choices=sorted(generator.SCORE_DISTRIBUTIONS), default="uniform")
+    parser.add_argument("--cross-namespace-ratio", type=float, default=0.2)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--warmup", type=int, default=200, help="Requests sent before measuring")
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--score-limit", type=float, default=0.7)
+    parser.add_argument("--max-results", type=int, default=None)
+    parser.add_argument("--timeout", type=float, default=None, help="The timeout of each match request")
+    parser.add_argument("--remote-timeout", type=float, default=5.)
+    parser.add_argument("--base-port", type=int, default=8200,
+                        help="Port of the resolver, the services listen on the following ports")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="JSON file of the results, the standard output if not given")
+    args = parser.parse_args()
+
+    parameters = {name: value for name, value in vars(args).items() if name != "output"}
+    results.write_report(results.report("federation", parameters, run(args)), args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""
+Generates synthetic equivalence tables for the benchmarks
+
+The semantic IDs are spread over `num_namespaces` namespaces, `ns{k}.benchmark.com`, one per service in a federation.
+Each semantic ID gets `fan_out` matches. A match leads into another namespace with the probability
+`cross_namespace_ratio`. Matches within a namespace lead to a semantic ID with a higher number, except for a share of
+`cycle_density` that leads back to one with a lower number and thereby closes cycles. The scores are drawn from one of
+the :data:`SCORE_DISTRIBUTIONS` and scaled into `[min_score, 1.]`.
+"""
+import random
+from typing import Callable, Dict, List
+
+from semantic_matcher import compact, model
+from semantic_matcher.model import SemanticMatch
+
+
+SCORE_DISTRIBUTIONS: Dict[str, Callable[[random.Random], float]] = {
+    "uniform": lambda rng: rng.random(),
+    # Mostly good matches, as made by hand
+    "high": lambda rng: rng.betavariate(5., 1.),
+    # Mostly weak matches, as made by automatic matching
+    "low": lambda rng: rng.betavariate(1., 5.),
+    "constant": lambda rng: 1.,
+}
+
+TABLE_FACTORIES: Dict[str, Callable[[], model.AbstractEquivalenceTable]] = {
+    "dict": lambda: model.EquivalenceTable(matches={}),
+    "compact": compact.CompactEquivalenceTable,
+}
+
+
+def namespace(number: int) -> str:
+    return f"ns{number}.benchmark.com"
+
+
+def semantic_id(namespace_number: int, number: int) -> str:
+    return f"{namespace(namespace_number)}/semanticID/{number}"
+
+
+def generate_matches(
+        num_ids: int,
+        fan_out: int,
+        cycle_density: float = 0.1,
+        score_distribution: str = "uniform",
+        num_namespaces: int = 1,
+        cross_namespace_ratio: float = 0.1,
+        min_score: float = 0.5,
+        seed: int = 0
+) -> List[SemanticMatch]:
+    """
+    Returns the matches of a synthetic table with `num_ids` semantic IDs in total
+
+    The same arguments always return the same matches.
+    """
+    rng = random.Random(seed)
+    draw_score = SCORE_DISTRIBUTIONS[score_distribution]
+    ids_per_namespace = [num_ids // num_namespaces + (k < num_ids % num_namespaces) for k in range(num_namespaces)]
+    matches = []
+    for base_namespace, num_namespace_ids in enumerate(ids_per_namespace):
+        for number in range(num_namespace_ids):
+            targets = set()
+            for _ in range(fan_out):
+                target_namespace = base_namespace
+                if num_namespaces > 1 and rng.random() < cross_namespace_ratio:
+                    target_namespace = rng.choice([k for k in range(num_namespaces) if k != base_namespace])
+                num_target_ids = ids_per_namespace[target_namespace]
+                if target_namespace != base_namespace:
+                    target = rng.randrange(num_target_ids)
+                elif number > 0 and (rng.random() < cycle_density or number == num_target_ids - 1):
+                    target = rng.randrange(number)
+                elif number < num_target_ids - 1:
+                    target = rng.randrange(number + 1, num_target_ids)
+                else:
+                    # The only semantic ID of its namespace
+                    continue
+                targets.add((target_namespace, target))
+            for target_namespace, target in sorted(targets):
+                matches.append(SemanticMatch(
+                    base_semantic_id=semantic_id(base_namespace, number),
+                    match_semantic_id=semantic_id(target_namespace, target),
+                    score=min_score + (1. - min_score) * draw_score(rng),
+                    meta_information={"matchSource": "Benchmark"}
+                ))
+    return matches
+
+
+def generate_table(backend: str = "dict", **kwargs) -> model.AbstractEquivalenceTable:
+    """
+    Returns a table of the :data:`TABLE_FACTORIES` `backend` with the matches of :func:`~.generate_matches`
+
+    :param kwargs: The arguments of :func:`~.generate_matches`
+    """
+    table = TABLE_FACTORIES[backend]()
+    table.add_semantic_matches(generate_matches(**kwargs))
+    return table
@@ -0,0 +1,117 @@
+"""
+Measures the basic operations of an equivalence table on a synthetic table: `add_semantic_match`,
+`get_local_matches`, `to_file` and `from_file`, and adding and removing the matches of a single hub
+
+Run with `python -m semantic_matcher.benchmarks.micro`, the results are written as JSON.
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from typing import Any, Dict, List
+
+from semantic_matcher.benchmarks import generator, results
+from semantic_matcher.model import SemanticMatch
+
+
+def run_hub(backend: str, num_matches: int) -> Dict[str, Any]:
+    """
+    Adds and removes `num_matches` outgoing and as many incoming matches of one semantic ID, which is slow if a
+    backend copies the matches of a semantic ID on every change
+    """
+    matches = [
+        SemanticMatch(base_semantic_id=base, match_semantic_id=target, score=0.5, meta_information={})
+        for i in range(num_matches)
+        for base, target in [("hub", f"out{i}"), (f"in{i}", "hub")]
+    ]
+    table = generator.TABLE_FACTORIES[backend]()
+    start = time.perf_counter()
+    for match in matches:
+        table.add_semantic_match(match)
+    add_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    for match in matches:
+        table.remove_semantic_match(match)
+    remove_seconds = time.perf_counter() - start
+    return {
+        "matches": len(matches),
+        "add_seconds": add_seconds,
+        "remove_seconds": remove_seconds,
+    }
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    matches = generator.generate_matches(
+        num_ids=args.ids,
+        fan_out=args.fan_out,
+        cycle_density=args.cycle_density,
+        score_distribution=args.score_distribution,
+        num_namespaces=args.namespaces,
+        cross_namespace_ratio=args.cross_namespace_ratio,
+        seed=args.seed
+    )
+
+    table = generator.TABLE_FACTORIES[args.backend]()
+    start = time.perf_counter()
+    for match in matches:
+        table.add_semantic_match(match)
+    add_seconds = time.perf_counter() - start
+
+    rng = random.Random(args.seed)
+    queries = [rng.choice(matches).base_semantic_id for _ in range(args.queries)]
+    latencies: List[float] = []
+    num_results = 0
+    for semantic_id in queries:
+        start = time.perf_counter()
+        num_results += len(table.get_local_matches(semantic_id, args.score_limit))
+        latencies.append(time.perf_counter() - start)
+
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "equivalence_table.json")
+        start = time.perf_counter()
+        table.to_file(filename)
+        to_file_seconds = time.perf_counter() - start
+        file_size = os.path.getsize(filename)
+        start = time.perf_counter()
+        type(table).from_file(filename)
+        from_file_seconds = time.perf_counter() - start
+
+    return {
+        "matches": len(matches),
+        "add_semantic_match": {
+            "total_seconds": add_seconds,
+            "us_per_match": add_seconds / len(matches) * 1e6,
+        },
+        "get_local_matches": {
+            **results.summarize_latencies(latencies),
+            "mean_results": num_results / len(queries),
+        },
+        "to_file": {"seconds": to_file_seconds, "bytes": file_size},
+        "from_file": {"seconds": from_file_seconds},
+        "hub": run_hub(args.backend, args.hub_matches),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--backend", choices=sorted(generator.TABLE_FACTORIES), default="dict")
+    parser.add_argument("--ids", type=int, default=20000)
+    parser.add_argument("--fan-out", type=int, default=4)
+    parser.add_argument("--cycle-density", type=float, default=0.1)
+    parser.add_argument("--score-distribution", choices=sorted(generator.SCORE_DISTRIBUTIONS), default="uniform")
+    parser.add_argument("--namespaces", type=int, default=1)
+    parser.add_argument("--cross-namespace-ratio", type=float, default=0.1)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--score-limit", type=float, default=0.6)
+    parser.add_argument("--hub-matches", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="JSON file of the results, the standard output if not given")
+    args = parser.parse_args()
+
+    parameters = {name: value for name, value in vars(args).items() if name != "output"}
+    results.write_report(results.report("micro", parameters, run(args)), args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""
+Measures the build time and per-query latency of the :class:`nlp.NgramIndex` on generated descriptions
+
+Run with `python -m semantic_matcher.benchmarks.nlp_index`
+"""
+import argparse
+import random
+import string
+import time
+from typing import Dict
+
+from semantic_matcher.nlp import NgramIndex
+
+
+def generate_texts(num_ids: int, vocabulary_size: int, seed: int) -> Dict[str, str]:
+    rng = random.Random(seed)
+    words = [
+        "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 10)))
+        for _ in range(vocabulary_size)
+    ]
+    return {
+        f"benchmark.com/semanticID/{i}": " ".join(rng.choice(words) for _ in range(rng.randint(2, 8)))
+        for i in range(num_ids)
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--ids", type=int, default=100000)
+    parser.add_argument("--vocabulary", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--score-limit", type=float, default=0.3)
+    parser.add_argument("--max-results", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    texts = generate_texts(args.ids, args.vocabulary, args.seed)
+    start = time.perf_counter()
+    index = NgramIndex()
+    index.build(texts)
+    build_s = time.perf_counter() - start
+
+    rng = random.Random(args.seed)
+    queries = [texts[f"benchmark.com/semanticID/{rng.randrange(args.ids)}"] for _ in range(args.queries)]
+    start = time.perf_counter()
+    index.query_batch(queries, args.score_limit, args.max_results)
+    query_ms = (time.perf_counter() - start) / len(queries) * 1000
+
+    print(f"Index: {args.ids} descriptions")
+    print(f"Build:  {build_s:.2f} s")
+    print(f"Query:  {query_ms:.3f} ms/query")
+
+
+if __name__ == '__main__':
+    main()
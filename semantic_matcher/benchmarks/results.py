@@ -0,0 +1,58 @@
+"""
+Reports the results of the benchmarks as JSON, so that runs can be compared with each other to spot regressions
+
+Each report holds the name of the `benchmark`, its `parameters`, its `results` and the environment it ran in.
+"""
+import datetime
+import json
+import math
+import os
+import platform
+import sys
+from typing import Any, Dict, List, Optional, Sequence
+
+
+def percentile(values: Sequence[float], q: float) -> float:
+    """
+    Returns the `q`-th percentile of `values` by the nearest rank method, `q` being in `[0, 100]`
+    """
+    if not values:
+        return math.nan
+    ordered = sorted(values)
+    rank = max(math.ceil(q / 100. * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def summarize_latencies(latencies: List[float]) -> Dict[str, float]:
+    """
+    Returns the mean, p50 and p99 of `latencies`, which are in seconds, in milliseconds
+    """
+    return {
+        "mean_ms": sum(latencies) / len(latencies) * 1000. if latencies else math.nan,
+        "p50_ms": percentile(latencies, 50.) * 1000.,
+        "p99_ms": percentile(latencies, 99.) * 1000.,
+    }
+
+
+def report(benchmark: str, parameters: Dict[str, Any], results: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "benchmark": benchmark,
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "parameters": parameters,
+        "results": results,
+    }
+
+
+def write_report(document: Dict[str, Any], filename: Optional[str]) -> None:
+    """
+    Writes the :func:`~.report` `document` to `filename`, or to the standard output if it is `None`
+    """
+    if filename is None:
+        json.dump(document, sys.stdout, indent=4)
+        sys.stdout.write("\n")
+        return
+    with open(filename, "w", encoding="utf-8") as file:
+        json.dump(document, file, indent=4)
@@ -0,0 +1,170 @@
+"""
+Compares the encoding of `/get_matches` responses by FastAPI with the :class:`encoding.MatchEncoder`, and the parsing
+of remote responses with and without validation
+
+The end-to-end latencies are measured by calling the ASGI app directly, without a network in between, once with
+`get_matches` as route like before the :class:`encoding.MatchEncoder`, and once with the routes of the service. Both
+answer from the same warm result cache. If the matches of the requested `--hot-ids` do not fit into the
+`--encoding-cache-size`, the encoder mostly encodes matches anew, which is slower than FastAPI.
+
+Run with `python -m semantic_matcher.benchmarks.serialization`, the results are written as JSON.
+"""
+import argparse
+import asyncio
+import random
+import time
+from typing import Any, Callable, Dict, List
+
+from fastapi import FastAPI
+
+from semantic_matcher import encoding, service, service_model
+from semantic_matcher.benchmarks import generator, results
+
+
+async def call(app: FastAPI, path: str, body: bytes) -> bytes:
+    """
+    Sends a GET request with a JSON `body` to the ASGI `app` and returns the body of its response
+    """
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": b"",
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        "client": ("127.0.0.1", 0),
+        "server": ("127.0.0.1", 80),
+    }
+    received = False
+    chunks: List[bytes] = []
+
+    async def receive() -> Dict[str, Any]:
+        nonlocal received
+        if received:
+            return {"type": "http.disconnect"}
+        received = True
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message: Dict[str, Any]) -> None:
+        if message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+
+    await app(scope, receive, send)
+    return b"".join(chunks)
+
+
+def time_requests(app: FastAPI, bodies: List[bytes]) -> List[float]:
+    async def run() -> List[float]:
+        latencies = []
+        for body in bodies:
+            start = time.perf_counter()
+            await call(app, "/get_matches", body)
+            latencies.append(time.perf_counter() - start)
+        return latencies
+
+    return asyncio.run(run())
+
+
+def time_calls(function: Callable[[], Any], repetitions: int) -> float:
+    """
+    Returns the mean duration of a call of `function` in milliseconds
+    """
+    start = time.perf_counter()
+    for _ in range(repetitions):
+        function()
+    return (time.perf_counter() - start) / repetitions * 1000.
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    table = generator.generate_table(
+        num_ids=args.ids,
+        fan_out=args.fan_out,
+        cycle_density=args.cycle_density,
+        score_distribution=args.score_distribution,
+        seed=args.seed
+    )
+    semantic_matching_service = service.SemanticMatchingService(
+        endpoint="http://127.0.0.1",
+        equivalences=table,
+        cache_options=service.CacheOptions(encoding_cache_size=args.encoding_cache_size)
+    )
+    rng = random.Random(args.seed)
+    hot_ids = rng.sample(list(table.get_all_matches().keys()), args.hot_ids)
+    bodies = [
+        service_model.MatchRequest(semantic_id=rng.choice(hot_ids), score_limit=args.score_limit).model_dump_json()
+        .encode()
+        for _ in range(args.requests)
+    ]
+    # Fill the local result cache, which both routes share
+    for semantic_id in hot_ids:
+        semantic_matching_service.get_matches(
+            service_model.MatchRequest(semantic_id=semantic_id, score_limit=args.score_limit)
+        )
+
+    fastapi_app = FastAPI()
+    fastapi_app.add_api_route("/get_matches", semantic_matching_service.get_matches, methods=["GET"])
+    encoder_app = service.create_app(semantic_matching_service)
+    time_requests(fastapi_app, bodies)
+    time_requests(encoder_app, bodies)
+    fastapi_latencies = time_requests(fastapi_app, bodies)
+    encoder_latencies = time_requests(encoder_app, bodies)
+
+    largest = max(
+        (
+            semantic_matching_service.get_matches(
+                service_model.MatchRequest(semantic_id=semantic_id, score_limit=args.score_limit)
+            )
+            for semantic_id in hot_ids
+        ),
+        key=lambda matches_list: len(matches_list.matches)
+    )
+    text = largest.model_dump_json()
+    return {
+        "matches": table.stats()["matches"],
+        "mean_matches_per_response": sum(
+            len(semantic_matching_service.get_matches(service_model.MatchRequest.model_validate_json(body)).matches)
+            for body in bodies
+        ) / len(bodies),
+        "get_matches_fastapi": results.summarize_latencies(fastapi_latencies),
+        "get_matches_encoder": results.summarize_latencies(encoder_latencies),
+        "encodings": semantic_matching_service.get_cache_stats()["encodings"],
+        "largest_response": {
+            "matches": len(largest.matches),
+            "encode_cold_ms": time_calls(
+                lambda: encoding.MatchEncoder().encode_matches_list(largest), args.repetitions
+            ),
+            "encode_warm_ms": time_calls(
+                lambda: semantic_matching_service._encoder.encode_matches_list(largest), args.repetitions
+            ),
+            "model_dump_json_ms": time_calls(largest.model_dump_json, args.repetitions),
+            "parse_validated_ms": time_calls(lambda: encoding.parse_matches_list(text), args.repetitions),
+            "parse_trusted_ms": time_calls(lambda: encoding.parse_matches_list(text, trusted=True), args.repetitions),
+        },
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--ids", type=int, default=5000)
+    parser.add_argument("--fan-out", type=int, default=4)
+    parser.add_argument("--cycle-density", type=float, default=0.1)
+    parser.add_argument("--score-distribution", choices=sorted(generator.SCORE_DISTRIBUTIONS), default="high")
+    parser.add_argument("--score-limit", type=float, default=0.6)
+    parser.add_argument("--hot-ids", type=int, default=20, help="Number of semantic IDs that are requested")
+    parser.add_argument("--encoding-cache-size", type=int, default=100000)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--repetitions", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="JSON file of the results, the standard output if not given")
+    args = parser.parse_args()
+
+    parameters = {name: value for name, value in vars(args).items() if name != "output"}
+    results.write_report(results.report("serialization", parameters, run(args)), args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,210 @@
+import collections
+import threading
+import time
+from typing import Any, Callable, Dict, Generic, Hashable, List, Optional, TypeVar
+
+from semantic_matcher.model import SemanticMatch
+
+
+V = TypeVar("V")
+
+
+class _Flight(Generic[V]):
+    """
+    A running load of a cache entry, that concurrent lookups of the same key wait for
+    """
+    def __init__(self):
+        self.event = threading.Event()
+        self.value: Optional[V] = None
+        self.error: Optional[BaseException] = None
+
+
+class TTLCache(Generic[V]):
+    """
+    A thread safe, size bounded cache whose entries expire after a time to live
+
+    When the cache is full, the least recently used entry is evicted. A value
+    of `None` is a negative result (e.g. "there is no such entry") and is
+    cached with its own, usually shorter, `negative_ttl`.
+
+    Concurrent :func:`~.TTLCache.get_or_load` calls for the same missing key
+    are coalesced: Only the first one calls the loader, the others wait for
+    its result.
+
+    :ivar hits: Number of lookups answered from the cache
+    :ivar misses: Number of lookups that called the loader
+    :ivar coalesced: Number of lookups that waited for the loader of another lookup
+    """
+    def __init__(
+            self,
+            maxsize: int,
+            ttl: float,
+            negative_ttl: float,
+            clock: Callable[[], float] = time.monotonic
+    ):
+        self.maxsize: int = maxsize
+        self.ttl: float = ttl
+        self.negative_ttl: float = negative_ttl
+        self.hits: int = 0
+        self.misses: int = 0
+        self.coalesced: int = 0
+        self._clock: Callable[[], float] = clock
+        # Key -> (value, expiry time), ordered from least to most recently used
+        self._entries: "collections.OrderedDict[Hashable, tuple]" = collections.OrderedDict()
+        self._in_flight: Dict[Hashable, _Flight[V]] = {}
+        self._lock = threading.Lock()
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Optional[V]]) -> Optional[V]:
+        """
+        Returns the cached value of `key`, or calls `loader` to load and cache it
+
+        Exceptions raised by `loader` are passed on to all waiting lookups and
+        are not cached.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[1] > self._clock():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[0]
+                del self._entries[key]
+            flight = self._in_flight.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self._in_flight[key] = flight
+                self.misses += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+        try:
+            flight.value = loader()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+                if flight.error is None:
+                    self._put(key, flight.value)
+            flight.event.set()
+        return flight.value
+
+    def put_if_absent(self, key: Hashable, value: V) -> bool:
+        """
+        Caches `value` for `key`, unless `key` already has a valid entry
+
+        :returns: `True` if `value` was cached
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > self._clock():
+                return False
+            self._put(key, value)
+            return True
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+        }
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _put(self, key: Hashable, value: Optional[V]) -> None:
+        ttl = self.negative_ttl if value is None else self.ttl
+        self._entries[key] = (value, self._clock() + ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+
+class ResultCache:
+    """
+    A thread safe LRU cache of matching results
+
+    Each entry stores the matches of a query with a `score_limit` and a `tag`
+    deciding whether the entry is still valid, e.g. the version of the
+    equivalence table it was computed from. Since the matches above a higher
+    `score_limit` are a subset of the matches above a lower one, an entry can
+    also answer queries with a higher `score_limit` than its own.
+
+    :ivar hits: Number of lookups answered from the cache
+    :ivar misses: Number of lookups that found no valid entry
+    """
+    # Rough size of a cached `SemanticMatch` without its strings, in bytes
+    MATCH_OVERHEAD: int = 400
+
+    def __init__(self, maxsize: int):
+        self.maxsize: int = maxsize
+        self.hits: int = 0
+        self.misses: int = 0
+        self._approximate_size: int = 0
+        # Key -> (tag, score_limit, matches, approximate size), ordered from least to most recently used
+        self._entries: "collections.OrderedDict[Hashable, tuple]" = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(
+            self,
+            key: Hashable,
+            score_limit: float,
+            is_valid: Callable[[Any], bool]
+    ) -> Optional[List[SemanticMatch]]:
+        """
+        Returns the cached matches of `key` with a score above `score_limit`,
+        or `None` if there is no entry with a lower or equal `score_limit`
+        whose tag `is_valid`
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] > score_limit or not is_valid(entry[0]):
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return [match for match in entry[2] if match.score > score_limit]
+
+    def put(self, key: Hashable, score_limit: float, tag: Any, matches: List[SemanticMatch]) -> None:
+        size = sum(
+            self.MATCH_OVERHEAD + len(match.base_semantic_id) + len(match.match_semantic_id)
+            for match in matches
+        )
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._approximate_size -= previous[3]
+            self._entries[key] = (tag, score_limit, list(matches), size)
+            self._approximate_size += size
+            while len(self._entries) > self.maxsize:
+                _, evicted = self._entries.popitem(last=False)
+                self._approximate_size -= evicted[3]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._approximate_size = 0
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.,
+            "approximate_bytes": self._approximate_size,
+        }
+
+    def __len__(self) -> int:
+        return len(self._entries)
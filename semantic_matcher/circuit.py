@@ -0,0 +1,72 @@
+import threading
+import time
+from typing import Callable, Dict, List
+
+
+class _Circuit:
+    def __init__(self):
+        self.failures: int = 0
+        # While the circuit is open, requests are skipped until this time
+        self.open_until: float = 0.
+
+
+class CircuitBreaker:
+    """
+    Skips remote services that failed `failure_threshold` times in a row
+
+    The circuit of such a service is opened for `reset_timeout` seconds, in
+    which :func:`~.CircuitBreaker.allow` refuses all requests to it. Afterwards
+    one trial request is allowed: If it succeeds, the circuit is closed again,
+    otherwise it is opened for another `reset_timeout` seconds.
+
+    This keeps requests from waiting on services that are known to be down or
+    slow, instead of each running into the timeout.
+    """
+    def __init__(
+            self,
+            failure_threshold: int = 5,
+            reset_timeout: float = 30.,
+            clock: Callable[[], float] = time.monotonic
+    ):
+        self.failure_threshold: int = failure_threshold
+        self.reset_timeout: float = reset_timeout
+        self._clock: Callable[[], float] = clock
+        self._circuits: Dict[str, _Circuit] = {}
+        self._lock = threading.Lock()
+
+    def allow(self, key: str) -> bool:
+        """
+        Returns whether a request to `key` may be sent
+        """
+        with self._lock:
+            circuit = self._circuits.get(key)
+            if circuit is None or circuit.failures < self.failure_threshold:
+                return True
+            now = self._clock()
+            if now < circuit.open_until:
+                return False
+            # Let only this request through, until it either succeeds or fails
+            circuit.open_until = now + self.reset_timeout
+            return True
+
+    def record_success(self, key: str) -> None:
+        with self._lock:
+            self._circuits.pop(key, None)
+
+    def record_failure(self, key: str) -> None:
+        with self._lock:
+            circuit = self._circuits.setdefault(key, _Circuit())
+            circuit.failures += 1
+            if circuit.failures >= self.failure_threshold:
+                circuit.open_until = self._clock() + self.reset_timeout
+
+    def open_circuits(self) -> List[str]:
+        """
+        Returns the keys whose requests are currently skipped
+        """
+        now = self._clock()
+        with self._lock:
+            return [
+                key for key, circuit in self._circuits.items()
+                if circuit.failures >= self.failure_threshold and now < circuit.open_until
+            ]
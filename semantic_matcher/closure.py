@@ -0,0 +1,88 @@
+import itertools
+from typing import Dict, Iterable, List, Optional, Set
+
+from semantic_matcher import traversal
+
+
+class ClosureIndex:
+    """
+    A precomputed transitive closure over an equivalence table
+
+    For each base semantic ID, it stores the best path to every semantic ID
+    that is reachable with a product score above `floor_score`. Closures are
+    computed the first time a base semantic ID is looked up (or all at once
+    via :func:`~.ClosureIndex.build`) and afterwards answered with a single
+    dict access.
+
+    When the outgoing matches of a semantic ID change, only the closures that
+    reach this semantic ID are invalidated, all others stay valid.
+
+    :ivar floor_score: The lowest `score_limit` the index can answer. Queries
+        with a lower `score_limit` need to fall back to a traversal
+    """
+    def __init__(self, neighbours: traversal.Neighbours, floor_score: float):
+        self.floor_score: float = floor_score
+        self._neighbours: traversal.Neighbours = neighbours
+        # Base semantic ID -> Best paths, ordered by descending score
+        self._closures: Dict[str, List[traversal.PathResult]] = {}
+        # Semantic ID -> Base semantic IDs whose closure expands this semantic ID
+        self._dependents: Dict[str, Set[str]] = {}
+        # Increased on every invalidation, so that closures computed
+        # concurrently to a change are not stored
+        self._generation = itertools.count()
+        self._current_generation: int = next(self._generation)
+
+    def lookup(self, semantic_id: str, score_limit: float) -> Optional[List[traversal.PathResult]]:
+        """
+        Returns the best paths from `semantic_id` with a score above
+        `score_limit`, or `None` if `score_limit` is below the `floor_score`
+        """
+        if score_limit < self.floor_score:
+            return None
+        closure = self._closures.get(semantic_id)
+        if closure is None:
+            closure = self._compute(semantic_id)
+        return list(itertools.takewhile(lambda result: result.score > score_limit, closure))
+
+    def build(self, semantic_ids: Iterable[str]) -> None:
+        """
+        Precomputes the closures of all given `semantic_ids`
+        """
+        for semantic_id in semantic_ids:
+            if semantic_id not in self._closures:
+                self._compute(semantic_id)
+
+    def invalidate(self, semantic_id: str) -> None:
+        """
+        Drops all closures that depend on the outgoing matches of `semantic_id`
+        """
+        self._current_generation = next(self._generation)
+        affected = self._dependents.pop(semantic_id, set())
+        affected.add(semantic_id)
+        for base_semantic_id in affected:
+            closure = self._closures.pop(base_semantic_id, None)
+            if closure is None:
+                continue
+            for result in closure:
+                dependents = self._dependents.get(result.target)
+                if dependents is not None:
+                    dependents.discard(base_semantic_id)
+                    if not dependents:
+                        self._dependents.pop(result.target)
+
+    def clear(self) -> None:
+        self._current_generation = next(self._generation)
+        self._closures.clear()
+        self._dependents.clear()
+
+    def __len__(self) -> int:
+        return len(self._closures)
+
+    def _compute(self, semantic_id: str) -> List[traversal.PathResult]:
+        generation = self._current_generation
+        closure = list(traversal.best_first_paths(semantic_id, self._neighbours, self.floor_score))
+        if generation == self._current_generation:
+            self._closures[semantic_id] = closure
+            for result in closure:
+                self._dependents.setdefault(result.target, set()).add(semantic_id)
+        return closure
@@ -0,0 +1,431 @@
+import bisect
+import json
+from array import array
+from typing import AbstractSet, Dict, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple
+
+from semantic_matcher import closure, ingest
+from semantic_matcher.model import AbstractEquivalenceTable, SemanticMatch, UpdatePolicy
+
+
+# Rows are `(target, score, meta_information)` with interned `target` and `meta_information`
+Row = Tuple[int, float, int]
+
+
+class StringInterner:
+    """
+    Maps each semantic ID to a dense integer ID, so that every string is stored only once
+    """
+    def __init__(self):
+        self._ids: Dict[str, int] = {}
+        self._strings: List[str] = []
+
+    def intern(self, string: str) -> int:
+        string_id = self._ids.get(string)
+        if string_id is None:
+            string_id = len(self._strings)
+            # Store the string before publishing its ID, concurrent readers may look it up right away
+            self._strings.append(string)
+            self._ids[string] = string_id
+        return string_id
+
+    def get(self, string: str) -> Optional[int]:
+        return self._ids.get(string)
+
+    def __getitem__(self, string_id: int) -> str:
+        return self._strings[string_id]
+
+    def __len__(self) -> int:
+        return len(self._strings)
+
+
+class MetaInformationPool:
+    """
+    Deduplicates `meta_information` dicts, since most matches of a table share the same few ones
+    """
+    def __init__(self):
+        self._ids: Dict[str, int] = {}
+        self._pool: List[Dict] = []
+
+    def intern(self, meta_information: Dict) -> int:
+        key = json.dumps(meta_information, sort_keys=True, separators=(",", ":"))
+        meta_id = self._ids.get(key)
+        if meta_id is None:
+            meta_id = len(self._pool)
+            self._pool.append(meta_information)
+            self._ids[key] = meta_id
+        return meta_id
+
+    def get(self, meta_information: Dict) -> Optional[int]:
+        return self._ids.get(json.dumps(meta_information, sort_keys=True, separators=(",", ":")))
+
+    def __getitem__(self, meta_id: int) -> Dict:
+        return self._pool[meta_id]
+
+    def __len__(self) -> int:
+        return len(self._pool)
+
+
+class PendingRow(NamedTuple):
+    """
+    The changes of one row of a :class:`~.CSRAdjacency` since its last compaction
+
+    :ivar deleted: The CSR positions of the row that were deleted
+    :ivar added: Target -> (score, meta_id) of the added matches, which hide a match to the same target in the CSR
+        arrays
+    """
+    deleted: Set[int]
+    added: Dict[int, Tuple[float, int]]
+
+
+# Never modified, only returned for rows without changes
+_NO_CHANGES = PendingRow(set(), {})
+
+
+class CSRAdjacency:
+    """
+    The adjacency of all semantic IDs in compressed sparse row (CSR) form
+
+    The matches of the semantic ID with the ID `i` are stored at the positions
+    `offsets[i]` to `offsets[i+1]` of `targets`, `scores` and `meta_ids`,
+    ordered by target, so that a match can be found by bisection. Since the
+    CSR arrays cannot grow in place, changes are collected in `pending` until
+    the next compaction.
+
+    The incoming matches are indexed by the transposed CSR arrays, which are
+    built on their first use, and `added_inbound`.
+
+    Changes modify a :class:`~.PendingRow` or set of `added_inbound` in
+    place, but only by single set or dict operations, which are atomic under
+    the GIL of CPython. A replaced match is only overwritten in `added`, so
+    the change of a single match takes effect in one step. Readers copy
+    `added` and the sets of `added_inbound` before iterating them, so
+    concurrent changes do not make them fail, but they may see only some of
+    the changes of a batch. Changes need to be serialized among themselves.
+    """
+    def __init__(self, offsets: array, targets: array, scores: array, meta_ids: array):
+        self.offsets: array = offsets
+        self.targets: array = targets
+        self.scores: array = scores
+        self.meta_ids: array = meta_ids
+        self.pending: Dict[int, PendingRow] = {}
+        # Target -> Nodes with a match to target in `pending`
+        self.added_inbound: Dict[int, Set[int]] = {}
+        self.num_pending_changes: int = 0
+        # The nodes with a match to the target `i` are `inbound_sources[inbound_offsets[i]:inbound_offsets[i+1]]`
+        self._inbound: Optional[Tuple[array, array]] = None
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Iterable[Row]]) -> "CSRAdjacency":
+        offsets, targets, scores, meta_ids = array("q", [0]), array("I"), array("d"), array("I")
+        for row in rows:
+            for target, score, meta_id in sorted(row):
+                targets.append(target)
+                scores.append(score)
+                meta_ids.append(meta_id)
+            offsets.append(len(targets))
+        return cls(offsets, targets, scores, meta_ids)
+
+    def nbytes(self) -> int:
+        """
+        Returns the size of the CSR arrays, including the transposed ones. Memory-mapped arrays are counted as well,
+        although the operating system may page them out
+        """
+        buffers = [self.offsets, self.targets, self.scores, self.meta_ids]
+        if self._inbound is not None:
+            buffers.extend(self._inbound)
+        return sum(memoryview(buffer).nbytes for buffer in buffers)
+
+    def row(self, node: int) -> Iterator[Row]:
+        deleted, added = self.pending.get(node, _NO_CHANGES)
+        added = added.copy()
+        if node + 1 < len(self.offsets):
+            for position in range(self.offsets[node], self.offsets[node + 1]):
+                if position not in deleted and self.targets[position] not in added:
+                    yield self.targets[position], self.scores[position], self.meta_ids[position]
+        for target, (score, meta_id) in added.items():
+            yield target, score, meta_id
+
+    def find(self, node: int, target: int) -> Optional[int]:
+        """
+        Returns the CSR position of the match from `node` to `target`, or `None` if it is not part of the CSR arrays.
+        The match may be hidden by an added match to the same target
+        """
+        return self._find(node, target, self.pending.get(node, _NO_CHANGES).deleted)
+
+    def get(self, node: int, target: int) -> Optional[Tuple[float, int]]:
+        deleted, added = self.pending.get(node, _NO_CHANGES)
+        existing = added.get(target)
+        if existing is not None:
+            return existing
+        position = self._find(node, target, deleted)
+        if position is None:
+            return None
+        return self.scores[position], self.meta_ids[position]
+
+    def set(self, node: int, target: int, score: float, meta_id: int) -> None:
+        """
+        Adds or replaces the match from `node` to `target`
+        """
+        self._get_pending(node).added[target] = (score, meta_id)
+        self.added_inbound.setdefault(target, set()).add(node)
+        self.num_pending_changes += 1
+
+    def delete(self, node: int, target: int) -> bool:
+        """
+        Deletes the match from `node` to `target`
+
+        :returns: `True` if there was such a match
+        """
+        deleted, added = self.pending.get(node, _NO_CHANGES)
+        position = self._find(node, target, deleted)
+        if target in added:
+            if position is not None:
+                # The replaced match is hidden by the added one until this point
+                deleted.add(position)
+            del added[target]
+            self.added_inbound[target].discard(node)
+        else:
+            if position is None:
+                return False
+            self._get_pending(node).deleted.add(position)
+        self.num_pending_changes += 1
+        return True
+
+    def _get_pending(self, node: int) -> PendingRow:
+        pending = self.pending.get(node)
+        if pending is None:
+            pending = self.pending[node] = PendingRow(set(), {})
+        return pending
+
+    def _find(self, node: int, target: int, deleted: AbstractSet[int]) -> Optional[int]:
+        if node + 1 >= len(self.offsets):
+            return None
+        end = self.offsets[node + 1]
+        position = bisect.bisect_left(self.targets, target, self.offsets[node], end)
+        if position < end and self.targets[position] == target and position not in deleted:
+            return position
+        return None
+
+    def inbound(self, target: int) -> Iterator[Row]:
+        """
+        Returns the matches to `target` as `(node, score, meta_id)` tuples
+        """
+        if self._inbound is None:
+            self._inbound = self._transpose()
+        inbound_offsets, inbound_sources = self._inbound
+        nodes = set(self.added_inbound.get(target, ()))
+        if target + 1 < len(inbound_offsets):
+            nodes.update(inbound_sources[inbound_offsets[target]:inbound_offsets[target + 1]])
+        for node in sorted(nodes):
+            # Matches of the CSR arrays may have been replaced or deleted since
+            existing = self.get(node, target)
+            if existing is not None:
+                yield node, existing[0], existing[1]
+
+    def _transpose(self) -> Tuple[array, array]:
+        num_nodes = len(self.offsets) - 1
+        inbound_offsets = array("q", [0]) * (num_nodes + 1)
+        for target in self.targets:
+            inbound_offsets[target + 1] += 1
+        for node in range(num_nodes):
+            inbound_offsets[node + 1] += inbound_offsets[node]
+        inbound_sources = array("I", [0]) * len(self.targets)
+        next_positions = array("q", inbound_offsets)
+        for node in range(num_nodes):
+            for position in range(self.offsets[node], self.offsets[node + 1]):
+                target = self.targets[position]
+                inbound_sources[next_positions[target]] = node
+                next_positions[target] += 1
+        return inbound_offsets, inbound_sources
+
+
+class CompactEquivalenceTable(AbstractEquivalenceTable):
+    """
+    A memory efficient storage backend of an equivalence table
+
+    Semantic IDs are interned to integer IDs, the matches are stored in
+    :mod:`array` buffers in CSR form and identical `meta_information` dicts are
+    stored only once. :class:`model.SemanticMatch` objects are only created
+    when matches leave the table.
+
+    It offers the same operations as :class:`model.EquivalenceTable` and reads
+    and writes the same file format.
+
+    :cvar COMPACTION_MIN_CHANGES: The minimal number of changes collected
+        before the CSR arrays are rebuilt
+    :cvar STRING_OVERHEAD: Rough memory of an interned semantic ID or meta
+        information dict, in bytes
+    :cvar PENDING_CHANGE_OVERHEAD: Rough memory of a change that was not
+        compacted yet, in bytes
+    """
+    COMPACTION_MIN_CHANGES: int = 1024
+    STRING_OVERHEAD: int = 150
+    PENDING_CHANGE_OVERHEAD: int = 300
+
+    def __init__(
+            self,
+            semantic_ids: Optional[StringInterner] = None,
+            meta_information: Optional[MetaInformationPool] = None,
+            adjacency: Optional[CSRAdjacency] = None
+    ):
+        """
+        Initializer of :class:`~.CompactEquivalenceTable`, either empty or
+        from the given interned semantic IDs, meta information and CSR
+        adjacency without pending changes
+        """
+        self._closure_index: Optional[closure.ClosureIndex] = None
+        self._version: int = 0
+        self._semantic_ids: StringInterner = semantic_ids if semantic_ids is not None else StringInterner()
+        self._meta_information: MetaInformationPool = \
+            meta_information if meta_information is not None else MetaInformationPool()
+        self._adjacency: CSRAdjacency = adjacency if adjacency is not None else CSRAdjacency.from_rows([])
+        self._num_matches: int = len(self._adjacency.targets)
+
+    def add_semantic_match(self, match: SemanticMatch, update_policy: UpdatePolicy = UpdatePolicy.REPLACE) -> bool:
+        node = self._semantic_ids.intern(match.base_semantic_id)
+        target = self._semantic_ids.intern(match.match_semantic_id)
+        adjacency = self._adjacency
+        existing = adjacency.get(node, target)
+        if existing is not None:
+            if not update_policy.replaces(self._to_semantic_match(node, (target, *existing)), match):
+                return False
+        else:
+            self._num_matches += 1
+        adjacency.set(node, target, match.score, self._meta_information.intern(match.meta_information))
+        self._invalidate(match.base_semantic_id)
+        self._maybe_compact()
+        return True
+
+    def remove_semantic_match(self, match: SemanticMatch) -> bool:
+        node = self._semantic_ids.get(match.base_semantic_id)
+        target = self._semantic_ids.get(match.match_semantic_id)
+        if node is None or target is None:
+            return False
+        if not self._adjacency.delete(node, target):
+            return False
+        self._num_matches -= 1
+        self._invalidate(match.base_semantic_id)
+        self._maybe_compact()
+        return True
+
+    def get_semantic_match(self, base_semantic_id: str, match_semantic_id: str) -> Optional[SemanticMatch]:
+        node = self._semantic_ids.get(base_semantic_id)
+        target = self._semantic_ids.get(match_semantic_id)
+        if node is None or target is None:
+            return None
+        existing = self._adjacency.get(node, target)
+        if existing is None:
+            return None
+        return self._to_semantic_match(node, (target, *existing))
+
+    def remove_all_semantic_matches(self) -> None:
+        self._semantic_ids = StringInterner()
+        self._meta_information = MetaInformationPool()
+        self._adjacency = CSRAdjacency.from_rows([])
+        self._num_matches = 0
+        self._invalidate_all()
+
+    def get_all_matches(self) -> Dict[str, List[SemanticMatch]]:
+        matches: Dict[str, List[SemanticMatch]] = {}
+        for node in range(len(self._semantic_ids)):
+            row = [self._to_semantic_match(node, edge) for edge in self._adjacency.row(node)]
+            if row:
+                matches[self._semantic_ids[node]] = row
+        return matches
+
+    def compact(self) -> None:
+        """
+        Rebuilds the CSR arrays, merging all changes collected since the last compaction
+        """
+        adjacency = self._adjacency
+        self._adjacency = CSRAdjacency.from_rows(
+            list(adjacency.row(node)) for node in range(len(self._semantic_ids))
+        )
+
+    def __len__(self) -> int:
+        return self._num_matches
+
+    def stats(self) -> Dict[str, int]:
+        adjacency = self._adjacency
+        approximate_bytes = adjacency.nbytes() \
+            + (len(self._semantic_ids) + len(self._meta_information)) * self.STRING_OVERHEAD \
+            + adjacency.num_pending_changes * self.PENDING_CHANGE_OVERHEAD
+        return {"matches": self._num_matches, "approximate_bytes": approximate_bytes}
+
+    def to_file(self, filename: str) -> None:
+        with open(filename, "w") as file:
+            file.write('{\n    "matches": {')
+            separator = "\n"
+            for node in range(len(self._semantic_ids)):
+                row = list(self._adjacency.row(node))
+                if not row:
+                    continue
+                file.write(f'{separator}        {json.dumps(self._semantic_ids[node])}: [')
+                file.write(",".join(
+                    "\n" + "\n".join(
+                        " " * 12 + line
+                        for line in json.dumps(self._to_semantic_match(node, edge).model_dump(), indent=4).split("\n")
+                    )
+                    for edge in row
+                ))
+                file.write("\n        ]")
+                separator = ",\n"
+            file.write("\n    }\n}")
+
+    @classmethod
+    def from_file(cls, filename: str) -> "CompactEquivalenceTable":
+        """
+        Reads the table from a JSON or NDJSON file, see :func:`ingest.iter_file`. The file is parsed incrementally
+        """
+        semantic_ids = StringInterner()
+        meta_information = MetaInformationPool()
+        rows: Dict[int, Dict[int, Tuple[float, int]]] = {}
+        for match in ingest.iter_file(filename):
+            row = rows.setdefault(semantic_ids.intern(str(match["base_semantic_id"])), {})
+            row[semantic_ids.intern(str(match["match_semantic_id"]))] = (
+                float(match["score"]),
+                meta_information.intern(dict(match["meta_information"]))
+            )
+        adjacency = CSRAdjacency.from_rows(
+            [(target, *value) for target, value in rows.get(node, {}).items()]
+            for node in range(len(semantic_ids))
+        )
+        return cls(semantic_ids, meta_information, adjacency)
+
+    def _get_neighbours(self, semantic_id: str) -> Iterable[Tuple[str, float, Dict]]:
+        node = self._semantic_ids.get(semantic_id)
+        if node is None:
+            return []
+        return [
+            (self._semantic_ids[target], score, self._meta_information[meta_id])
+            for target, score, meta_id in self._adjacency.row(node)
+        ]
+
+    def _get_inbound(self, semantic_id: str) -> Iterable[Tuple[str, float, Dict]]:
+        target = self._semantic_ids.get(semantic_id)
+        if target is None:
+            return []
+        return [
+            (self._semantic_ids[node], score, self._meta_information[meta_id])
+            for node, score, meta_id in self._adjacency.inbound(target)
+        ]
+
+    def _get_base_semantic_ids(self) -> Iterable[str]:
+        return (
+            self._semantic_ids[node]
+            for node in range(len(self._semantic_ids))
+            if next(self._adjacency.row(node), None) is not None
+        )
+
+    def _to_semantic_match(self, node: int, edge: Row) -> SemanticMatch:
+        target, score, meta_id = edge
+        return SemanticMatch(
+            base_semantic_id=self._semantic_ids[node],
+            match_semantic_id=self._semantic_ids[target],
+            score=score,
+            meta_information=self._meta_information[meta_id]
+        )
+
+    def _maybe_compact(self) -> None:
+        if self._adjacency.num_pending_changes > max(self.COMPACTION_MIN_CHANGES, self._num_matches // 4):
+            self.compact()
@@ -0,0 +1,148 @@
+"""
+Encodes match responses to JSON and parses the responses of trusted remote services, without the model validation of
+FastAPI and pydantic
+
+FastAPI turns a returned :class:`service_model.MatchesList` into a dict, validates it against the response model and
+then encodes the dict to JSON. :class:`MatchEncoder` instead encodes each :class:`model.SemanticMatch` once with its
+pydantic serializer and keeps the encoding as long as the match object is cached, so that answering from the result
+caches only joins bytes.
+
+:func:`parse_matches_list` parses remote responses with the JSON parser of pydantic and, for trusted remote services,
+builds the matches without validating their fields.
+"""
+import json
+import threading
+from typing import Dict, List, Tuple
+
+import pydantic_core
+
+from semantic_matcher import model, service_model
+
+
+class MatchEncoder:
+    """
+    Encodes :class:`service_model.MatchesList`s to JSON, reusing the encodings of the same match objects
+
+    The matches of the local and remote result caches are the same objects in
+    every response that contains them, so their encodings are looked up by
+    object identity. An encoding is kept together with its match, so that the
+    identity cannot be reused by another object while the encoding is cached.
+    This keeps a match alive after the result caches dropped it, but never
+    more than `maxsize` of them: Once `maxsize` encodings are cached, all are
+    dropped, so the encoder holds at most `maxsize` matches and their
+    encodings, whatever the result caches hold.
+
+    The encoding leaves out empty `cut_off_services`, and `truncated` if it is
+    `False`.
+
+    :ivar maxsize: The maximal number of cached encodings
+    :ivar hits: Number of matches whose encoding was cached
+    :ivar misses: Number of matches that were encoded
+    """
+    def __init__(self, maxsize: int = 100000):
+        self.maxsize: int = maxsize
+        self.hits: int = 0
+        self.misses: int = 0
+        # id(match) -> (match, encoding)
+        self._encodings: Dict[int, Tuple[model.SemanticMatch, bytes]] = {}
+        # Guards the counters, the encodings are only changed by single dict operations
+        self._lock = threading.Lock()
+
+    def encode_matches(self, matches: List[model.SemanticMatch]) -> bytes:
+        """
+        Returns the JSON array of `matches`
+        """
+        encodings = self._encodings
+        encoded = []
+        num_misses = 0
+        for match in matches:
+            cached = encodings.get(id(match))
+            if cached is not None and cached[0] is match:
+                encoded.append(cached[1])
+                continue
+            encoding = match.__pydantic_serializer__.to_json(match)
+            num_misses += 1
+            if len(encodings) >= self.maxsize:
+                encodings.clear()
+            encodings[id(match)] = (match, encoding)
+            encoded.append(encoding)
+        with self._lock:
+            self.hits += len(matches) - num_misses
+            self.misses += num_misses
+        return b"[" + b",".join(encoded) + b"]"
+
+    def encode_matches_list(self, matches_list: service_model.MatchesList) -> bytes:
+        encoded = b'{"matches":' + self.encode_matches(matches_list.matches)
+        if matches_list.cut_off_services:
+            encoded += b',"cut_off_services":' + json.dumps(matches_list.cut_off_services).encode()
+        if matches_list.truncated:
+            encoded += b',"truncated":true'
+        return encoded + b"}"
+
+    def encode_matches_list_batch(self, batch: service_model.MatchesListBatch) -> bytes:
+        return b'{"results":[' + b",".join(self.encode_matches_list(result) for result in batch.results) + b"]}"
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Returns the number of cached encodings and the hit and miss counters, like :func:`cache.TTLCache.stats`
+        """
+        with self._lock:
+            return {"size": len(self._encodings), "hits": self.hits, "misses": self.misses}
+
+
+_MATCH_FIELDS = frozenset(model.SemanticMatch.model_fields)
+_new_match = model.SemanticMatch.__new__
+_set_attribute = object.__setattr__
+
+
+def _construct_match(values: Dict) -> model.SemanticMatch:
+    """
+    Builds a :class:`model.SemanticMatch` of parsed JSON `values` without validating the field values, if the
+    `values` have exactly the fields of a match. Otherwise, the `values` are validated.
+
+    This sets all instance attributes of a pydantic model, as `model_construct` does: The field values in
+    `__dict__`, all fields in `__pydantic_fields_set__`, and `None` for `__pydantic_extra__` and
+    `__pydantic_private__`, as :class:`model.SemanticMatch` has neither extra fields nor private attributes.
+    `model_construct` itself is slower than validating, as it looks at every field.
+    """
+    if values.keys() != _MATCH_FIELDS:
+        return model.SemanticMatch.model_validate(values)
+    match = _new_match(model.SemanticMatch)
+    _set_attribute(match, "__dict__", values)
+    _set_attribute(match, "__pydantic_fields_set__", set(_MATCH_FIELDS))
+    _set_attribute(match, "__pydantic_extra__", None)
+    _set_attribute(match, "__pydantic_private__", None)
+    return match
+
+
+def parse_matches_list(text: str, trusted: bool = False) -> service_model.MatchesList:
+    """
+    Parses the JSON of a :class:`service_model.MatchesList`
+
+    :param trusted: If `True`, the fields of the matches are not validated, which is only safe for responses of
+        trusted :class:`service.SemanticMatchingService`s
+    """
+    if not trusted:
+        return service_model.MatchesList.model_validate_json(text)
+    values = pydantic_core.from_json(text)
+    return service_model.MatchesList.model_construct(
+        matches=[_construct_match(match) for match in values["matches"]],
+        cut_off_services=values.get("cut_off_services", []),
+        truncated=values.get("truncated", False)
+    )
+
+
+def parse_matches_list_batch(text: str, trusted: bool = False) -> service_model.MatchesListBatch:
+    """
+    Parses the JSON of a :class:`service_model.MatchesListBatch`, see :func:`~.parse_matches_list`
+    """
+    if not trusted:
+        return service_model.MatchesListBatch.model_validate_json(text)
+    return service_model.MatchesListBatch.model_construct(results=[
+        service_model.MatchesList.model_construct(
+            matches=[_construct_match(match) for match in result["matches"]],
+            cut_off_services=result.get("cut_off_services", []),
+            truncated=result.get("truncated", False)
+        )
+        for result in pydantic_core.from_json(text)["results"]
+    ])
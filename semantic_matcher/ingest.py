@@ -0,0 +1,166 @@
+"""
+Incremental parsing of large sets of matches, so that neither files nor request bodies need to be held in memory
+
+Two formats are supported:
+
+- The JSON format written by :func:`model.AbstractEquivalenceTable.to_file`: `{"matches": {base_semantic_id: [...]}}`
+- NDJSON: One match per line. Files with one of the :data:`NDJSON_SUFFIXES` are read as NDJSON
+"""
+import json
+from typing import Dict, Iterator, List, TextIO
+
+
+NDJSON_SUFFIXES = (".ndjson", ".jsonl")
+CHUNK_SIZE = 1 << 16
+
+
+class LineSplitter:
+    """
+    Splits a stream of byte chunks into lines, keeping only the current, incomplete line in memory
+
+    :ivar max_line_length: Lines longer than this raise a `ValueError`, so that a body without line breaks cannot
+        exhaust the memory
+    """
+    def __init__(self, max_line_length: int = 1 << 20):
+        self.max_line_length: int = max_line_length
+        self._buffer: bytes = b""
+
+    def feed(self, chunk: bytes) -> List[bytes]:
+        """
+        Adds `chunk` and returns the lines it completed, without line breaks
+        """
+        *lines, self._buffer = (self._buffer + chunk).split(b"\n")
+        if len(self._buffer) > self.max_line_length:
+            raise ValueError(f"Line is longer than {self.max_line_length} bytes")
+        return lines
+
+    def close(self) -> List[bytes]:
+        """
+        Returns the last line, if the stream did not end with a line break
+        """
+        line, self._buffer = self._buffer, b""
+        return [line] if line.strip() else []
+
+
+def iter_ndjson(file: TextIO) -> Iterator[Dict]:
+    """
+    Iterates the objects of the NDJSON `file`, skipping empty lines
+    """
+    for line_number, line in enumerate(file, start=1):
+        if line.strip():
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"Invalid JSON in line {line_number}: {e}") from e
+
+
+class _JSONReader:
+    """
+    Decodes the values of a JSON document one by one from a buffer that holds at most a few chunks of the file
+    """
+    _decoder = json.JSONDecoder()
+
+    def __init__(self, file: TextIO, chunk_size: int):
+        self._file: TextIO = file
+        self._chunk_size: int = chunk_size
+        self._buffer: str = ""
+        self._position: int = 0
+
+    def peek(self) -> str:
+        """
+        Returns the next non-whitespace character without consuming it, or `""` at the end of the file
+        """
+        while True:
+            while self._position < len(self._buffer) and self._buffer[self._position].isspace():
+                self._position += 1
+            if self._position < len(self._buffer) or not self._read():
+                return self._buffer[self._position:self._position + 1]
+
+    def expect(self, *characters: str) -> str:
+        character = self.peek()
+        if character == "" or character not in characters:
+            raise ValueError(f"Expected one of {characters} in JSON, found {character!r}")
+        self._position += 1
+        return character
+
+    def decode(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._position)
+            except json.JSONDecodeError:
+                if not self._read():
+                    raise
+                continue
+            # A number may continue in the next chunk
+            if end < len(self._buffer) or not isinstance(value, (int, float)) or not self._read():
+                self._position = end
+                return value
+
+    def _read(self) -> bool:
+        chunk = self._file.read(self._chunk_size)
+        if not chunk:
+            return False
+        self._buffer = self._buffer[self._position:] + chunk
+        self._position = 0
+        return True
+
+
+def iter_json_table(file: TextIO, chunk_size: int = CHUNK_SIZE) -> Iterator[Dict]:
+    """
+    Iterates the matches of an equivalence table in the format of :func:`model.AbstractEquivalenceTable.to_file`
+
+    Other top-level keys than `"matches"` are skipped. As when the whole file is validated at once, a match that is
+    stored under another key than its `base_semantic_id` is yielded as it is, so it is added by its
+    `base_semantic_id`.
+
+    :raises ValueError: If the file is not in this format
+    """
+    reader = _JSONReader(file, chunk_size)
+    reader.expect("{")
+    if reader.peek() == "}":
+        return
+    while True:
+        key = reader.decode()
+        reader.expect(":")
+        if key == "matches":
+            yield from _iter_matches_dict(reader)
+        else:
+            reader.decode()
+        if reader.expect(",", "}") == "}":
+            return
+
+
+def _iter_matches_dict(reader: _JSONReader) -> Iterator[Dict]:
+    reader.expect("{")
+    if reader.peek() == "}":
+        reader.expect("}")
+        return
+    while True:
+        reader.decode()
+        reader.expect(":")
+        reader.expect("[")
+        if reader.peek() == "]":
+            reader.expect("]")
+        else:
+            while True:
+                match = reader.decode()
+                if not isinstance(match, dict):
+                    raise ValueError(f"Expected a match in JSON, found {match!r}")
+                yield match
+                if reader.expect(",", "]") == "]":
+                    break
+        if reader.expect(",", "}") == "}":
+            return
+
+
+def iter_file(filename: str) -> Iterator[Dict]:
+    """
+    Iterates the matches stored in `filename` as dicts, as NDJSON if it has one of the :data:`NDJSON_SUFFIXES`,
+    otherwise as JSON
+    """
+    with open(filename, "r", encoding="utf-8") as file:
+        if filename.endswith(NDJSON_SUFFIXES):
+            yield from iter_ndjson(file)
+        else:
+            yield from iter_json_table(file)
@@ -0,0 +1,278 @@
+"""
+Counters, histograms and gauges of the semantic matcher, rendered in the Prometheus text exposition format
+
+The metrics of the hot paths are module level objects, e.g. :data:`TRAVERSAL_NODES_EXPANDED`, which add up over all
+services of a process. Recording a value takes a lock and a dict update, so metrics are always on.
+
+:func:`stage` times one stage of a request, e.g. the local matching, into :data:`STAGE_SECONDS`. If the request is
+traced with a :class:`Trace`, the stage durations are also added to the trace, which the service can return in a
+`Server-Timing` header.
+"""
+import bisect
+import contextlib
+import contextvars
+import math
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, TypeVar
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+def _format_labels(label_names: Sequence[str], label_values: Sequence[str]) -> str:
+    if not label_names:
+        return ""
+    labels = ",".join(
+        '{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'))
+        for name, value in zip(label_names, label_values)
+    )
+    return "{" + labels + "}"
+
+
+class _Metric:
+    TYPE: str = ""
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        self.name: str = name
+        self.documentation: str = documentation
+        self.label_names: Tuple[str, ...] = tuple(label_names)
+        self._lock = threading.Lock()
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.TYPE}"]
+        lines.extend(self._samples())
+        return "\n".join(lines) + "\n"
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """
+    A value that only increases, per combination of label values
+    """
+    TYPE = "counter"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        super().__init__(name, documentation, label_names)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1., *label_values: str) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0.) + amount
+
+    def set_total(self, value: float, *label_values: str) -> None:
+        """
+        Sets the counter to a count that is kept elsewhere, e.g. by a cache, right before the metrics are rendered.
+        The count must only increase
+        """
+        with self._lock:
+            self._values[label_values] = value
+
+    def get(self, *label_values: str) -> float:
+        return self._values.get(label_values, 0.)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return [
+            f"{self.name}{_format_labels(self.label_names, label_values)} {_format_value(value)}"
+            for label_values, value in values
+        ]
+
+
+class Gauge(_Metric):
+    """
+    A value that is set, e.g. right before the metrics are rendered
+    """
+    TYPE = "gauge"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        super().__init__(name, documentation, label_names)
+        self._values: Dict[LabelValues, float] = {}
+
+    def set(self, value: float, *label_values: str) -> None:
+        with self._lock:
+            self._values[label_values] = value
+
+    def get(self, *label_values: str) -> float:
+        return self._values.get(label_values, 0.)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return [
+            f"{self.name}{_format_labels(self.label_names, label_values)} {_format_value(value)}"
+            for label_values, value in values
+        ]
+
+
+class Histogram(_Metric):
+    """
+    The distribution of observed values in cumulative buckets, per combination of label values
+
+    :ivar buckets: The upper bounds of the buckets, in ascending order
+    """
+    TYPE = "histogram"
+    DEFAULT_BUCKETS: Tuple[float, ...] = (
+        .0001, .00025, .0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1., 2.5, 5., 10.
+    )
+
+    def __init__(
+            self,
+            name: str,
+            documentation: str,
+            label_names: Sequence[str] = (),
+            buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, documentation, label_names)
+        self.buckets: Tuple[float, ...] = tuple(buckets)
+        # Label values -> (Count per bucket, the last one for values above all buckets, sum)
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, *label_values: str) -> None:
+        bucket = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(label_values, (None, None))
+            if counts is None:
+                counts, total = [0] * (len(self.buckets) + 1), [0.]
+                self._values[label_values] = (counts, total)
+            counts[bucket] += 1
+            total[0] += value
+
+    def get_count(self, *label_values: str) -> int:
+        counts, _ = self._values.get(label_values, ([], None))
+        return sum(counts)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = [(label_values, list(counts), total[0]) for label_values, (counts, total) in self._values.items()]
+        samples = []
+        for label_values, counts, total in values:
+            cumulative = 0
+            for upper_bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                samples.append("{}_bucket{} {}".format(
+                    self.name,
+                    _format_labels(self.label_names + ("le",), label_values + (_format_value(upper_bound),)),
+                    cumulative
+                ))
+            labels = _format_labels(self.label_names, label_values)
+            samples.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            samples.append(f"{self.name}_count{labels} {cumulative}")
+        return samples
+
+
+M = TypeVar("M", bound=_Metric)
+
+
+class Registry:
+    """
+    The metrics that are rendered together
+    """
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: M) -> M:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "".join(metric.render() for metric in self._metrics)
+
+
+REGISTRY = Registry()
+
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "semantic_matcher_request_seconds",
+    "Time from receiving a request until its response is ready, including parsing and serialization",
+    ("route",)
+))
+REQUEST_ERRORS = REGISTRY.register(Counter(
+    "semantic_matcher_request_errors_total",
+    "Requests that failed with an unexpected error or a status code of 500 or above",
+    ("route",)
+))
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "semantic_matcher_stage_seconds",
+    "Time spent in each stage of answering match requests",
+    ("stage",)
+))
+TRAVERSAL_NODES_EXPANDED = REGISTRY.register(Counter(
+    "semantic_matcher_traversal_nodes_expanded_total",
+    "Semantic IDs whose matches were followed during local matching"
+))
+TRAVERSAL_EDGES_SCANNED = REGISTRY.register(Counter(
+    "semantic_matcher_traversal_edges_scanned_total",
+    "Matches looked at during local matching"
+))
+REMOTE_REQUESTS = REGISTRY.register(Counter(
+    "semantic_matcher_remote_requests_total",
+    "Requests to remote semantic matching services by outcome",
+    ("outcome",)
+))
+RESOLVER_REQUESTS = REGISTRY.register(Counter(
+    "semantic_matcher_resolver_requests_total",
+    "Requests to the resolver by outcome, cached answers are not counted",
+    ("outcome",)
+))
+
+
+class Trace:
+    """
+    The durations of the stages of one request, in seconds
+    """
+    def __init__(self):
+        self.stages: Dict[str, float] = {}
+
+    def server_timing(self, total: Optional[float] = None) -> str:
+        """
+        Returns the stage durations as value of a `Server-Timing` header, in milliseconds
+        """
+        stages = dict(self.stages)
+        if total is not None:
+            stages["total"] = total
+        return ", ".join(f"{name};dur={duration * 1000.:.3f}" for name, duration in stages.items())
+
+
+_current_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("trace", default=None)
+
+
+@contextlib.contextmanager
+def trace() -> Iterator[Trace]:
+    """
+    Collects the durations of all stages of the current context, e.g. of one request, in a :class:`~.Trace`
+
+    Threads that are started with a copy of the context, like the ones of `run_in_threadpool`, add to the same trace.
+    """
+    current = Trace()
+    token = _current_trace.set(current)
+    try:
+        yield current
+    finally:
+        _current_trace.reset(token)
+
+
+@contextlib.contextmanager
+def stage(name: str) -> Iterator[None]:
+    """
+    Times the enclosed code as stage `name` into :data:`STAGE_SECONDS` and the current :class:`~.Trace`
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - start
+        STAGE_SECONDS.observe(duration, name)
+        current = _current_trace.get()
+        if current is not None:
+            current.stages[name] = current.stages.get(name, 0.) + duration
@@ -1,6 +1,12 @@
-from typing import Dict, List
+import abc
+import enum
+import itertools
+import json
+from typing import Any, ClassVar, Dict, Iterable, Iterator, List, Optional, Tuple
 
-from pydantic import BaseModel
+from pydantic import BaseModel, PrivateAttr
+
+from semantic_matcher import closure, ingest, traversal
 
 
 class SemanticMatch(BaseModel):
@@ -17,53 +23,478 @@ class SemanticMatch(BaseModel):
     meta_information: Dict
 
 
-class EquivalenceTable(BaseModel):
-    matches: Dict[str, List[SemanticMatch]]
+class DuplicateMatchError(ValueError):
+    """
+    Raised when a :class:`~.SemanticMatch` is added with :attr:`~.UpdatePolicy.REJECT`, but the table already
+    contains a different match between the same two semantic IDs
+    """
+    pass
+
+
+class UpdatePolicy(str, enum.Enum):
+    """
+    Decides what happens if a :class:`~.SemanticMatch` is added to an equivalence table that already contains a
+    match between the same `base_semantic_id` and `match_semantic_id`
+
+    :cvar REPLACE: The new match replaces the existing one
+    :cvar KEEP_MAX: The match with the higher score is kept
+    :cvar REJECT: A :class:`~.DuplicateMatchError` is raised, unless both matches are equal
+    """
+    REPLACE = "replace"
+    KEEP_MAX = "keep_max"
+    REJECT = "reject"
+
+    def replaces(self, existing: SemanticMatch, match: SemanticMatch) -> bool:
+        """
+        Returns `True` if `match` should replace the `existing` match
+        """
+        if existing == match:
+            return False
+        if self is UpdatePolicy.KEEP_MAX:
+            return match.score > existing.score
+        if self is UpdatePolicy.REJECT:
+            raise DuplicateMatchError(
+                f"A different match from {match.base_semantic_id} to {match.match_semantic_id} already exists"
+            )
+        return True
+
+
+class Direction(str, enum.Enum):
+    """
+    Which stored matches are followed when matching a semantic ID
+
+    :cvar OUTBOUND: The matches whose `base_semantic_id` is the semantic ID
+    :cvar INBOUND: The matches whose `match_semantic_id` is the semantic ID, followed backwards
+    :cvar BOTH: Both, as if every match was symmetric
+    """
+    OUTBOUND = "outbound"
+    INBOUND = "inbound"
+    BOTH = "both"
+
+
+class AbstractEquivalenceTable(abc.ABC):
+    """
+    The operations that every storage backend of an equivalence table offers.
+
+    Backends store at most one match per pair of `base_semantic_id` and `match_semantic_id`, which can be found,
+    added and removed in amortized constant time. They expose the outgoing matches of a semantic ID via
+    :func:`~.AbstractEquivalenceTable._get_neighbours` and the incoming ones via
+    :func:`~.AbstractEquivalenceTable._get_inbound`, both without scanning the table. The transitive matching and
+    the optional :class:`closure.ClosureIndex` are shared between all backends.
+
+    Every change of the stored matches increases the :attr:`~.AbstractEquivalenceTable.version` of the table.
+
+    Reads never need a lock, but they do not work on a snapshot of the table either: Backends change the stored
+    matches in place, and every change of a single match takes effect with one list, dict or set operation, which is
+    atomic under the GIL of CPython. Readers copy a dict or set before iterating it, so a read that runs concurrently
+    with changes does not raise and sees each match either before or after its change. It may however see only some
+    of the changes of a batch, e.g. a transitive search can find the first of two matches added together, but not the
+    second one. Changes need to be serialized by the caller, e.g. by a :class:`wal.MutationLog`.
+
+    Backends need to initialize `self._closure_index` to `None` and `self._version` to `0`.
+    """
+    @abc.abstractmethod
+    def add_semantic_match(self, match: SemanticMatch, update_policy: UpdatePolicy = UpdatePolicy.REPLACE) -> bool:
+        """
+        Adds `match` to the table
+
+        :param update_policy: What to do if the table already contains a match between the same semantic IDs
+        :returns: `True` if the table changed
+        :raises DuplicateMatchError: If `update_policy` is :attr:`~.UpdatePolicy.REJECT` and a different match
+            between the same semantic IDs exists
+        """
+        pass
+
+    @abc.abstractmethod
+    def remove_semantic_match(self, match: SemanticMatch) -> bool:
+        """
+        Removes the match between `match.base_semantic_id` and `match.match_semantic_id` from the table
+
+        :returns: `True` if the table contained such a match
+        """
+        pass
+
+    @abc.abstractmethod
+    def get_semantic_match(self, base_semantic_id: str, match_semantic_id: str) -> Optional[SemanticMatch]:
+        """
+        Returns the stored match between the two semantic IDs, if there is one
+        """
+        pass
+
+    @abc.abstractmethod
+    def remove_all_semantic_matches(self) -> None:
+        pass
+
+    @abc.abstractmethod
+    def get_all_matches(self) -> Dict[str, List[SemanticMatch]]:
+        pass
+
+    @abc.abstractmethod
+    def to_file(self, filename: str) -> None:
+        pass
+
+    @classmethod
+    @abc.abstractmethod
+    def from_file(cls, filename: str) -> "AbstractEquivalenceTable":
+        pass
+
+    @abc.abstractmethod
+    def stats(self) -> Dict[str, int]:
+        """
+        Returns the number of stored `"matches"` and the `"approximate_bytes"` of memory the table uses, both
+        without scanning the table
+        """
+        pass
+
+    @abc.abstractmethod
+    def _get_neighbours(self, semantic_id: str) -> Iterable[Tuple[str, float, Dict]]:
+        """
+        Returns the outgoing matches of `semantic_id` as `(match_semantic_id, score, meta_information)` tuples
+        """
+        pass
+
+    @abc.abstractmethod
+    def _get_inbound(self, semantic_id: str) -> Iterable[Tuple[str, float, Dict]]:
+        """
+        Returns the incoming matches of `semantic_id` as `(base_semantic_id, score, meta_information)` tuples
+        """
+        pass
+
+    @abc.abstractmethod
+    def _get_base_semantic_ids(self) -> Iterable[str]:
+        pass
+
+    @property
+    def version(self) -> int:
+        """
+        A counter that is increased by every change of the stored matches
+        """
+        return self._version
 
-    def add_semantic_match(self, match: SemanticMatch) -> None:
-        if self.matches.get(match.base_semantic_id) is not None:
-            if match not in self.matches[match.base_semantic_id]:
-                self.matches[match.base_semantic_id].append(match)
+    def add_semantic_matches(
+            self,
+            matches: Iterable[SemanticMatch],
+            update_policy: UpdatePolicy = UpdatePolicy.REPLACE
+    ) -> List[SemanticMatch]:
+        """
+        Adds all `matches` to the table. With :attr:`~.UpdatePolicy.REJECT`, all matches are checked before the first
+        one is added, so either all or none of them are added.
+
+        :returns: The matches that changed the table
+        :raises DuplicateMatchError: If `update_policy` is :attr:`~.UpdatePolicy.REJECT` and one of the matches
+            conflicts with the table or with another one of the `matches`
+        """
+        matches = list(matches)
+        if update_policy is UpdatePolicy.REJECT:
+            batch: Dict[Tuple[str, str], SemanticMatch] = {}
+            for match in matches:
+                key = (match.base_semantic_id, match.match_semantic_id)
+                existing = batch.get(key)
+                if existing is None:
+                    existing = self.get_semantic_match(*key)
+                if existing is not None:
+                    update_policy.replaces(existing, match)
+                batch[key] = match
+        return [match for match in matches if self.add_semantic_match(match, update_policy)]
+
+    def remove_semantic_matches_of(self, semantic_id: str) -> List[SemanticMatch]:
+        """
+        Removes all matches from and to `semantic_id`, e.g. when retiring it
+
+        :returns: The removed matches
+        """
+        matches = [
+            SemanticMatch(
+                base_semantic_id=semantic_id,
+                match_semantic_id=match_semantic_id,
+                score=score,
+                meta_information=meta_information
+            )
+            for match_semantic_id, score, meta_information in list(self._get_neighbours(semantic_id))
+        ] + [
+            SemanticMatch(
+                base_semantic_id=base_semantic_id,
+                match_semantic_id=semantic_id,
+                score=score,
+                meta_information=meta_information
+            )
+            for base_semantic_id, score, meta_information in list(self._get_inbound(semantic_id))
+        ]
+        return [match for match in matches if self.remove_semantic_match(match)]
+
+    def iter_semantic_matches(
+            self,
+            position: Tuple[int, int] = (0, 0),
+            prefix: Optional[str] = None
+    ) -> Iterator[Tuple[Tuple[int, int], SemanticMatch]]:
+        """
+        Iterates the stored matches without building them all at once
+
+        Each match is yielded together with the position after it, from which a
+        later iteration can continue. Changes to the table during the iteration
+        do not break it, but matches may be skipped or repeated.
+
+        :param position: The position to start at, `(0, 0)` is the first match
+        :param prefix: If given, only matches whose `base_semantic_id` starts with `prefix` are iterated
+        """
+        while True:
+            try:
+                for position, match in self._iter_semantic_matches_from(position, prefix):
+                    yield position, match
+                return
+            except RuntimeError:
+                # The base semantic IDs changed during the iteration, continue at the last position
+                continue
+
+    def _iter_semantic_matches_from(
+            self,
+            position: Tuple[int, int],
+            prefix: Optional[str]
+    ) -> Iterator[Tuple[Tuple[int, int], SemanticMatch]]:
+        base_index, row_index = position
+        base_semantic_ids = itertools.islice(self._get_base_semantic_ids(), base_index, None)
+        for base_index, base_semantic_id in enumerate(base_semantic_ids, start=base_index):
+            if prefix is None or base_semantic_id.startswith(prefix):
+                row = itertools.islice(self._get_neighbours(base_semantic_id), row_index, None)
+                for row_index, (match_semantic_id, score, meta_information) in enumerate(row, start=row_index + 1):
+                    yield (base_index, row_index), SemanticMatch(
+                        base_semantic_id=base_semantic_id,
+                        match_semantic_id=match_semantic_id,
+                        score=score,
+                        meta_information=meta_information
+                    )
+            row_index = 0
+
+    def enable_closure_index(self, floor_score: float, precompute: bool = False) -> None:
+        """
+        Answers :func:`~.AbstractEquivalenceTable.get_local_matches` with a `score_limit` of at least `floor_score`
+        from a :class:`closure.ClosureIndex`, which is kept up to date when matches are added or removed.
+
+        :param floor_score: The lowest `score_limit` that is answered from the index
+        :param precompute: If `True`, the closures of all base semantic IDs are computed right away, otherwise they
+            are computed on their first lookup
+        """
+        self._closure_index = closure.ClosureIndex(self._get_neighbours, floor_score)
+        if precompute:
+            self._closure_index.build(list(self._get_base_semantic_ids()))
+
+    def disable_closure_index(self) -> None:
+        self._closure_index = None
+
+    def get_local_matches(
+            self,
+            semantic_id: str,
+            score_limit: float,
+            direction: Direction = Direction.OUTBOUND,
+            max_results: Optional[int] = None
+    ) -> List[SemanticMatch]:
+        """
+        Returns the best transitive match from `semantic_id` to every semantic ID that is reachable with a score
+        above `score_limit`, ordered by descending score.
+
+        The returned :class:`~.SemanticMatch`es are new objects, the matches stored in the table are never
+        modified. Intermediate semantic IDs of transitive matches are listed in `meta_information["path"]`.
+        Their `base_semantic_id` is always `semantic_id`, also if matches were followed backwards.
+
+        :param direction: Which stored matches are followed, only :attr:`~.Direction.OUTBOUND` uses the
+            :class:`closure.ClosureIndex`
+        :param max_results: If given, only the best `max_results` matches are returned and the traversal stops as
+            soon as no other path can be among them
+        """
+        results: Optional[Iterable[traversal.PathResult]] = None
+        if direction is Direction.OUTBOUND:
+            if self._closure_index is not None:
+                results = self._closure_index.lookup(semantic_id, score_limit)
+                if results is not None and max_results is not None:
+                    results = results[:max_results]
+            if results is None:
+                results = traversal.best_first_paths(semantic_id, self._get_neighbours, score_limit, max_results)
+        elif direction is Direction.INBOUND:
+            results = traversal.best_first_paths(semantic_id, self._get_inbound, score_limit, max_results)
+        else:
+            results = traversal.best_first_paths(
+                semantic_id,
+                lambda node: itertools.chain(self._get_neighbours(node), self._get_inbound(node)),
+                score_limit,
+                max_results
+            )
+        matching_result = []
+        for result in results:
+            meta_information = dict(result.meta_information)
+            if result.path:
+                meta_information["path"] = list(result.path) + meta_information.get("path", [])
+            matching_result.append(SemanticMatch(
+                base_semantic_id=semantic_id,
+                match_semantic_id=result.target,
+                score=result.score,
+                meta_information=meta_information
+            ))
+        return matching_result
+
+    def _invalidate(self, semantic_id: str) -> None:
+        """
+        Needs to be called whenever the outgoing matches of `semantic_id` change
+        """
+        self._version += 1
+        if self._closure_index is not None:
+            self._closure_index.invalidate(semantic_id)
+
+    def _invalidate_all(self) -> None:
+        self._version += 1
+        if self._closure_index is not None:
+            self._closure_index.clear()
+
+
+class EquivalenceTable(BaseModel, AbstractEquivalenceTable):
+    """
+    The storage backend of an equivalence table as dict of each `base_semantic_id` to its matches
+
+    New matches are appended to their row in `matches` and replaced matches are overwritten. Removed matches are
+    overwritten with `None`, so that no other match of the row moves, and the row is rebuilt without them once they
+    are the majority of the row. :func:`~.EquivalenceTable.get_all_matches` returns the rows without them.
+
+    :cvar MATCH_OVERHEAD: Rough memory of a stored match and its index entries, without its strings, in bytes
+    """
+    MATCH_OVERHEAD: ClassVar[int] = 1000
+
+    matches: Dict[str, List[Optional[SemanticMatch]]]
+    _closure_index: Optional[closure.ClosureIndex] = PrivateAttr(default=None)
+    _version: int = PrivateAttr(default=0)
+    # (base_semantic_id, match_semantic_id) -> Position of the match in `matches[base_semantic_id]`
+    _positions: Dict[Tuple[str, str], int] = PrivateAttr(default_factory=dict)
+    # match_semantic_id -> base_semantic_id -> Match
+    _inbound: Dict[str, Dict[str, SemanticMatch]] = PrivateAttr(default_factory=dict)
+    # base_semantic_id -> Number of `None` in `matches[base_semantic_id]`
+    _num_removed: Dict[str, int] = PrivateAttr(default_factory=dict)
+
+    def model_post_init(self, __context: Any) -> None:
+        # Build the `_positions` index, this also drops duplicate matches between the same semantic IDs
+        matches = [match for row in self.matches.values() for match in row if match is not None]
+        self.matches.clear()
+        for match in matches:
+            self.add_semantic_match(match)
+
+    def add_semantic_match(self, match: SemanticMatch, update_policy: UpdatePolicy = UpdatePolicy.REPLACE) -> bool:
+        key = (match.base_semantic_id, match.match_semantic_id)
+        position = self._positions.get(key)
+        if position is None:
+            row = self.matches.get(match.base_semantic_id)
+            if row is None:
+                self._positions[key] = 0
+                self.matches[match.base_semantic_id] = [match]
+            else:
+                self._positions[key] = len(row)
+                row.append(match)
+        else:
+            row = self.matches[match.base_semantic_id]
+            if not update_policy.replaces(row[position], match):
+                return False
+            row[position] = match
+        self._inbound.setdefault(match.match_semantic_id, {})[match.base_semantic_id] = match
+        self._invalidate(match.base_semantic_id)
+        return True
+
+    def remove_semantic_match(self, match: SemanticMatch) -> bool:
+        base_semantic_id = match.base_semantic_id
+        position = self._positions.pop((base_semantic_id, match.match_semantic_id), None)
+        if position is None:
+            return False
+        row = self.matches[base_semantic_id]
+        if position == len(row) - 1:
+            row.pop()
         else:
-            self.matches[match.base_semantic_id] = [match]
+            row[position] = None
+            self._num_removed[base_semantic_id] = self._num_removed.get(base_semantic_id, 0) + 1
+        while row and row[-1] is None:
+            row.pop()
+            self._num_removed[base_semantic_id] -= 1
+        if not row:
+            del self.matches[base_semantic_id]
+            self._num_removed.pop(base_semantic_id, None)
+        elif self._num_removed.get(base_semantic_id, 0) * 2 > len(row):
+            self._rebuild_row(base_semantic_id)
+        inbound = self._inbound[match.match_semantic_id]
+        del inbound[base_semantic_id]
+        if not inbound:
+            del self._inbound[match.match_semantic_id]
+        self._invalidate(base_semantic_id)
+        return True
 
-    def remove_semantic_match(self, match: SemanticMatch) -> None:
-        if self.matches.get(match.base_semantic_id) is not None:
-            self.matches.get(match.base_semantic_id).remove(match)
-            if len(self.matches.get(match.base_semantic_id)) == 0:
-                self.matches.pop(match.base_semantic_id)
+    def get_semantic_match(self, base_semantic_id: str, match_semantic_id: str) -> Optional[SemanticMatch]:
+        row = self.matches.get(base_semantic_id, [])
+        position = self._positions.get((base_semantic_id, match_semantic_id))
+        if position is None:
+            return None
+        match = row[position] if position < len(row) else None
+        if match is not None and match.match_semantic_id == match_semantic_id:
+            return match
+        # The row was rebuilt concurrently between reading it and the position
+        return next(
+            (match for match in row if match is not None and match.match_semantic_id == match_semantic_id),
+            None
+        )
 
     def remove_all_semantic_matches(self):
         self.matches.clear()
+        self._positions.clear()
+        self._inbound.clear()
+        self._num_removed.clear()
+        self._invalidate_all()
 
-    def get_local_matches(self, semantic_id: str, score_limit: float) -> List[SemanticMatch]:
-        equivalence_table_result = self.matches.get(semantic_id)
-        if equivalence_table_result is None:
-            return []
-        matching_result = []
-        for match in equivalence_table_result:
-            if match.score > score_limit:
-                matching_result.append(match)
-                rec_result = self.get_local_matches(match.match_semantic_id, score_limit/match.score)
-                for rec_match in rec_result:
-                    rec_match.base_semantic_id = match.base_semantic_id
-                    rec_match.score *= match.score
-                    if "path" not in rec_match.meta_information:
-                        rec_match.meta_information["path"] = []
-                    rec_match.meta_information["path"].insert(0, match.match_semantic_id)
-                if rec_result is not None:
-                    matching_result += rec_result
-        return matching_result
+    def _rebuild_row(self, base_semantic_id: str) -> None:
+        """
+        Replaces the row of `base_semantic_id` by a copy without removed matches. This costs time linear in the length
+        of the row, but happens at most once per as many removals from it
+        """
+        row = [match for match in self.matches[base_semantic_id] if match is not None]
+        for position, match in enumerate(row):
+            self._positions[(base_semantic_id, match.match_semantic_id)] = position
+        self.matches[base_semantic_id] = row
+        del self._num_removed[base_semantic_id]
+
+    def stats(self) -> Dict[str, int]:
+        # `_positions` has one entry per match
+        num_matches = len(self._positions)
+        return {"matches": num_matches, "approximate_bytes": num_matches * self.MATCH_OVERHEAD}
+
+    def _get_neighbours(self, semantic_id: str) -> Iterable[Tuple[str, float, Dict]]:
+        return [
+            (match.match_semantic_id, match.score, match.meta_information)
+            for match in self.matches.get(semantic_id, ())
+            if match is not None
+        ]
+
+    def _get_inbound(self, semantic_id: str) -> Iterable[Tuple[str, float, Dict]]:
+        return [
+            (match.base_semantic_id, match.score, match.meta_information)
+            # Copying the values first cannot be interrupted by a concurrent change
+            for match in list(self._inbound.get(semantic_id, {}).values())
+        ]
+
+    def _get_base_semantic_ids(self) -> Iterable[str]:
+        return self.matches.keys()
 
-    def get_all_matches(self) -> List[SemanticMatch]:
-        return self.matches
+    def get_all_matches(self) -> Dict[str, List[SemanticMatch]]:
+        return {
+            base_semantic_id: [match for match in row if match is not None]
+            for base_semantic_id, row in list(self.matches.items())
+        }
 
     def to_file(self, filename: str) -> None:
         with open(filename, "w") as file:
-            file.write(self.model_dump_json(indent=4))
+            matches = {
+                base_semantic_id: [match.model_dump() for match in row]
+                for base_semantic_id, row in self.get_all_matches().items()
+            }
+            json.dump({"matches": matches}, file, indent=4)
 
     @classmethod
     def from_file(cls, filename: str) -> "EquivalenceTable":
-        with open(filename, "r") as file:
-            return EquivalenceTable.model_validate_json(file.read())
+        """
+        Reads the table from a JSON or NDJSON file, see :func:`ingest.iter_file`. The file is parsed incrementally
+        """
+        table = cls(matches={})
+        for match in ingest.iter_file(filename):
+            table.add_semantic_match(SemanticMatch.model_validate(match))
+        return table
 
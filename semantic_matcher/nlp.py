@@ -0,0 +1,288 @@
+"""
+A CPU-only fallback matcher, that finds known semantic IDs whose name and definition are similar to those of a request
+
+Texts are compared as character n-gram TF-IDF vectors by their cosine similarity.
+"""
+import math
+import re
+import threading
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from semantic_matcher import ingest
+
+
+METHOD = "char_ngram_tfidf"
+
+
+def description_text(name: Optional[str], definition: Optional[str]) -> str:
+    """
+    Returns the text of a semantic ID that is compared, from its `name` and `definition`
+    """
+    return " ".join(part for part in (name, definition) if part)
+
+
+def count_ngrams(text: str, n: int) -> Dict[str, int]:
+    """
+    Counts the character `n`-grams of the lower case `text`, with whitespace collapsed and padded, so that the
+    beginning and end of words form their own n-grams
+    """
+    text = " " + re.sub(r"\s+", " ", text.lower()).strip() + " "
+    counts: Dict[str, int] = {}
+    for start in range(len(text) - n + 1):
+        ngram = text[start:start + n]
+        counts[ngram] = counts.get(ngram, 0) + 1
+    return counts
+
+
+class _Matrix(NamedTuple):
+    """
+    The L2-normalized TF-IDF vectors of the indexed texts, stored per n-gram: The rows of the texts containing the
+    n-gram with the feature `f` and their weights are `rows[offsets[f]:offsets[f+1]]` and
+    `weights[offsets[f]:offsets[f+1]]`
+    """
+    semantic_ids: List[str]
+    vocabulary: Dict[str, int]
+    idf: np.ndarray
+    offsets: np.ndarray
+    rows: np.ndarray
+    weights: np.ndarray
+
+
+class NgramIndex:
+    """
+    An index of the character n-gram TF-IDF vectors of the names and definitions of known semantic IDs
+
+    The vectors of all texts form a sparse matrix. A query multiplies it with
+    its own vector by adding up the columns of its n-grams, so the cost of a
+    query depends on how many texts share its n-grams, not on the number of
+    indexed texts. N-grams that occur in more than `max_column_length` texts
+    carry little information and are left out of the matrix to bound this
+    cost.
+
+    Texts added after :func:`~.NgramIndex.build` are kept in a small list,
+    which is compared with every query directly, until
+    `REBUILD_MIN_CHANGES` of them trigger the next rebuild in a background
+    thread.
+
+    :ivar n: The length of the n-grams
+    :ivar max_column_length: The maximal number of texts an n-gram can occur in
+    :cvar REBUILD_MIN_CHANGES: The number of added texts after which the matrix is rebuilt
+    :cvar DENSE_SCAN_RATIO: A query whose n-grams occur fewer times than the number of texts divided by this ratio
+        only reads and resets the scores of the texts it shares an n-gram with, otherwise it scans all scores
+    """
+    REBUILD_MIN_CHANGES: int = 1024
+    DENSE_SCAN_RATIO: int = 32
+
+    def __init__(self, n: int = 3, max_column_length: int = 50000):
+        self.n: int = n
+        self.max_column_length: int = max_column_length
+        self._texts: Dict[str, str] = {}
+        self._matrix: _Matrix = self._build_matrix({})
+        # Rows of the matrix whose semantic ID was added again since, replaced instead of changed, so that queries
+        # can use it without copying
+        self._stale: np.ndarray = np.zeros(0, dtype=np.int64)
+        self._row_of: Dict[str, int] = {}
+        # Semantic ID -> Vector of the texts added since the last build
+        self._pending: Dict[str, Dict[str, float]] = {}
+        self._rebuild_thread: Optional[threading.Thread] = None
+        # The score buffer of each querying thread
+        self._buffers = threading.local()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_file(cls, filename: str, n: int = 3, max_column_length: int = 50000) -> "NgramIndex":
+        """
+        Builds the index from an NDJSON file with one `{"semantic_id": ..., "name": ..., "definition": ...}` object
+        per line
+        """
+        index = cls(n=n, max_column_length=max_column_length)
+        texts: Dict[str, str] = {}
+        with open(filename, "r", encoding="utf-8") as file:
+            for description in ingest.iter_ndjson(file):
+                texts[description["semantic_id"]] = description_text(
+                    description.get("name"),
+                    description.get("definition")
+                )
+        index.build(texts)
+        return index
+
+    def build(self, texts: Dict[str, str]) -> None:
+        """
+        Replaces the indexed texts by `texts`, a dict of semantic IDs to their text
+        """
+        matrix = self._build_matrix(texts)
+        with self._lock:
+            self._texts = dict(texts)
+            self._install(matrix)
+
+    def add(self, semantic_id: str, text: str) -> None:
+        """
+        Adds or replaces the text of `semantic_id`
+
+        Once `REBUILD_MIN_CHANGES` texts were added, the matrix is rebuilt in a background thread, queries keep using
+        the current matrix until the new one is swapped in.
+        """
+        with self._lock:
+            self._texts[semantic_id] = text
+            row = self._row_of.get(semantic_id)
+            if row is not None:
+                self._stale = np.append(self._stale, row)
+            self._pending[semantic_id] = self._vectorize(self._matrix, text)
+            rebuild = len(self._pending) >= self.REBUILD_MIN_CHANGES and self._rebuild_thread is None
+            if rebuild:
+                self._rebuild_thread = threading.Thread(
+                    target=self._rebuild_in_background,
+                    name="nlp_index_rebuild",
+                    daemon=True
+                )
+        if rebuild:
+            self._rebuild_thread.start()
+
+    def rebuild(self) -> None:
+        """
+        Rebuilds the matrix, including all texts added since the last build
+        """
+        with self._lock:
+            texts = dict(self._texts)
+        matrix = self._build_matrix(texts)
+        with self._lock:
+            # Texts added while building stay pending
+            pending = {
+                semantic_id: self._vectorize(matrix, text)
+                for semantic_id, text in self._texts.items()
+                if texts.get(semantic_id) != text
+            }
+            self._install(matrix)
+            self._pending = pending
+            self._stale = np.array(
+                [self._row_of[semantic_id] for semantic_id in pending if semantic_id in self._row_of],
+                dtype=np.int64
+            )
+
+    def query(self, text: str, score_limit: float, max_results: int) -> List[Tuple[str, float]]:
+        """
+        Returns the `max_results` indexed semantic IDs whose text is most similar to `text`, if their cosine
+        similarity is above `score_limit`, as `(semantic_id, similarity)` tuples ordered by descending similarity
+        """
+        return self.query_batch([text], score_limit, max_results)[0]
+
+    def query_batch(self, texts: Iterable[str], score_limit: float, max_results: int) -> List[List[Tuple[str, float]]]:
+        """
+        Answers :func:`~.NgramIndex.query` for all `texts`
+        """
+        with self._lock:
+            matrix, stale, pending = self._matrix, self._stale, list(self._pending.items())
+        results = []
+        for text in texts:
+            vector = self._vectorize(matrix, text)
+            # Only the rows of the texts that share an n-gram with `text` get a score
+            scores = self._score_buffer(matrix)
+            row_parts = []
+            for ngram, weight in vector.items():
+                feature = matrix.vocabulary.get(ngram)
+                if feature is not None:
+                    start, end = matrix.offsets[feature], matrix.offsets[feature + 1]
+                    rows = matrix.rows[start:end]
+                    scores[rows] += weight * matrix.weights[start:end]
+                    row_parts.append(rows)
+            num_scored = sum(len(rows) for rows in row_parts)
+            if num_scored * self.DENSE_SCAN_RATIO < len(scores):
+                # Finding and resetting the scored rows is cheaper than scanning the whole buffer
+                rows = np.concatenate(row_parts) if row_parts else np.zeros(0, dtype=np.int32)
+                candidates = np.unique(rows[scores[rows] > score_limit])
+            else:
+                rows = None
+                candidates = np.flatnonzero(scores > score_limit)
+            candidates = candidates[~np.isin(candidates, stale)]
+            if len(candidates) > max_results:
+                candidates = candidates[np.argpartition(-scores[candidates], max_results - 1)[:max_results]]
+            # Rounding errors can make the similarity of identical texts slightly larger than 1.
+            result = [(matrix.semantic_ids[row], min(float(scores[row]), 1.)) for row in candidates]
+            if rows is None:
+                scores.fill(0.)
+            else:
+                scores[rows] = 0.
+            for semantic_id, pending_vector in pending:
+                similarity = sum(weight * pending_vector.get(ngram, 0.) for ngram, weight in vector.items())
+                if similarity > score_limit:
+                    result.append((semantic_id, min(similarity, 1.)))
+            result.sort(key=lambda item: item[1], reverse=True)
+            results.append(result[:max_results])
+        return results
+
+    def __len__(self) -> int:
+        return len(self._texts)
+
+    def _score_buffer(self, matrix: _Matrix) -> np.ndarray:
+        """
+        Returns the zeroed score buffer of the current thread for `matrix`, which is only allocated once per matrix
+        """
+        if getattr(self._buffers, "matrix", None) is not matrix:
+            self._buffers.matrix = matrix
+            self._buffers.scores = np.zeros(len(matrix.semantic_ids), dtype=np.float32)
+        return self._buffers.scores
+
+    def _rebuild_in_background(self) -> None:
+        try:
+            self.rebuild()
+        finally:
+            with self._lock:
+                self._rebuild_thread = None
+
+    def _install(self, matrix: _Matrix) -> None:
+        self._matrix = matrix
+        self._row_of = {semantic_id: row for row, semantic_id in enumerate(matrix.semantic_ids)}
+        self._stale = np.zeros(0, dtype=np.int64)
+        self._pending = {}
+
+    def _vectorize(self, matrix: _Matrix, text: str) -> Dict[str, float]:
+        """
+        Returns the L2-normalized TF-IDF vector of `text`, with the inverse document frequencies of `matrix`
+        """
+        # N-grams that no indexed text contains get the highest inverse document frequency
+        unknown_idf = math.log(1. + len(matrix.semantic_ids)) + 1.
+        vector = {}
+        for ngram, count in count_ngrams(text, self.n).items():
+            feature = matrix.vocabulary.get(ngram)
+            weight = count * (float(matrix.idf[feature]) if feature is not None else unknown_idf)
+            if weight > 0.:
+                vector[ngram] = weight
+        norm = math.sqrt(sum(weight * weight for weight in vector.values()))
+        return {ngram: weight / norm for ngram, weight in vector.items()} if norm else {}
+
+    def _build_matrix(self, texts: Dict[str, str]) -> _Matrix:
+        semantic_ids = list(texts)
+        vocabulary: Dict[str, int] = {}
+        rows: List[int] = []
+        features: List[int] = []
+        counts: List[int] = []
+        for row, semantic_id in enumerate(semantic_ids):
+            for ngram, count in count_ngrams(texts[semantic_id], self.n).items():
+                rows.append(row)
+                features.append(vocabulary.setdefault(ngram, len(vocabulary)))
+                counts.append(count)
+        row_array = np.array(rows, dtype=np.int64)
+        feature_array = np.array(features, dtype=np.int64)
+        document_frequency = np.bincount(feature_array, minlength=len(vocabulary))
+        idf = np.log((1. + len(semantic_ids)) / (1. + document_frequency)) + 1.
+        # N-grams that are not stored get a weight of 0., also in queries, so that identical texts have a similarity
+        # of 1.
+        idf[document_frequency > self.max_column_length] = 0.
+        weights = np.array(counts, dtype=np.float64) * idf[feature_array]
+        kept = weights > 0.
+        norms = np.sqrt(np.bincount(row_array[kept], weights=weights[kept] ** 2, minlength=len(semantic_ids)))
+        row_array, feature_array = row_array[kept], feature_array[kept]
+        weights = weights[kept] / norms[row_array]
+        order = np.argsort(feature_array, kind="stable")
+        offsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(feature_array, minlength=len(vocabulary)), out=offsets[1:])
+        return _Matrix(
+            semantic_ids=semantic_ids,
+            vocabulary=vocabulary,
+            idf=idf,
+            offsets=offsets,
+            rows=row_array[order].astype(np.int32),
+            weights=weights[order].astype(np.float32),
+        )
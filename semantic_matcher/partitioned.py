@@ -0,0 +1,446 @@
+"""
+An equivalence table that is stored as one file per namespace and only holds the recently used namespaces in memory
+
+Requests mostly stay within the namespace of their semantic ID, the part before the first "/". A
+:class:`PartitionedEquivalenceTable` therefore stores the matches of each namespace of `base_semantic_id`s as a
+partition in its own file, next to a small manifest. Opening the table only reads the manifest, so it takes the same
+time no matter how many matches the table holds. A partition is loaded on its first access and, once the loaded
+partitions exceed `max_bytes`, the least recently used ones are dropped again, so that the memory follows the
+namespaces that are in use.
+
+Split an existing table into partitions with
+`python -m semantic_matcher.partitioned INPUT DIRECTORY [--format {snapshot,ndjson}]`
+"""
+import argparse
+import itertools
+import json
+import os
+import threading
+import urllib.parse
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple, Type
+
+from semantic_matcher import compact, ingest, model, snapshot
+
+
+MANIFEST = "partitions.json"
+PARTITION_FORMATS = {
+    "ndjson": ".ndjson",
+    "snapshot": snapshot.SUFFIX,
+}
+
+
+def namespace_of(semantic_id: str) -> str:
+    return semantic_id.split("/")[0]
+
+
+def _new_table(backend: Type[model.AbstractEquivalenceTable]) -> model.AbstractEquivalenceTable:
+    if issubclass(backend, model.EquivalenceTable):
+        return backend(matches={})
+    return backend()
+
+
+class Partition:
+    """
+    What the manifest knows about the partition of a namespace, without loading it
+
+    :ivar file: The file name of the partition within the directory of the table
+    :ivar num_matches: The number of matches in the partition
+    :ivar referrers: The namespaces whose partitions may hold matches to semantic IDs of this namespace, including
+        this namespace. Removing matches does not shrink it
+    """
+    def __init__(self, file: str, num_matches: int = 0, referrers: Iterable[str] = ()):
+        self.file: str = file
+        self.num_matches: int = num_matches
+        self.referrers: Set[str] = set(referrers)
+
+
+class PartitionedEquivalenceTable(model.AbstractEquivalenceTable):
+    """
+    An equivalence table whose matches are partitioned by the namespace of their `base_semantic_id`, see the module
+
+    Each partition is a table of the `backend`, or a memory-mapped
+    :class:`compact.CompactEquivalenceTable` if it is stored as
+    :mod:`snapshot`. Outgoing matches are found in the partition of the
+    semantic ID alone. Incoming matches are looked up in the partitions of the
+    namespaces that the manifest lists as referrers, which are usually just
+    the partition itself.
+
+    Changed partitions are written back to their files by
+    :func:`~.PartitionedEquivalenceTable.flush` only, never on the path of a
+    read. A :class:`wal.MutationLog` flushes the table from its compaction
+    thread, instead of writing a snapshot. Only unchanged partitions are
+    dropped from memory, so the loaded partitions can exceed `max_bytes` by
+    the partitions changed since the last flush. Without a mutation log, the
+    changes since the last flush are lost after a restart.
+
+    Reads of loaded partitions take no lock, they only note when each
+    partition was used last. Loading and dropping partitions is serialized by
+    a lock, which changes hold as well, so that no change is made to a
+    partition while it is written back.
+
+    :ivar directory: The directory of the manifest and the partition files
+    :ivar backend: The storage backend of partitions loaded from NDJSON files
+    :ivar max_bytes: The approximate memory of the loaded partitions above
+        which the least recently used unchanged ones are dropped, `None` for no
+        limit. The partition that was used last is always kept
+    :ivar partition_format: The format in which partitions are written,
+        one of :data:`PARTITION_FORMATS`. Snapshots are memory-mapped when they
+        are loaded, NDJSON partitions are parsed, which costs more the larger
+        they are. A single request may follow matches through several
+        namespaces, so a `max_bytes` below the partitions it needs makes them be
+        loaded again and again
+    :ivar loads: Number of partitions that were loaded from their files
+    :ivar evictions: Number of partitions that were dropped from memory
+    """
+    def __init__(
+            self,
+            directory: str,
+            backend: Type[model.AbstractEquivalenceTable] = model.EquivalenceTable,
+            max_bytes: Optional[int] = None,
+            partition_format: str = "snapshot"
+    ):
+        if partition_format not in PARTITION_FORMATS:
+            raise ValueError(f"Unknown partition format {partition_format}")
+        self._closure_index = None
+        self._version: int = 0
+        self.directory: str = directory
+        self.backend: Type[model.AbstractEquivalenceTable] = backend
+        self.max_bytes: Optional[int] = max_bytes
+        self.partition_format: str = partition_format
+        self.loads: int = 0
+        self.evictions: int = 0
+        os.makedirs(directory, exist_ok=True)
+        self._partitions: Dict[str, Partition] = self._read_manifest()
+        # Namespace -> Loaded partition
+        self._loaded: Dict[str, model.AbstractEquivalenceTable] = {}
+        # Namespace -> Tick of the clock when its partition was used last
+        self._last_used: Dict[str, int] = {}
+        self._clock = itertools.count()
+        self._loaded_bytes: Dict[str, int] = {}
+        self._changed: Set[str] = set()
+        self._manifest_changed: bool = False
+        # Files of removed partitions, which are deleted by the next flush
+        self._removed_files: Set[str] = set()
+        self._lock = threading.RLock()
+
+    def add_semantic_match(
+            self,
+            match: model.SemanticMatch,
+            update_policy: model.UpdatePolicy = model.UpdatePolicy.REPLACE
+    ) -> bool:
+        namespace = namespace_of(match.base_semantic_id)
+        with self._lock:
+            partition = self._get_partition(namespace, create=True)
+            if not partition.add_semantic_match(match, update_policy):
+                return False
+            referrers = self._get_or_create_info(namespace_of(match.match_semantic_id)).referrers
+            if namespace not in referrers:
+                referrers.add(namespace)
+                self._manifest_changed = True
+            self._changed_partition(namespace, partition)
+        self._invalidate(match.base_semantic_id)
+        return True
+
+    def remove_semantic_match(self, match: model.SemanticMatch) -> bool:
+        namespace = namespace_of(match.base_semantic_id)
+        with self._lock:
+            partition = self._get_partition(namespace)
+            if partition is None or not partition.remove_semantic_match(match):
+                return False
+            self._changed_partition(namespace, partition)
+        self._invalidate(match.base_semantic_id)
+        return True
+
+    def get_semantic_match(self, base_semantic_id: str, match_semantic_id: str) -> Optional[model.SemanticMatch]:
+        partition = self._get_partition(namespace_of(base_semantic_id))
+        if partition is None:
+            return None
+        return partition.get_semantic_match(base_semantic_id, match_semantic_id)
+
+    def remove_all_semantic_matches(self) -> None:
+        with self._lock:
+            self._removed_files.update(info.file for info in self._partitions.values())
+            self._partitions.clear()
+            self._loaded.clear()
+            self._last_used.clear()
+            self._loaded_bytes.clear()
+            self._changed.clear()
+            self._manifest_changed = True
+        self._invalidate_all()
+
+    def get_all_matches(self) -> Dict[str, List[model.SemanticMatch]]:
+        matches: Dict[str, List[model.SemanticMatch]] = {}
+        for namespace in sorted(self._partitions):
+            partition = self._get_partition(namespace)
+            if partition is not None:
+                matches.update(partition.get_all_matches())
+        return matches
+
+    def flush(self) -> None:
+        """
+        Writes the changed partitions and the manifest to the directory, e.g. when a :class:`wal.MutationLog` compacts,
+        and drops the least recently used partitions if the loaded ones exceed `max_bytes`
+
+        The lock is taken for one partition after the other, so that loading other partitions does not wait for all
+        of them.
+        """
+        for namespace in list(self._changed):
+            with self._lock:
+                if namespace in self._changed:
+                    self._write_partition(namespace)
+        with self._lock:
+            if self._manifest_changed:
+                self._write_manifest()
+            # Files are only deleted once the manifest does not list them anymore
+            for file in self._removed_files - {info.file for info in self._partitions.values()}:
+                try:
+                    os.remove(os.path.join(self.directory, file))
+                except FileNotFoundError:
+                    pass
+            self._removed_files.clear()
+            self._evict()
+
+    def to_file(self, filename: str) -> None:
+        """
+        Writes all matches to a single JSON file, loading one partition after the other
+        """
+        with open(filename, "w") as file:
+            file.write('{\n    "matches": {')
+            separator = "\n"
+            for namespace in sorted(self._partitions):
+                partition = self._get_partition(namespace)
+                if partition is None:
+                    continue
+                for base_semantic_id, row in partition.get_all_matches().items():
+                    file.write(f'{separator}        {json.dumps(base_semantic_id)}: ')
+                    file.write(json.dumps([match.model_dump() for match in row]))
+                    separator = ",\n"
+            file.write("\n    }\n}")
+
+    @classmethod
+    def from_file(cls, filename: str) -> "PartitionedEquivalenceTable":
+        """
+        Opens the partitioned table in the directory `filename`, without loading any partition
+        """
+        return cls(filename)
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Returns the number of `"matches"` of all partitions, but the `"approximate_bytes"` of the loaded ones only,
+        and the number of `"partitions"` and `"loaded_partitions"`
+        """
+        with self._lock:
+            return {
+                "matches": sum(info.num_matches for info in self._partitions.values()),
+                "approximate_bytes": sum(self._loaded_bytes.values()),
+                "partitions": len(self._partitions),
+                "loaded_partitions": len(self._loaded),
+            }
+
+    def _get_neighbours(self, semantic_id: str) -> Iterable[Tuple[str, float, Dict]]:
+        partition = self._get_partition(namespace_of(semantic_id))
+        if partition is None:
+            return []
+        return partition._get_neighbours(semantic_id)
+
+    def _get_inbound(self, semantic_id: str) -> Iterable[Tuple[str, float, Dict]]:
+        info = self._partitions.get(namespace_of(semantic_id))
+        if info is None:
+            return []
+        inbound = []
+        for namespace in sorted(info.referrers):
+            partition = self._get_partition(namespace)
+            if partition is not None:
+                inbound.extend(partition._get_inbound(semantic_id))
+        return inbound
+
+    def _get_base_semantic_ids(self) -> Iterable[str]:
+        for namespace in sorted(self._partitions):
+            partition = self._get_partition(namespace)
+            if partition is not None:
+                yield from partition._get_base_semantic_ids()
+
+    def _iter_semantic_matches_from(
+            self,
+            position: Tuple[int, int],
+            prefix: Optional[str]
+    ) -> Iterator[Tuple[Tuple[int, int], model.SemanticMatch]]:
+        if prefix is None or "/" not in prefix:
+            yield from super()._iter_semantic_matches_from(position, prefix)
+            return
+        # All matches of the prefix are in one partition, so the positions are positions within that partition
+        partition = self._get_partition(namespace_of(prefix))
+        if partition is not None:
+            yield from partition._iter_semantic_matches_from(position, prefix)
+
+    def _get_partition(self, namespace: str, create: bool = False) -> Optional[model.AbstractEquivalenceTable]:
+        """
+        Returns the partition of `namespace`, loading it if it is not in memory
+
+        :param create: If `True`, an empty partition is created for a namespace without matches, otherwise `None` is
+            returned for it
+        """
+        partition = self._loaded.get(namespace)
+        if partition is not None and not create:
+            self._last_used[namespace] = next(self._clock)
+            return partition
+        with self._lock:
+            partition = self._loaded.get(namespace)
+            if partition is not None:
+                self._last_used[namespace] = next(self._clock)
+                return partition
+            info = self._partitions.get(namespace)
+            if info is not None and info.num_matches > 0:
+                partition = self._load_partition(info)
+                # The manifest may have been written with changes that did not reach the file before a crash
+                info.num_matches = partition.stats()["matches"]
+                self.loads += 1
+            elif create:
+                partition = _new_table(self.backend)
+                self._get_or_create_info(namespace)
+            else:
+                return None
+            self._loaded[namespace] = partition
+            self._last_used[namespace] = next(self._clock)
+            self._loaded_bytes[namespace] = partition.stats()["approximate_bytes"]
+            self._evict()
+            return partition
+
+    def _get_or_create_info(self, namespace: str) -> Partition:
+        info = self._partitions.get(namespace)
+        if info is None:
+            file = "partition-" + urllib.parse.quote(namespace, safe="") + PARTITION_FORMATS[self.partition_format]
+            info = self._partitions[namespace] = Partition(file, referrers=[namespace])
+            self._removed_files.discard(file)
+            self._manifest_changed = True
+        return info
+
+    def _changed_partition(self, namespace: str, partition: model.AbstractEquivalenceTable) -> None:
+        stats = partition.stats()
+        self._partitions[namespace].num_matches = stats["matches"]
+        self._loaded_bytes[namespace] = stats["approximate_bytes"]
+        self._changed.add(namespace)
+        self._manifest_changed = True
+        self._evict()
+
+    def _evict(self) -> None:
+        """
+        Drops the least recently used unchanged partitions while the loaded ones exceed `max_bytes`. Changed partitions
+        are kept until :func:`~.PartitionedEquivalenceTable.flush` wrote them
+        """
+        if self.max_bytes is None:
+            return
+        while len(self._loaded) > 1 and sum(self._loaded_bytes.values()) > self.max_bytes:
+            # Reads note the use of a partition without the lock, a namespace dropped meanwhile may be noted again
+            last_used = sorted(self._loaded, key=lambda namespace: self._last_used.get(namespace, -1))
+            namespace = next((namespace for namespace in last_used[:-1] if namespace not in self._changed), None)
+            if namespace is None:
+                return
+            del self._loaded[namespace]
+            del self._loaded_bytes[namespace]
+            self._last_used.pop(namespace, None)
+            self.evictions += 1
+
+    def _load_partition(self, info: Partition) -> model.AbstractEquivalenceTable:
+        filename = os.path.join(self.directory, info.file)
+        if not os.path.exists(filename):
+            # The partition was created after the last flush, replaying the mutation log restores its matches
+            return _new_table(self.backend)
+        if filename.endswith(snapshot.SUFFIX):
+            return snapshot.load(filename)
+        return self.backend.from_file(filename)
+
+    def _write_partition(self, namespace: str) -> None:
+        """
+        Writes the loaded, changed partition of `namespace` to its file, in the `partition_format`
+        """
+        info = self._partitions[namespace]
+        partition = self._loaded[namespace]
+        file = info.file
+        if not file.endswith(PARTITION_FORMATS[self.partition_format]):
+            # The partition was written in another format before
+            self._removed_files.add(file)
+            file = file.rsplit(".", 1)[0] + PARTITION_FORMATS[self.partition_format]
+        filename = os.path.join(self.directory, file)
+        if self.partition_format == "snapshot":
+            snapshot.write_snapshot(partition, filename + ".tmp")
+        else:
+            with open(filename + ".tmp", "w", encoding="utf-8") as output:
+                for _, match in partition.iter_semantic_matches():
+                    output.write(match.model_dump_json() + "\n")
+        with open(filename + ".tmp", "rb") as output:
+            os.fsync(output.fileno())
+        os.replace(filename + ".tmp", filename)
+        info.file = file
+        self._changed.discard(namespace)
+        self._manifest_changed = True
+
+    def _read_manifest(self) -> Dict[str, Partition]:
+        try:
+            with open(os.path.join(self.directory, MANIFEST), "r", encoding="utf-8") as file:
+                manifest = json.load(file)
+        except FileNotFoundError:
+            return {}
+        return {
+            namespace: Partition(info["file"], info["matches"], info["referrers"])
+            for namespace, info in manifest["partitions"].items()
+        }
+
+    def _write_manifest(self) -> None:
+        filename = os.path.join(self.directory, MANIFEST)
+        manifest = {"partitions": {
+            namespace: {"file": info.file, "matches": info.num_matches, "referrers": sorted(info.referrers)}
+            for namespace, info in sorted(self._partitions.items())
+        }}
+        with open(filename + ".tmp", "w", encoding="utf-8") as file:
+            json.dump(manifest, file, indent=4)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(filename + ".tmp", filename)
+        self._manifest_changed = False
+
+
+def write_partitions(
+        matches: Iterable[model.SemanticMatch],
+        directory: str,
+        partition_format: str = "snapshot",
+        max_bytes: Optional[int] = None
+) -> PartitionedEquivalenceTable:
+    """
+    Adds the `matches` to the partitioned table in `directory` and writes its partitions
+
+    :param max_bytes: See :class:`~.PartitionedEquivalenceTable`, the partitions are flushed whenever the loaded ones
+        exceed it and are loaded again for later matches, so the `matches` should be grouped by namespace if it is set
+    """
+    table = PartitionedEquivalenceTable(
+        directory,
+        backend=compact.CompactEquivalenceTable,
+        max_bytes=max_bytes,
+        partition_format=partition_format
+    )
+    matches = iter(matches)
+    for batch in iter(lambda: list(itertools.islice(matches, 10000)), []):
+        table.add_semantic_matches(batch)
+        if max_bytes is not None and table.stats()["approximate_bytes"] > max_bytes:
+            table.flush()
+    table.flush()
+    return table
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Splits an equivalence table into one partition per namespace")
+    parser.add_argument("input", help="A JSON or NDJSON equivalence table")
+    parser.add_argument("directory")
+    parser.add_argument("--format", choices=sorted(PARTITION_FORMATS), default="snapshot")
+    parser.add_argument("--max-bytes", type=int, default=None, help="Memory limit of the partitions while splitting")
+    args = parser.parse_args()
+    write_partitions(
+        (model.SemanticMatch.model_validate(match) for match in ingest.iter_file(args.input)),
+        args.directory,
+        args.format,
+        args.max_bytes
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,229 @@
+"""
+Replicates the matches of selected namespaces between semantic matching services
+
+Every service keeps a :class:`ChangeFeed` of the latest changes of its equivalence table, which it serves at
+`/changes`. A :class:`Replica` follows the feed of a remote service and keeps a read-only local copy of the matches
+of some of its namespaces. Requests for these namespaces can then be answered without asking the remote service.
+After the first load, a sync only transfers the changes since the previous one, so its cost depends on the number of
+changes, not on the size of the table.
+
+A replica lags behind its remote service by up to the interval between two syncs.
+"""
+import bisect
+import threading
+import uuid
+from typing import Dict, List, Optional, Sequence
+
+import requests
+
+from semantic_matcher import model, service_model, wal
+
+
+def _namespace(semantic_id: str) -> str:
+    return semantic_id.split("/")[0]
+
+
+class ChangeFeed:
+    """
+    The latest `maxsize` changes of an equivalence table, as records of a :class:`wal.MutationLog`
+
+    Every change of a match increases the version of the table by one, so each
+    record is stored with the version of the table after it. Changes that are
+    not known anymore, as they are older than the `maxsize` latest ones or
+    were made before the feed started, make followers load the whole table.
+
+    :ivar epoch: A random ID of this feed. Versions of different feeds cannot be compared
+    :ivar version: The version of the table after the latest change
+    :ivar maxsize: The number of changes that are kept at least
+    """
+    def __init__(self, version: int, maxsize: int = 100000):
+        self.epoch: str = uuid.uuid4().hex
+        self.version: int = version
+        self.maxsize: int = maxsize
+        # The version up to which the changes are not known
+        self._start_version: int = version
+        self._versions: List[int] = []
+        self._records: List[Dict] = []
+        self._lock = threading.Lock()
+
+    def append(self, version: int, records: Sequence[Dict]) -> None:
+        """
+        Adds the `records` of one change of the table, after which the table has the `version`
+        """
+        if not records:
+            return
+        with self._lock:
+            first_version = version - len(records) + 1
+            self._versions.extend(range(first_version, version + 1))
+            self._records.extend(records)
+            self.version = version
+            # Dropping old changes in chunks keeps appending cheap
+            if len(self._records) > self.maxsize + max(self.maxsize // 4, 1):
+                num_dropped = len(self._records) - self.maxsize
+                self._start_version = self._versions[num_dropped - 1]
+                del self._versions[:num_dropped]
+                del self._records[:num_dropped]
+
+    def changes_since(
+            self,
+            since: Optional[int],
+            epoch: Optional[str] = None,
+            limit: int = 10000
+    ) -> service_model.ChangesPage:
+        """
+        Returns at most `limit` changes after the version `since` of this feed's `epoch`
+        """
+        with self._lock:
+            if since is None or epoch != self.epoch or not self._start_version <= since <= self.version:
+                return service_model.ChangesPage(epoch=self.epoch, version=self.version, reset=True)
+            start = bisect.bisect_right(self._versions, since)
+            end = min(start + limit, len(self._records))
+            changes = [
+                {**record, "version": version}
+                for version, record in zip(self._versions[start:end], self._records[start:end])
+            ]
+            return service_model.ChangesPage(
+                epoch=self.epoch,
+                version=self._versions[end - 1] if changes else self.version,
+                changes=changes,
+                has_more=end < len(self._records)
+            )
+
+
+class Replica:
+    """
+    A read-only local copy of the matches of the `namespaces` of the remote service at `endpoint`
+
+    Only matches whose `base_semantic_id` is in one of the `namespaces` are
+    copied. :func:`~.Replica.sync` brings the copy up to date.
+
+    :ivar endpoint: The endpoint of the remote service
+    :ivar namespaces: The replicated namespaces
+    :ivar table: The replicated matches
+    :ivar epoch: The epoch of the :class:`~.ChangeFeed` of the remote service, `None` before the first sync
+    :ivar version: The version of the table of the remote service that `table` is a copy of
+    """
+    def __init__(
+            self,
+            endpoint: str,
+            namespaces: Sequence[str],
+            session: Optional[requests.Session] = None,
+            timeout: float = 5.,
+            page_size: int = 10000
+    ):
+        self.endpoint: str = endpoint
+        self.namespaces: List[str] = list(namespaces)
+        self.table: model.AbstractEquivalenceTable = model.EquivalenceTable(matches={})
+        self.epoch: Optional[str] = None
+        self.version: Optional[int] = None
+        self.timeout: float = timeout
+        self.page_size: int = page_size
+        self._session: requests.Session = session if session is not None else requests.Session()
+        self._syncing_thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def sync(self) -> int:
+        """
+        Applies the changes of the remote service since the last sync, or loads all its matches of the `namespaces`
+        if it does not know these changes anymore
+
+        :returns: The number of changes that were applied
+        :raises requests.RequestException: If the remote service cannot be reached
+        """
+        table, epoch, version = self.table, self.epoch, self.version
+        num_changes = 0
+        while True:
+            page = self._get_changes(version, epoch)
+            if page.reset:
+                # Changes after `page.version` are applied on top of the loaded matches, which is harmless, as
+                # applying changes again does not change the result
+                table = self._load()
+                epoch, version = page.epoch, page.version
+                continue
+            for record in page.changes:
+                if record["op"] == "clear" or self._is_replicated(
+                        record["match"]["base_semantic_id"] if record["op"] == "add" else record["base_semantic_id"]
+                ):
+                    wal.apply_record(table, record)
+            num_changes += len(page.changes)
+            version = page.version
+            if not page.has_more:
+                break
+        # A loaded table replaces the previous one only once it caught up
+        self.table, self.epoch, self.version = table, epoch, version
+        return num_changes
+
+    def get_local_matches(self, request_body: service_model.MatchRequest) -> Optional[List[model.SemanticMatch]]:
+        """
+        Returns the matches that the remote service would return for `request_body`, if the replica holds all of them
+
+        That is not the case if the remote service would pass the request on to
+        further services, as some matches lead out of the namespace of the
+        `semantic_id`, or if it would fall back to NLP matching. Requests that
+        follow matches backwards are never answered, as the replica does not
+        hold the matches into the namespace from other namespaces.
+        """
+        if self.epoch is None or not self._is_replicated(request_body.semantic_id):
+            return None
+        if request_body.direction is not model.Direction.OUTBOUND:
+            return None
+        matches = self.table.get_local_matches(
+            semantic_id=request_body.semantic_id,
+            score_limit=request_body.score_limit,
+            direction=request_body.direction,
+            max_results=request_body.max_results
+        )
+        namespace = _namespace(request_body.semantic_id)
+        if any(_namespace(match.match_semantic_id) != namespace for match in matches):
+            return None
+        if not matches and (request_body.name or request_body.definition):
+            return None
+        return matches
+
+    def start(self, interval: float) -> None:
+        """
+        Syncs right away and then every `interval` seconds in a background thread
+        """
+        def run() -> None:
+            while True:
+                try:
+                    self.sync()
+                except (requests.RequestException, ValueError):
+                    # The remote service is not reachable or answered with an error, try again in the next interval
+                    pass
+                if self._stop.wait(interval):
+                    return
+
+        self._syncing_thread = threading.Thread(target=run, name="replica_sync", daemon=True)
+        self._syncing_thread.start()
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._syncing_thread is not None:
+            self._syncing_thread.join()
+
+    def _is_replicated(self, semantic_id: str) -> bool:
+        return _namespace(semantic_id) in self.namespaces
+
+    def _get_changes(self, since: Optional[int], epoch: Optional[str]) -> service_model.ChangesPage:
+        params: Dict[str, object] = {"limit": self.page_size}
+        if since is not None and epoch is not None:
+            params.update(since=since, epoch=epoch)
+        response = self._session.get(f"{self.endpoint}/changes", params=params, timeout=self.timeout)
+        response.raise_for_status()
+        return service_model.ChangesPage.model_validate_json(response.text)
+
+    def _load(self) -> model.AbstractEquivalenceTable:
+        table = model.EquivalenceTable(matches={})
+        for namespace in self.namespaces:
+            response = self._session.get(
+                f"{self.endpoint}/all_matches",
+                params={"namespace": namespace, "stream": "true"},
+                stream=True,
+                timeout=self.timeout
+            )
+            response.raise_for_status()
+            table.add_semantic_matches(
+                model.SemanticMatch.model_validate_json(line) for line in response.iter_lines() if line
+            )
+        return table
@@ -0,0 +1,177 @@
+"""
+Shares an equivalence table between processes as memory-mapped, read-only snapshot segments
+
+A single writer process owns the equivalence table and all changes to it. A :class:`SegmentPublisher` regularly
+writes the changed table as new segment, a :mod:`snapshot` file, into a directory and then points the `CURRENT` file
+of the directory to it. Reader processes follow `CURRENT` with a :class:`SegmentFollower` and memory-map the latest
+segment. All readers map the same file, so its pages are held once in the page cache of the operating system, no
+matter how many readers there are.
+
+A segment is never changed after it was published. Older segments are deleted once they are no longer among the
+`keep` latest ones; readers that still map them keep a valid mapping until they load a newer segment. Where a mapped
+file cannot be deleted, as on Windows, the deletion is retried until the readers have moved on.
+"""
+import os
+import re
+import threading
+from array import array
+from typing import Callable, Iterator, List, Optional, Union
+
+from semantic_matcher import compact, model, snapshot
+
+
+CURRENT = "CURRENT"
+_SEGMENT_PATTERN = re.compile(r"segment-(\d+)" + re.escape(snapshot.SUFFIX))
+
+
+def _segment_name(generation: int) -> str:
+    return f"segment-{generation:012d}{snapshot.SUFFIX}"
+
+
+class SegmentPublisher:
+    """
+    Publishes the equivalence table of the writer process as segments into `directory`
+
+    :ivar directory: The directory of the segments
+    :ivar keep: The number of latest segments that are not deleted
+    :ivar generation: The generation of the latest published segment, counting on from the segments found in
+        `directory`
+    """
+    def __init__(self, directory: str, keep: int = 2):
+        self.directory: str = directory
+        self.keep: int = keep
+        os.makedirs(directory, exist_ok=True)
+        self.generation: int = max(self._generations(), default=0)
+        self._published_version: Optional[int] = None
+        # Whether an old segment could not be removed yet
+        self._has_old_segments: bool = False
+        self._publishing_thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def publish(self, table: model.AbstractEquivalenceTable) -> str:
+        """
+        Writes `table` as the next segment and makes it the current one
+
+        The table must not change while it is written.
+
+        :returns: The file of the new segment
+        """
+        return self._publish(snapshot.encode_sections(table), table.version)
+
+    def start(self, table: model.AbstractEquivalenceTable, lock: threading.Lock, interval: float) -> None:
+        """
+        Publishes `table` every `interval` seconds in a background thread, if it changed since the last publication
+
+        Changes to the table need to hold `lock`, which is only held while the table is encoded in memory, not while
+        the segment is written.
+        """
+        def run() -> None:
+            while not self._stop.wait(interval):
+                if table.version == self._published_version:
+                    if self._has_old_segments:
+                        self._remove_old_segments()
+                    continue
+                with lock:
+                    version = table.version
+                    sections = snapshot.encode_sections(table)
+                self._publish(sections, version)
+
+        self._publishing_thread = threading.Thread(target=run, name="segment_publishing", daemon=True)
+        self._publishing_thread.start()
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._publishing_thread is not None:
+            self._publishing_thread.join()
+
+    def _publish(self, sections: List[Union[array, bytes]], version: int) -> str:
+        generation = self.generation + 1
+        filename = os.path.join(self.directory, _segment_name(generation))
+        snapshot.write_sections(sections, filename + ".tmp")
+        os.replace(filename + ".tmp", filename)
+        self.generation = generation
+        current_file = os.path.join(self.directory, CURRENT)
+        with open(current_file + ".tmp", "w", encoding="utf-8") as file:
+            file.write(_segment_name(generation))
+        os.replace(current_file + ".tmp", current_file)
+        self._published_version = version
+        self._remove_old_segments()
+        return filename
+
+    def _remove_old_segments(self) -> None:
+        self._has_old_segments = False
+        for old_generation in self._generations():
+            if old_generation <= self.generation - self.keep:
+                try:
+                    os.remove(os.path.join(self.directory, _segment_name(old_generation)))
+                except OSError:
+                    # E.g. on Windows, while a reader still maps the segment. It is removed by a later attempt
+                    self._has_old_segments = True
+
+    def _generations(self) -> Iterator[int]:
+        for filename in os.listdir(self.directory):
+            match = _SEGMENT_PATTERN.fullmatch(filename)
+            if match is not None:
+                yield int(match.group(1))
+
+
+class SegmentFollower:
+    """
+    Loads the current segment of `directory` and the segments published after it
+
+    :ivar directory: The directory of the segments
+    :ivar segment: The file name of the loaded segment
+    """
+    def __init__(self, directory: str):
+        self.directory: str = directory
+        self.segment: Optional[str] = None
+        self._following_thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def current_segment(self) -> str:
+        """
+        Returns the file name of the current segment
+
+        :raises FileNotFoundError: If no segment was published yet
+        """
+        with open(os.path.join(self.directory, CURRENT), "r", encoding="utf-8") as file:
+            return file.read().strip()
+
+    def load(self) -> compact.CompactEquivalenceTable:
+        """
+        Memory-maps the current segment
+        """
+        segment = self.current_segment()
+        table = snapshot.load(os.path.join(self.directory, segment))
+        self.segment = segment
+        return table
+
+    def poll(self) -> Optional[compact.CompactEquivalenceTable]:
+        """
+        Returns the current segment if it is newer than the loaded one, otherwise `None`
+        """
+        try:
+            if self.current_segment() == self.segment:
+                return None
+            return self.load()
+        except FileNotFoundError:
+            # The segment was replaced again before it could be loaded, the next poll loads its successor
+            return None
+
+    def start(self, on_load: Callable[[compact.CompactEquivalenceTable], None], interval: float) -> None:
+        """
+        Polls for a newer segment every `interval` seconds in a background thread and passes each one to `on_load`
+        """
+        def run() -> None:
+            while not self._stop.wait(interval):
+                table = self.poll()
+                if table is not None:
+                    on_load(table)
+
+        self._following_thread = threading.Thread(target=run, name="segment_following", daemon=True)
+        self._following_thread.start()
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._following_thread is not None:
+            self._following_thread.join()
@@ -1,9 +1,173 @@
-from typing import List
+import concurrent.futures
+import configparser
+import contextvars
+import os
+import threading
+import time
+import uuid
+from typing import Callable, Coroutine, Dict, Iterator, List, NamedTuple, Optional, Tuple
 
+import anyio.from_thread
 import requests
-from fastapi import APIRouter
+import requests.adapters
+from fastapi import APIRouter, FastAPI, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from fastapi.routing import APIRoute
 
-from semantic_matcher import model, service_model
+from semantic_matcher import (
+    batching, cache, circuit, compact, encoding, ingest, metrics, model, nlp, partitioned, replication, segments,
+    service_model, snapshot, wal
+)
+
+
+# The deadline of the match requests for which the resolver is currently asked, see :func:`_time_left`
+_resolver_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("resolver_deadline", default=None)
+
+
+def _time_left(deadline: Optional[float]) -> Optional[float]:
+    """
+    Returns the seconds until the `time.monotonic` `deadline`, at least `0.`, or `None` if there is no deadline
+    """
+    if deadline is None:
+        return None
+    return max(deadline - time.monotonic(), 0.)
+
+
+class TimedRoute(APIRoute):
+    """
+    An :class:`APIRoute` that records the latency and errors of its requests in :mod:`metrics`
+
+    Requests with a :attr:`~.TimedRoute.DEBUG_TIMING_HEADER` get the time
+    spent in each stage returned in a `Server-Timing` header, in
+    milliseconds. Its `total` includes parsing the request and serializing
+    the response.
+    """
+    DEBUG_TIMING_HEADER = "X-Debug-Timing"
+
+    def get_route_handler(self) -> Callable[[Request], Coroutine[None, None, Response]]:
+        route_handler = super().get_route_handler()
+        path = self.path
+
+        async def timed_route_handler(request: Request) -> Response:
+            start = time.perf_counter()
+            with metrics.trace() as trace:
+                try:
+                    response = await route_handler(request)
+                except HTTPException as e:
+                    if e.status_code >= 500:
+                        metrics.REQUEST_ERRORS.inc(1., path)
+                    raise
+                except Exception:
+                    metrics.REQUEST_ERRORS.inc(1., path)
+                    raise
+            duration = time.perf_counter() - start
+            metrics.REQUEST_SECONDS.observe(duration, path)
+            if response.status_code >= 500:
+                metrics.REQUEST_ERRORS.inc(1., path)
+            if self.DEBUG_TIMING_HEADER in request.headers:
+                response.headers["Server-Timing"] = trace.server_timing(duration)
+            return response
+
+        return timed_route_handler
+
+
+class FederationOptions(NamedTuple):
+    """
+    How a :class:`~.SemanticMatchingService` requests the resolver and remote services
+
+    :ivar remote_concurrency: The maximal number of concurrent requests to the resolver and remote services
+    :ivar remote_timeout: The timeout of each request to the resolver or a remote service in seconds
+    :ivar max_federation_hops: How many times a request is passed on between services at most, unless the request
+        sets its own `max_hops`
+    :ivar request_timeout: The `timeout` of match requests that do not set one. If `None`, these requests wait for
+        all remote services, each for at most `remote_timeout`
+    :ivar deadline_margin: The seconds by which the `timeout` passed on to a remote service is shorter than the time
+        left, so that its answer can still arrive in time
+    :ivar resolver_endpoint: The URL of the resolver, including its port. If `None`, it is read from the `RESOLVER`
+        section of the config
+    :ivar trusted_peers: The endpoints of the remote services whose responses are parsed without validating the
+        matches
+    :ivar circuit_breaker: The :class:`circuit.CircuitBreaker` of the remote services. Requests that fail or run into
+        the `remote_timeout` count as failures, requests cut off by the `timeout` of a match request do not
+    """
+    remote_concurrency: int = 16
+    remote_timeout: float = 5.
+    max_federation_hops: int = 5
+    request_timeout: Optional[float] = None
+    deadline_margin: float = 0.05
+    resolver_endpoint: Optional[str] = None
+    trusted_peers: Tuple[str, ...] = ()
+    circuit_breaker: Optional[circuit.CircuitBreaker] = None
+
+
+class CacheOptions(NamedTuple):
+    """
+    The caches of a :class:`~.SemanticMatchingService`
+
+    :ivar resolver_cache: The :class:`cache.TTLCache` for the answers of the resolver
+    :ivar resolver_cache_key: Whether resolver answers are cached per `"namespace"` or per `"semantic_id"`
+    :ivar result_cache_size: The maximal number of cached local and remote results each. Cached local results are
+        valid until the equivalence table changes
+    :ivar remote_result_ttl: The time in seconds for which the results of remote services are cached
+    :ivar encoding_cache_size: The maximal number of matches whose JSON encoding is cached, see
+        :class:`encoding.MatchEncoder`
+    :ivar served_queries: The :class:`cache.TTLCache` of the federated queries the service already passed on. A
+        query that is not remembered anymore is passed on again, until its `max_hops` are used up
+    """
+    resolver_cache: Optional[cache.TTLCache[str]] = None
+    resolver_cache_key: str = "namespace"
+    result_cache_size: int = 10000
+    remote_result_ttl: float = 60.
+    encoding_cache_size: int = 100000
+    served_queries: Optional[cache.TTLCache[bool]] = None
+
+
+class PersistenceOptions(NamedTuple):
+    """
+    How a :class:`~.SemanticMatchingService` changes its equivalence table
+
+    :ivar mutation_log: If given, all changes to the equivalence table are made durable in this
+        :class:`wal.MutationLog`
+    :ivar write_batch_window: The time in seconds for which posted matches are collected, so that posts arriving
+        close together are added to the equivalence table and the mutation log at once
+    """
+    mutation_log: Optional[wal.MutationLog] = None
+    write_batch_window: float = 0.001
+
+
+class WorkerOptions(NamedTuple):
+    """
+    The role of a :class:`~.SemanticMatchingService` in a multi-process deployment, see :mod:`workers`
+
+    :ivar writer_endpoint: If given, the service does not change its equivalence table itself, but forwards all
+        changes to the writer service at this endpoint
+    :ivar segment_publisher: If given, the equivalence table is published with this
+        :class:`segments.SegmentPublisher` every `publish_interval` seconds, if it changed
+    """
+    writer_endpoint: Optional[str] = None
+    segment_publisher: Optional[segments.SegmentPublisher] = None
+    publish_interval: float = 1.
+
+
+class ReplicationOptions(NamedTuple):
+    """
+    :ivar replicas: The :class:`replication.Replica`s of remote services that are synced every `interval` seconds
+    :ivar change_feed_size: The number of latest changes of the equivalence table that are kept for followers
+    """
+    replicas: Tuple[replication.Replica, ...] = ()
+    interval: float = 5.
+    change_feed_size: int = 100000
+
+
+class NLPOptions(NamedTuple):
+    """
+    :ivar index: If given, requests with a `name` or `definition` whose semantic ID has no match in the equivalence
+        table are matched with the most similar semantic IDs of this :class:`nlp.NgramIndex`
+    :ivar max_results: The maximal number of NLP matches per request, unless the request sets a lower `max_results`
+    """
+    index: Optional[nlp.NgramIndex] = None
+    max_results: int = 10
 
 
 class SemanticMatchingService:
@@ -18,25 +182,75 @@ class SemanticMatchingService:
     :func:`~.SemanticMatchingService.get_matches` lets users get the
     :class:`model.SemanticMatch`es of the :class:`~.SemanticMatchingService`
     and the respective remote :class:`~.SemanticMatchingService`s.
+    :func:`~.SemanticMatchingService.get_matches_batch` does the same for
+    many semantic IDs in one request.
 
     Additionally, the internal function
     :func:`~.SemanticMatchingService._get_matcher_from_semantic_id` lets the
     :class:`~.SemanticMatchingService` find the suiting remote
     :class:`~.SemanticMatchingService`s to a given `semantic_id`.
+
+    Requests that read the equivalence table never wait for changes, see
+    :class:`model.AbstractEquivalenceTable`. Changes are made one after
+    another.
+
+    All requests are timed, see :class:`~.TimedRoute`, and the metrics of the
+    service are served in the Prometheus format by
+    :func:`~.SemanticMatchingService.get_metrics`.
+
+    Match requests may carry a `timeout`. The remote services and the
+    resolver are only given what is left of it, and matches that did not
+    arrive in time are left out, see
+    :attr:`service_model.MatchesList.cut_off_services`. Remote services that
+    fail repeatedly are skipped for a while by a
+    :class:`circuit.CircuitBreaker`.
+
+    The latest changes of the equivalence table are served by
+    :func:`~.SemanticMatchingService.get_changes`, which other services
+    follow with a :class:`replication.Replica` of some of its namespaces.
+    Requests to remote services whose namespace is replicated are answered
+    from the replica, if it holds the whole answer.
+
+    A service with a `writer_endpoint` is a read-only worker of a
+    multi-process deployment, see :mod:`workers`: It forwards all changes to
+    the writer service and serves the segments the writer publishes.
     """
+    # The number of matches that are sent together when streaming all matches
+    STREAM_CHUNK_SIZE = 1000
+    # The number of streamed matches that are added to the equivalence table together
+    INGEST_BATCH_SIZE = 10000
+    # The maximal number of invalid lines that are reported for one streaming ingest
+    INGEST_MAX_REPORTED_ERRORS = 1000
+
     def __init__(
             self,
             endpoint: str,
-            equivalences: model.EquivalenceTable
+            equivalences: model.AbstractEquivalenceTable,
+            update_policy: model.UpdatePolicy = model.UpdatePolicy.REPLACE,
+            federation_options: FederationOptions = FederationOptions(),
+            cache_options: CacheOptions = CacheOptions(),
+            persistence_options: PersistenceOptions = PersistenceOptions(),
+            worker_options: WorkerOptions = WorkerOptions(),
+            replication_options: ReplicationOptions = ReplicationOptions(),
+            nlp_options: NLPOptions = NLPOptions()
     ):
         """
         Initializer of :class:`~.SemanticMatchingService`
 
         :ivar endpoint: The endpoint on which the service listens
-        :ivar equivalences: The :class:`model.EquivalenceTable` of the semantic
-            equivalences that this :class:`~.SemanticMatchingService` contains.
+        :ivar equivalences: The :class:`model.AbstractEquivalenceTable` of the
+            semantic equivalences that this :class:`~.SemanticMatchingService`
+            contains.
+        :ivar update_policy: The :class:`model.UpdatePolicy` applied to posted
+            matches between semantic IDs that already have a match
+        :ivar federation_options: See :class:`~.FederationOptions`
+        :ivar cache_options: See :class:`~.CacheOptions`
+        :ivar persistence_options: See :class:`~.PersistenceOptions`
+        :ivar worker_options: See :class:`~.WorkerOptions`
+        :ivar replication_options: See :class:`~.ReplicationOptions`
+        :ivar nlp_options: See :class:`~.NLPOptions`
         """
-        self.router = APIRouter()
+        self.router = APIRouter(route_class=TimedRoute)
 
         self.router.add_api_route(
             "/all_matches",
@@ -45,31 +259,265 @@ class SemanticMatchingService:
         )
         self.router.add_api_route(
             "/get_matches",
-            self.get_matches,
-            methods=["GET"]
+            self.get_matches_response,
+            methods=["GET"],
+            response_model=service_model.MatchesList
+        )
+        self.router.add_api_route(
+            "/get_matches_batch",
+            self.get_matches_batch_response,
+            methods=["GET"],
+            response_model=service_model.MatchesListBatch
         )
         self.router.add_api_route(
             "/post_matches",
             self.post_matches,
             methods=["POST"]
         )
+        self.router.add_api_route(
+            "/post_matches_stream",
+            self.post_matches_stream,
+            methods=["POST"]
+        )
+        self.router.add_api_route(
+            "/post_descriptions",
+            self.post_descriptions,
+            methods=["POST"]
+        )
+        self.router.add_api_route(
+            "/cache_stats",
+            self.get_cache_stats,
+            methods=["GET"]
+        )
+        self.router.add_api_route(
+            "/changes",
+            self.get_changes,
+            methods=["GET"]
+        )
+        self.router.add_api_route(
+            "/metrics",
+            self.get_metrics,
+            methods=["GET"]
+        )
+        self.router.add_api_route(
+            "/remove_matches_of",
+            self.remove_matches_of,
+            methods=["POST"]
+        )
         self.router.add_api_route(
             "/clear",
             self.remove_all_matches,
             methods=["POST"]
         )
         self.endpoint: str = endpoint
-        self.equivalence_table: model.EquivalenceTable = equivalences
+        self.equivalence_table: model.AbstractEquivalenceTable = equivalences
+        self.update_policy: model.UpdatePolicy = update_policy
+        self.remote_timeout: float = federation_options.remote_timeout
+        resolver_cache = cache_options.resolver_cache
+        if resolver_cache is None:
+            resolver_cache = cache.TTLCache(maxsize=10000, ttl=3600., negative_ttl=60.)
+        self._resolver_cache: cache.TTLCache[str] = resolver_cache
+        self.resolver_cache_key: str = cache_options.resolver_cache_key
+        self._local_result_cache = cache.ResultCache(maxsize=cache_options.result_cache_size)
+        self._remote_result_cache = cache.ResultCache(maxsize=cache_options.result_cache_size)
+        self.remote_result_ttl: float = cache_options.remote_result_ttl
+        self.max_federation_hops: int = federation_options.max_federation_hops
+        self.mutation_log: Optional[wal.MutationLog] = persistence_options.mutation_log
+        self.nlp_index: Optional[nlp.NgramIndex] = nlp_options.index
+        self.nlp_max_results: int = nlp_options.max_results
+        self.resolver_endpoint: Optional[str] = federation_options.resolver_endpoint
+        self.writer_endpoint: Optional[str] = worker_options.writer_endpoint
+        self.request_timeout: Optional[float] = federation_options.request_timeout
+        self.deadline_margin: float = federation_options.deadline_margin
+        circuit_breaker = federation_options.circuit_breaker
+        if circuit_breaker is None:
+            circuit_breaker = circuit.CircuitBreaker()
+        self.circuit_breaker: circuit.CircuitBreaker = circuit_breaker
+        self._encoder = encoding.MatchEncoder(maxsize=cache_options.encoding_cache_size)
+        self.trusted_peers: List[str] = list(federation_options.trusted_peers)
+        # Serializes all changes of the equivalence table
+        self._write_lock = threading.Lock()
+        self._change_feed = replication.ChangeFeed(equivalences.version, maxsize=replication_options.change_feed_size)
+        self.replicas: List[replication.Replica] = list(replication_options.replicas)
+        self._replicas_by_namespace: Dict[str, replication.Replica] = {
+            namespace: replica for replica in self.replicas for namespace in replica.namespaces
+        }
+        for replica in self.replicas:
+            replica.start(replication_options.interval)
+        if worker_options.segment_publisher is not None:
+            worker_options.segment_publisher.start(
+                self.equivalence_table,
+                self._write_lock,
+                worker_options.publish_interval
+            )
+        self._post_batcher: batching.WriteBatcher[List[model.SemanticMatch], None] = batching.WriteBatcher(
+            self._apply_posts,
+            window=persistence_options.write_batch_window
+        )
+        # The metrics of this service, which are set when they are requested
+        self._metrics = metrics.Registry()
+        self._table_matches = self._metrics.register(metrics.Gauge(
+            "semantic_matcher_table_matches",
+            "Matches stored in the equivalence table"
+        ))
+        self._table_bytes = self._metrics.register(metrics.Gauge(
+            "semantic_matcher_table_approximate_bytes",
+            "Estimated memory of the equivalence table"
+        ))
+        self._table_version = self._metrics.register(metrics.Gauge(
+            "semantic_matcher_table_version",
+            "Number of changes of the equivalence table since it was loaded"
+        ))
+        self._cache_entries = self._metrics.register(metrics.Gauge(
+            "semantic_matcher_cache_entries",
+            "Entries of each cache",
+            ("cache",)
+        ))
+        self._cache_hits = self._metrics.register(metrics.Counter(
+            "semantic_matcher_cache_hits_total",
+            "Lookups answered by each cache",
+            ("cache",)
+        ))
+        self._cache_misses = self._metrics.register(metrics.Counter(
+            "semantic_matcher_cache_misses_total",
+            "Lookups not answered by each cache",
+            ("cache",)
+        ))
+        self._write_batches = self._metrics.register(metrics.Counter(
+            "semantic_matcher_write_batches_total",
+            "Batches in which posted matches were added"
+        ))
+        self._write_batch_items = self._metrics.register(metrics.Counter(
+            "semantic_matcher_write_batch_items_total",
+            "Posts that were added in batches"
+        ))
+        self._open_circuits = self._metrics.register(metrics.Gauge(
+            "semantic_matcher_open_circuits",
+            "Remote services that are currently skipped after failing repeatedly"
+        ))
+        self._replica_versions = self._metrics.register(metrics.Gauge(
+            "semantic_matcher_replica_version",
+            "Version of the table of the remote service that each replica is a copy of",
+            ("endpoint",)
+        ))
+        # (query_id, semantic_id, direction, max_results) of the federated queries this service already passed on
+        served_queries = cache_options.served_queries
+        if served_queries is None:
+            served_queries = cache.TTLCache(maxsize=100000, ttl=300., negative_ttl=300.)
+        self._served_queries: cache.TTLCache[bool] = served_queries
+        # A shared session keeps the connections to remote services alive
+        self._session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=federation_options.remote_concurrency,
+            pool_maxsize=federation_options.remote_concurrency
+        )
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=federation_options.remote_concurrency,
+            thread_name_prefix="remote_matching"
+        )
 
-    def get_all_matches(self):
+    def get_all_matches(
+            self,
+            limit: Optional[int] = None,
+            cursor: Optional[str] = None,
+            prefix: Optional[str] = None,
+            namespace: Optional[str] = None,
+            stream: bool = False
+    ):
         """
-        Returns all matches stored in the equivalence table-
+        Returns the matches stored in the equivalence table
+
+        Without parameters, all matches are returned as dict of the
+        `base_semantic_id` to its matches.
+
+        :param limit: If given, at most `limit` matches are returned as
+            :class:`service_model.MatchesPage`, whose `next_cursor` continues
+            with the next page
+        :param cursor: The `next_cursor` of the previous page
+        :param prefix: Only return matches whose `base_semantic_id` starts
+            with `prefix`
+        :param namespace: Only return matches whose `base_semantic_id` is in
+            the `namespace`, short for `prefix=namespace + "/"`
+        :param stream: If `True`, all matches from the `cursor` on are
+            streamed as NDJSON, one match per line, without building the
+            response in memory
         """
-        matches = self.equivalence_table.get_all_matches()
-        return matches
+        if namespace is not None:
+            prefix = namespace.rstrip("/") + "/"
+        position = self._parse_cursor(cursor)
+        if stream:
+            return StreamingResponse(
+                self._stream_matches(position, prefix),
+                media_type="application/x-ndjson"
+            )
+        if limit is None and cursor is None:
+            if prefix is None:
+                return self.equivalence_table.get_all_matches()
+            matches: Dict[str, List[model.SemanticMatch]] = {}
+            for _, match in self.equivalence_table.iter_semantic_matches(prefix=prefix):
+                matches.setdefault(match.base_semantic_id, []).append(match)
+            return matches
+        if limit is not None and limit < 1:
+            raise HTTPException(status_code=400, detail="limit must be positive")
+        page: List[model.SemanticMatch] = []
+        next_cursor: Optional[str] = None
+        matches_iterator = self.equivalence_table.iter_semantic_matches(position, prefix)
+        for next_position, match in matches_iterator:
+            page.append(match)
+            if limit is not None and len(page) == limit:
+                # Only return a cursor if there is another match
+                if next(matches_iterator, None) is not None:
+                    next_cursor = "{}:{}".format(*next_position)
+                break
+        return service_model.MatchesPage(matches=page, next_cursor=next_cursor)
+
+    def _stream_matches(self, position: Tuple[int, int], prefix: Optional[str]) -> Iterator[str]:
+        lines: List[str] = []
+        for _, match in self.equivalence_table.iter_semantic_matches(position, prefix):
+            lines.append(match.model_dump_json())
+            if len(lines) == self.STREAM_CHUNK_SIZE:
+                yield "\n".join(lines) + "\n"
+                lines = []
+        if lines:
+            yield "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _parse_cursor(cursor: Optional[str]) -> Tuple[int, int]:
+        if cursor is None:
+            return 0, 0
+        try:
+            base_index, row_index = (int(index) for index in cursor.split(":"))
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Invalid cursor {cursor}")
+        if base_index < 0 or row_index < 0:
+            raise HTTPException(status_code=400, detail=f"Invalid cursor {cursor}")
+        return base_index, row_index
+
+    def remove_matches_of(self, semantic_id: str) -> service_model.MatchesList:
+        """
+        Removes all matches from and to `semantic_id` and returns them
+        """
+        if self.writer_endpoint is not None:
+            return self._forward_to_writer("/remove_matches_of", params={"semantic_id": semantic_id})
+        with self._write_lock:
+            if self.mutation_log is not None:
+                removed = self.mutation_log.remove_semantic_matches_of(self.equivalence_table, semantic_id)
+            else:
+                removed = self.equivalence_table.remove_semantic_matches_of(semantic_id)
+            self._change_feed.append(self.equivalence_table.version, [wal.remove_record(match) for match in removed])
+        return service_model.MatchesList(matches=removed)
 
     def remove_all_matches(self):
-        self.equivalence_table.remove_all_semantic_matches()
+        if self.writer_endpoint is not None:
+            return self._forward_to_writer("/clear")
+        with self._write_lock:
+            if self.mutation_log is not None:
+                self.mutation_log.remove_all_semantic_matches(self.equivalence_table)
+            else:
+                self.equivalence_table.remove_all_semantic_matches()
+            self._change_feed.append(self.equivalence_table.version, [wal.clear_record()])
 
     def get_matches(
             self,
@@ -80,104 +528,972 @@ class SemanticMatchingService:
 
         Returns a matching score
         """
+        return self._get_matches([request_body])[0]
+
+    def get_matches_batch(
+            self,
+            request_body: service_model.MatchRequestBatch
+    ) -> service_model.MatchesListBatch:
+        """
+        Answers many :class:`service_model.MatchRequest`s at once.
+
+        Returns one :class:`service_model.MatchesList` per request, in the
+        order of the requests. The shortest `timeout` of the requests applies
+        to all of them.
+        """
+        return service_model.MatchesListBatch(results=self._get_matches(request_body.requests))
+
+    def get_matches_response(self, request_body: service_model.MatchRequest) -> Response:
+        """
+        Answers `/get_matches` like :func:`~.SemanticMatchingService.get_matches`, but encodes the response with the
+        :class:`encoding.MatchEncoder` instead of validating and encoding it with FastAPI
+        """
+        result = self.get_matches(request_body)
+        with metrics.stage("serialize"):
+            return Response(content=self._encoder.encode_matches_list(result), media_type="application/json")
+
+    def get_matches_batch_response(self, request_body: service_model.MatchRequestBatch) -> Response:
+        """
+        Answers `/get_matches_batch` like :func:`~.SemanticMatchingService.get_matches_batch`, see
+        :func:`~.SemanticMatchingService.get_matches_response`
+        """
+        result = self.get_matches_batch(request_body)
+        with metrics.stage("serialize"):
+            return Response(content=self._encoder.encode_matches_list_batch(result), media_type="application/json")
+
+    def post_matches(
+            self,
+            request_body: service_model.MatchesList
+    ) -> None:
+        if self.writer_endpoint is not None:
+            return self._forward_to_writer(
+                "/post_matches",
+                body=request_body.model_dump_json().encode(),
+                headers={"Content-Type": "application/json"}
+            )
+        try:
+            self._post_batcher.submit(request_body.matches)
+        except model.DuplicateMatchError as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        # Todo: Figure out how to properly return 200
+
+    async def post_matches_stream(self, request: Request) -> service_model.IngestResult:
+        """
+        Adds the matches of an NDJSON request body, one :class:`model.SemanticMatch` per line
+
+        The body is parsed while it is received and the matches are added in
+        batches of :attr:`~.SemanticMatchingService.INGEST_BATCH_SIZE`, so
+        that arbitrarily large sets of matches can be posted. Invalid lines and
+        lines rejected by the `update_policy` do not stop the ingest, but are
+        reported in the :class:`service_model.IngestResult`. If the request
+        fails, the batches added until then stay in the table.
+        """
+        if self.writer_endpoint is not None:
+            chunks = request.stream()
+
+            def body() -> Iterator[bytes]:
+                # Passes the request body on while it is received
+                while True:
+                    try:
+                        yield anyio.from_thread.run(chunks.__anext__)
+                    except StopAsyncIteration:
+                        return
+
+            return await run_in_threadpool(
+                self._forward_to_writer,
+                "/post_matches_stream",
+                body=body(),
+                headers={"Content-Type": request.headers.get("content-type", "application/x-ndjson")},
+                # The writer answers once it added the whole body
+                timeout=(self.remote_timeout, None)
+            )
+        result = service_model.IngestResult()
+        splitter = ingest.LineSplitter()
+        batch: List[Tuple[int, model.SemanticMatch]] = []
+        line_number = 0
+
+        async def add_lines(lines: List[bytes]) -> None:
+            nonlocal batch, line_number
+            for line in lines:
+                line_number += 1
+                if not line.strip():
+                    continue
+                result.num_lines += 1
+                try:
+                    batch.append((line_number, model.SemanticMatch.model_validate_json(line)))
+                except ValueError as e:
+                    result.add_error(line_number, str(e), self.INGEST_MAX_REPORTED_ERRORS)
+                if len(batch) == self.INGEST_BATCH_SIZE:
+                    await run_in_threadpool(self._ingest_batch, batch, result)
+                    batch = []
+
+        async for chunk in request.stream():
+            try:
+                lines = splitter.feed(chunk)
+            except ValueError as e:
+                raise HTTPException(status_code=413, detail=str(e))
+            await add_lines(lines)
+        await add_lines(splitter.close())
+        if batch:
+            await run_in_threadpool(self._ingest_batch, batch, result)
+        return result
+
+    def _ingest_batch(
+            self,
+            batch: List[Tuple[int, model.SemanticMatch]],
+            result: service_model.IngestResult
+    ) -> None:
+        try:
+            result.num_added += len(self._add_matches([match for _, match in batch]))
+        except model.DuplicateMatchError:
+            # Add the matches one by one to find the rejected lines
+            for line_number, match in batch:
+                try:
+                    result.num_added += len(self._add_matches([match]))
+                except model.DuplicateMatchError as e:
+                    result.add_error(line_number, str(e), self.INGEST_MAX_REPORTED_ERRORS)
+
+    def _add_matches(self, matches: List[model.SemanticMatch]) -> List[model.SemanticMatch]:
+        with self._write_lock:
+            if self.mutation_log is not None:
+                changed = self.mutation_log.add_semantic_matches(self.equivalence_table, matches, self.update_policy)
+            else:
+                changed = self.equivalence_table.add_semantic_matches(matches, self.update_policy)
+            self._change_feed.append(self.equivalence_table.version, [wal.add_record(match) for match in changed])
+        return changed
+
+    def _forward_to_writer(
+            self,
+            path: str,
+            params: Optional[Dict[str, str]] = None,
+            body=None,
+            headers: Optional[Dict[str, str]] = None,
+            timeout=None,
+            method: str = "POST"
+    ) -> Response:
+        """
+        Sends a change, or a request about changes, to the writer service and returns its response
+        """
+        try:
+            response = self._session.request(
+                method,
+                f"{self.writer_endpoint}{path}",
+                params=params,
+                data=body,
+                headers=headers,
+                timeout=timeout if timeout is not None else self.remote_timeout
+            )
+        except requests.RequestException as e:
+            raise HTTPException(status_code=503, detail=f"The writer service cannot be reached: {e}")
+        return Response(
+            content=response.content,
+            status_code=response.status_code,
+            media_type=response.headers.get("content-type")
+        )
+
+    def replace_equivalence_table(self, equivalences: model.AbstractEquivalenceTable) -> None:
+        """
+        Replaces the equivalence table, e.g. by the latest segment published by the writer service
+
+        Requests that already run finish with the previous table.
+        """
+        self.equivalence_table = equivalences
+        self._local_result_cache.clear()
+
+    def get_changes(
+            self,
+            since: Optional[int] = None,
+            epoch: Optional[str] = None,
+            limit: int = 10000
+    ):
+        """
+        Returns the changes of the equivalence table after the version `since`, see :class:`replication.ChangeFeed`
+
+        :param since: The `version` of the previous :class:`service_model.ChangesPage`. If `None`, only the current
+            version is returned, with `reset` set
+        :param epoch: The `epoch` of the previous :class:`service_model.ChangesPage`
+        :param limit: The maximal number of returned changes
+        """
+        if limit < 1:
+            raise HTTPException(status_code=400, detail="limit must be positive")
+        if self.writer_endpoint is not None:
+            params = {"limit": str(limit)}
+            if since is not None:
+                params["since"] = str(since)
+            if epoch is not None:
+                params["epoch"] = epoch
+            return self._forward_to_writer("/changes", params=params, method="GET")
+        return self._change_feed.changes_since(since, epoch, limit)
+
+    def _apply_posts(self, posts: List[List[model.SemanticMatch]]) -> List[None]:
+        """
+        Adds the matches of all `posts` at once, see :class:`batching.WriteBatcher`
+        """
+        self._add_matches([match for matches in posts for match in matches])
+        return [None] * len(posts)
+
+    def post_descriptions(self, request_body: service_model.DescriptionsList) -> None:
+        """
+        Adds or replaces the names and definitions of semantic IDs in the NLP index
+        """
+        if self.nlp_index is None:
+            raise HTTPException(status_code=400, detail="NLP matching is not enabled")
+        if self.writer_endpoint is not None:
+            # Each worker holds its own NLP index, which only the descriptions_file fills
+            raise HTTPException(status_code=400, detail="Descriptions cannot be posted to a worker")
+        for description in request_body.descriptions:
+            self.nlp_index.add(
+                description.semantic_id,
+                nlp.description_text(description.name, description.definition)
+            )
+
+    def _get_matches(
+            self,
+            match_requests: List[service_model.MatchRequest]
+    ) -> List[service_model.MatchesList]:
+        timeouts = [
+            request_body.timeout if request_body.timeout is not None else self.request_timeout
+            for request_body in match_requests
+        ]
+        timeouts = [timeout for timeout in timeouts if timeout is not None]
+        deadline = time.monotonic() + min(timeouts) if timeouts else None
         # Try first local matching
-        matches: List[model.SemanticMatch] = self.equivalence_table.get_local_matches(
-            semantic_id=request_body.semantic_id,
-            score_limit=request_body.score_limit
-        )
-        # If the request asks us to only locally look, we're done already
-        if request_body.local_only:
-            return service_model.MatchesList(matches=matches)
-        # Now look for remote matches:
-        additional_remote_matches: List[model.SemanticMatch] = []
-        for match in matches:
-            if match.base_semantic_id.split("/")[0] == match.match_semantic_id.split("/")[0]:
-                #match_id is local
+        with metrics.stage("local"):
+            local_matches = self._get_local_matches(match_requests)
+        # Semantic IDs without local matches fall back to NLP matching, these matches are not passed on
+        with metrics.stage("nlp"):
+            nlp_matches = self._get_nlp_matches(match_requests, local_matches)
+        # Now plan the remote requests of all requests that do not ask us to only locally look
+        remote_requests, consumers, truncated = self._plan_remote_requests(match_requests, local_matches)
+        remote_matches = self._get_remote_matches(remote_requests, deadline)
+        # Finally, put all matches together and return
+        cut_off_services: List[Dict[str, None]] = [{} for _ in match_requests]
+        # The scores of remote matches are relative to their remote semantic ID, so they are ranked by their score
+        # times the score of the local match to it. For matches that the remote service got from further services,
+        # this is an upper bound
+        combined_scores: List[Dict[Tuple[str, str], float]] = [{} for _ in match_requests]
+        extended = set()
+        for remote_consumers, remote_result in zip(consumers, remote_matches):
+            for index, score_limit, local_score in remote_consumers:
+                # Matches that the remote service got from further services are only filtered by this score limit,
+                # which is lower than theirs was, so a shared remote request may return a few more of them
+                for match in remote_result.matches:
+                    if match.score <= score_limit:
+                        continue
+                    local_matches[index].append(match)
+                    key = (match.base_semantic_id, match.match_semantic_id)
+                    combined_scores[index][key] = max(local_score * match.score, combined_scores[index].get(key, 0.))
+                cut_off_services[index].update(dict.fromkeys(remote_result.cut_off_services))
+                truncated[index] = truncated[index] or remote_result.truncated
+                extended.add(index)
+        for index in extended:
+            local_matches[index] = self._merge_matches(local_matches[index])
+        for matches, fallback_matches in zip(local_matches, nlp_matches):
+            matches.extend(fallback_matches)
+        for request_body, matches, scores in zip(match_requests, local_matches, combined_scores):
+            if request_body.max_results is not None and len(matches) > request_body.max_results:
+                matches.sort(
+                    key=lambda match: scores.get((match.base_semantic_id, match.match_semantic_id), match.score),
+                    reverse=True
+                )
+                del matches[request_body.max_results:]
+        return [
+            service_model.MatchesList(matches=matches, cut_off_services=list(cut_off), truncated=is_truncated)
+            for matches, cut_off, is_truncated in zip(local_matches, cut_off_services, truncated)
+        ]
+
+    def _plan_remote_requests(
+            self,
+            match_requests: List[service_model.MatchRequest],
+            local_matches: List[List[model.SemanticMatch]]
+    ) -> Tuple[List[service_model.MatchRequest], List[List[Tuple[int, float, float]]], List[bool]]:
+        """
+        Plans which remote requests the local matches of the `match_requests` need
+
+        Only the best local match to each remote semantic ID is followed, and
+        only if its score leaves room for a remote match above the
+        `score_limit`. Requests of the batch that would ask the same remote
+        semantic ID with the same parameters share one remote request with the
+        lowest of their score limits.
+
+        :returns: The remote requests and, for each of them, the indices of the
+            `match_requests` that need its matches, together with the score
+            limit that their remote matches need to exceed and the score of
+            their local match to the remote semantic ID. Finally, for each
+            of the `match_requests`, whether remote requests that it needs
+            are left out to bound the federated query
+        """
+        planned: Dict[Tuple, Tuple[Dict, List[Tuple[int, float, float]]]] = {}
+        truncated = [False for _ in match_requests]
+        for index, (request_body, matches) in enumerate(zip(match_requests, local_matches)):
+            if request_body.local_only:
+                continue
+            # With `max_results`, remote matches need to beat the worst local match that is returned
+            score_limit = request_body.score_limit
+            if request_body.max_results is not None and len(matches) >= request_body.max_results:
+                score_limit = max(score_limit, matches[request_body.max_results - 1].score)
+            # The best score of a local match to each remote semantic ID
+            best_scores: Dict[str, float] = {}
+            for match in matches:
+                if match.base_semantic_id.split("/")[0] == match.match_semantic_id.split("/")[0]:
+                    # match_id is local
+                    continue
+                if match.score <= score_limit:
+                    # Even a remote score of 1. would not make score(A->B) * score(B->C) beat the score_limit
+                    continue
+                if match.score > best_scores.get(match.match_semantic_id, 0.):
+                    best_scores[match.match_semantic_id] = match.score
+            if not best_scores:
                 continue
-            remote_matching_service = self._get_matcher_from_semantic_id(match.match_semantic_id)
-            if remote_matching_service is None:
+            # Each service passes a federated query on at most `max_hops` times
+            # and only once per semantic ID, direction and `max_results`, so
+            # that services whose tables point into each other's namespaces do
+            # not request each other forever
+            query_id = request_body.query_id or uuid.uuid4().hex
+            max_hops = request_body.max_hops if request_body.max_hops is not None else self.max_federation_hops
+            served_query = (query_id, request_body.semantic_id, request_body.direction, request_body.max_results)
+            if max_hops <= 0 or not self._served_queries.put_if_absent(served_query, True):
+                truncated[index] = True
                 continue
-            remote_matching_request = service_model.MatchRequest(
-                semantic_id=match.match_semantic_id,
+            visited_services = request_body.visited_services + [self.endpoint]
+            for semantic_id, score in best_scores.items():
                 # This is a simple "Ungleichung"
                 # Unified score is multiplied: score(A->B) * score(B->C)
                 # This score should be larger or equal than the requested score_limit:
                 # score(A->B) * score(B->C) >= score_limit
                 # score(A->B) is well known, as it is the `match.score`
                 # => score(B->C) >= (score_limit/score(A->B))
-                score_limit=float(request_body.score_limit/match.score),
-                # If we already request a remote score, it does not make sense to choose `local_only`
-                local_only=False,
-                name=request_body.name,
-                definition=request_body.definition
+                remote_score_limit = float(score_limit / score)
+                key = (
+                    semantic_id,
+                    request_body.direction,
+                    request_body.max_results,
+                    request_body.name,
+                    request_body.definition,
+                    max_hops - 1,
+                    tuple(visited_services)
+                )
+                if key not in planned:
+                    planned[key] = ({
+                        "semantic_id": semantic_id,
+                        "score_limit": remote_score_limit,
+                        # If we already request a remote score, it does not make sense to choose `local_only`
+                        "local_only": False,
+                        "name": request_body.name,
+                        "definition": request_body.definition,
+                        "query_id": query_id,
+                        "visited_services": visited_services,
+                        "max_hops": max_hops - 1,
+                        "direction": request_body.direction,
+                        "max_results": request_body.max_results,
+                    }, [])
+                fields, remote_consumers = planned[key]
+                fields["score_limit"] = min(fields["score_limit"], remote_score_limit)
+                remote_consumers.append((index, remote_score_limit, score))
+        return (
+            [service_model.MatchRequest(**fields) for fields, _ in planned.values()],
+            [remote_consumers for _, remote_consumers in planned.values()],
+            truncated
+        )
+
+    @staticmethod
+    def _merge_matches(matches: List[model.SemanticMatch]) -> List[model.SemanticMatch]:
+        """
+        Keeps the match with the best score of each pair of `base_semantic_id` and `match_semantic_id`, e.g. if
+        several remote services returned matches of the same semantic ID, in the order of their first occurrence
+        """
+        best: Dict[Tuple[str, str], model.SemanticMatch] = {}
+        for match in matches:
+            key = (match.base_semantic_id, match.match_semantic_id)
+            existing = best.get(key)
+            if existing is None or match.score > existing.score:
+                best[key] = match
+        return list(best.values())
+
+    def _get_nlp_matches(
+            self,
+            match_requests: List[service_model.MatchRequest],
+            local_matches: List[List[model.SemanticMatch]]
+    ) -> List[List[model.SemanticMatch]]:
+        """
+        Returns the NLP matches of each request without local matches that has
+        a `name` or `definition`. All of them are queried as one batch.
+        """
+        nlp_matches: List[List[model.SemanticMatch]] = [[] for _ in match_requests]
+        if self.nlp_index is None:
+            return nlp_matches
+        indices = [
+            index for index, (request_body, matches) in enumerate(zip(match_requests, local_matches))
+            if not matches and (request_body.name or request_body.definition)
+        ]
+        if not indices:
+            return nlp_matches
+
+        def max_results(request_body: service_model.MatchRequest) -> int:
+            if request_body.max_results is None:
+                return self.nlp_max_results
+            return min(request_body.max_results, self.nlp_max_results)
+
+        results = self.nlp_index.query_batch(
+            [nlp.description_text(match_requests[index].name, match_requests[index].definition) for index in indices],
+            score_limit=min(match_requests[index].score_limit for index in indices),
+            # One more, as a request may find its own semantic ID
+            max_results=max(max_results(match_requests[index]) for index in indices) + 1
+        )
+        for index, result in zip(indices, results):
+            request_body = match_requests[index]
+            nlp_matches[index] = [
+                model.SemanticMatch(
+                    base_semantic_id=request_body.semantic_id,
+                    match_semantic_id=semantic_id,
+                    score=similarity,
+                    meta_information={"matchSource": "NLP", "method": nlp.METHOD}
+                )
+                for semantic_id, similarity in result
+                if semantic_id != request_body.semantic_id and similarity > request_body.score_limit
+            ][:max_results(request_body)]
+        return nlp_matches
+
+    def _get_local_matches(
+            self,
+            match_requests: List[service_model.MatchRequest]
+    ) -> List[List[model.SemanticMatch]]:
+        """
+        Returns the local matches of each request. Each semantic ID is only
+        traversed once per direction and `max_results`, with the lowest
+        `score_limit` of all requests for it.
+
+        The best `max_results` matches above a `score_limit` that are also
+        above a higher `score_limit` are the best `max_results` matches above
+        the higher one, so the results of top-k requests can be filtered
+        like complete ones.
+        """
+        score_limits: Dict[Tuple[str, model.Direction, Optional[int]], float] = {}
+        for request_body in match_requests:
+            key = (request_body.semantic_id, request_body.direction, request_body.max_results)
+            score_limits[key] = min(request_body.score_limit, score_limits.get(key, request_body.score_limit))
+        local_matches = {
+            key: self._get_local_matches_of(*key, score_limit)
+            for key, score_limit in score_limits.items()
+        }
+        return [
+            [
+                match
+                for match in local_matches[
+                    (request_body.semantic_id, request_body.direction, request_body.max_results)
+                ]
+                if match.score > request_body.score_limit
+            ]
+            for request_body in match_requests
+        ]
+
+    def _get_local_matches_of(
+            self,
+            semantic_id: str,
+            direction: model.Direction,
+            max_results: Optional[int],
+            score_limit: float
+    ) -> List[model.SemanticMatch]:
+        """
+        Returns the local matches of `semantic_id`, from the `local_result_cache`
+        if it holds a result computed from the current version of the
+        equivalence table
+        """
+        key = (semantic_id, direction, max_results)
+        # The version alone does not tell apart tables that replaced each other
+        table = self.equivalence_table
+        version = table.version
+        matches = self._local_result_cache.get(
+            key,
+            score_limit,
+            lambda tag: tag[0] is self.equivalence_table and tag[1] == self.equivalence_table.version
+        )
+        if matches is None:
+            matches = table.get_local_matches(
+                semantic_id=semantic_id,
+                score_limit=score_limit,
+                direction=direction,
+                max_results=max_results
             )
-            url = f"{remote_matching_service}/get_matches"
-            new_matches_response = requests.get(url, json=remote_matching_request.model_dump_json())
-            match_response = service_model.MatchesList.model_validate_json(new_matches_response.text)
-            additional_remote_matches.extend(match_response.matches)
-        # Finally, put all matches together and return
-        matches.extend(additional_remote_matches)
-        res = service_model.MatchesList(matches=matches)
-        return res
+            self._local_result_cache.put(key, score_limit, (table, version), matches)
+        return matches
 
-    def post_matches(
+    def _get_remote_matches(
             self,
-            request_body: service_model.MatchesList
-    ) -> None:
-        for match in request_body.matches:
-            self.equivalence_table.add_semantic_match(match)
-        # Todo: Figure out how to properly return 200
+            remote_requests: List[service_model.MatchRequest],
+            deadline: Optional[float] = None
+    ) -> List[service_model.MatchesList]:
+        """
+        Sends the `remote_requests` to the remote `SemanticMatchingService`s
+        responsible for their semantic IDs and returns their matches, in the
+        order of the `remote_requests`.
+
+        Requests that a :class:`replication.Replica` can answer are not sent.
+        All requests to the same remote service are sent as one batch. The
+        resolver and the remote services are requested concurrently.
+
+        If the `time.monotonic` `deadline` passes, the matches that did not
+        arrive yet are left out and the remote services they were requested
+        from are listed in the `cut_off_services` of their results, or
+        `"resolver"` if their remote service was not resolved in time.
+        Requests to services that were already visited are not sent and their
+        results are `truncated`.
+        """
+        if not remote_requests:
+            return []
+        remote_results: List[Optional[service_model.MatchesList]] = []
+        for remote_request in remote_requests:
+            matches = self._remote_result_cache.get(
+                self._remote_result_cache_key(remote_request),
+                remote_request.score_limit,
+                lambda expires: expires > time.monotonic()
+            )
+            remote_results.append(None if matches is None else service_model.MatchesList(matches=matches))
+        for index, remote_request in enumerate(remote_requests):
+            replica = self._replicas_by_namespace.get(remote_request.semantic_id.split("/")[0])
+            if remote_results[index] is not None or replica is None:
+                continue
+            if replica.endpoint in remote_request.visited_services:
+                remote_results[index] = service_model.MatchesList(matches=[], truncated=True)
+                continue
+            matches = replica.get_local_matches(remote_request)
+            if matches is not None:
+                metrics.REMOTE_REQUESTS.inc(1., "replica")
+                remote_results[index] = service_model.MatchesList(matches=matches)
+        uncached = [index for index, result in enumerate(remote_results) if result is None]
+        semantic_ids = list(dict.fromkeys(remote_requests[index].semantic_id for index in uncached))
+        with metrics.stage("resolver"):
+            # The resolver requests read the deadline from their copy of the context
+            token = _resolver_deadline.set(deadline)
+            try:
+                resolver_futures = {
+                    semantic_id: self._executor.submit(
+                        contextvars.copy_context().run,
+                        self._get_matcher_from_semantic_id,
+                        semantic_id
+                    )
+                    for semantic_id in semantic_ids
+                }
+            finally:
+                _resolver_deadline.reset(token)
+            concurrent.futures.wait(resolver_futures.values(), timeout=_time_left(deadline))
+        batches: Dict[str, List[int]] = {}
+        for index in uncached:
+            resolver_future = resolver_futures[remote_requests[index].semantic_id]
+            if not resolver_future.done():
+                remote_results[index] = service_model.MatchesList(matches=[], cut_off_services=["resolver"])
+                continue
+            endpoint = resolver_future.result()
+            if endpoint in remote_requests[index].visited_services:
+                remote_results[index] = service_model.MatchesList(matches=[], truncated=True)
+            elif endpoint is not None:
+                batches.setdefault(endpoint, []).append(index)
+        with metrics.stage("remote"):
+            futures = {
+                endpoint: self._executor.submit(
+                    self._request_remote_service,
+                    endpoint,
+                    [remote_requests[index] for index in indices],
+                    deadline
+                )
+                for endpoint, indices in batches.items()
+            }
+            concurrent.futures.wait(futures.values(), timeout=_time_left(deadline))
+            for endpoint, indices in batches.items():
+                future = futures[endpoint]
+                if future.done():
+                    results = future.result()
+                else:
+                    # The answer is not waited for, but is still cached if it arrives
+                    future.cancel()
+                    metrics.REMOTE_REQUESTS.inc(1., "cut_off")
+                    results = [
+                        service_model.MatchesList(matches=[], cut_off_services=[endpoint]) for _ in indices
+                    ]
+                for index, result in zip(indices, results):
+                    remote_results[index] = result
+        return [
+            result if result is not None else service_model.MatchesList(matches=[])
+            for result in remote_results
+        ]
+
+    def _request_remote_service(
+            self,
+            remote_matching_service: str,
+            remote_requests: List[service_model.MatchRequest],
+            deadline: Optional[float] = None
+    ) -> List[service_model.MatchesList]:
+        """
+        Requests the matches of all `remote_requests` from one remote
+        `SemanticMatchingService`, as a batch if there is more than one.
+
+        The remote service is given the time left until the `deadline`, less
+        the `deadline_margin`, as `timeout`.
 
-    def _get_matcher_from_semantic_id(self, semantic_id: str) -> str:
+        If the remote service does not answer within `remote_timeout` or
+        answers with an error, no matches are returned. If it does not answer
+        before the `deadline`, is skipped by the `circuit_breaker` or the
+        time left is too short to ask it, it is listed in the
+        `cut_off_services` of the results.
+        """
+        def cut_off(outcome: str) -> List[service_model.MatchesList]:
+            metrics.REMOTE_REQUESTS.inc(1., outcome)
+            return [
+                service_model.MatchesList(matches=[], cut_off_services=[remote_matching_service])
+                for _ in remote_requests
+            ]
+
+        timeout = self.remote_timeout
+        time_left = _time_left(deadline)
+        if time_left is not None:
+            if time_left <= self.deadline_margin:
+                return cut_off("cut_off")
+            timeout = min(timeout, time_left)
+            remote_requests = [
+                remote_request.model_copy(update={"timeout": time_left - self.deadline_margin})
+                for remote_request in remote_requests
+            ]
+        if not self.circuit_breaker.allow(remote_matching_service):
+            return cut_off("circuit_open")
+        if len(remote_requests) == 1:
+            url = f"{remote_matching_service}/get_matches"
+            body = remote_requests[0].model_dump()
+        else:
+            url = f"{remote_matching_service}/get_matches_batch"
+            body = service_model.MatchRequestBatch(requests=remote_requests).model_dump()
+        try:
+            new_matches_response = self._session.get(url, json=body, timeout=timeout)
+        except requests.Timeout:
+            if timeout < self.remote_timeout:
+                # Only too slow for this request, which does not make the remote service slow
+                return cut_off("cut_off")
+            self.circuit_breaker.record_failure(remote_matching_service)
+            return cut_off("timeout")
+        except requests.RequestException:
+            self.circuit_breaker.record_failure(remote_matching_service)
+            metrics.REMOTE_REQUESTS.inc(1., "error")
+            return [service_model.MatchesList(matches=[]) for _ in remote_requests]
+        if new_matches_response.status_code != 200:
+            self.circuit_breaker.record_failure(remote_matching_service)
+            metrics.REMOTE_REQUESTS.inc(1., "error")
+            return [service_model.MatchesList(matches=[]) for _ in remote_requests]
+        self.circuit_breaker.record_success(remote_matching_service)
+        metrics.REMOTE_REQUESTS.inc(1., "ok")
+        trusted = remote_matching_service in self.trusted_peers
+        if len(remote_requests) == 1:
+            results = [encoding.parse_matches_list(new_matches_response.text, trusted)]
+        else:
+            results = encoding.parse_matches_list_batch(new_matches_response.text, trusted).results
+        expires = time.monotonic() + self.remote_result_ttl
+        for remote_request, result in zip(remote_requests, results):
+            if result.cut_off_services or result.truncated:
+                # Incomplete results are asked for again, their completeness may depend on the hops and services
+                # of the query, which are not part of the cache key
+                continue
+            self._remote_result_cache.put(
+                self._remote_result_cache_key(remote_request),
+                remote_request.score_limit,
+                expires,
+                result.matches
+            )
+        return results
+
+    @staticmethod
+    def _remote_result_cache_key(remote_request: service_model.MatchRequest) -> Tuple:
+        return (
+            remote_request.semantic_id,
+            remote_request.direction,
+            remote_request.max_results,
+            remote_request.name,
+            remote_request.definition
+        )
+
+    def get_cache_stats(self) -> Dict[str, Dict[str, float]]:
+        """
+        Returns the size, hit and miss counters of the caches of this service
+        """
+        return {
+            "resolver": self._resolver_cache.stats(),
+            "local_results": self._local_result_cache.stats(),
+            "remote_results": self._remote_result_cache.stats(),
+            "encodings": self._encoder.stats(),
+        }
+
+    def get_metrics(self) -> Response:
+        """
+        Returns the metrics of this process in the Prometheus text format
+
+        Next to the metrics of :mod:`metrics`, these are the size and
+        estimated memory of the equivalence table and the statistics of the
+        caches. In a multi-process deployment, each worker reports its own
+        metrics.
+        """
+        table_stats = self.equivalence_table.stats()
+        self._table_matches.set(table_stats["matches"])
+        self._table_bytes.set(table_stats["approximate_bytes"])
+        self._table_version.set(self.equivalence_table.version)
+        for cache_name, stats in self.get_cache_stats().items():
+            self._cache_entries.set(stats["size"], cache_name)
+            self._cache_hits.set_total(stats["hits"], cache_name)
+            self._cache_misses.set_total(stats["misses"], cache_name)
+        self._write_batches.set_total(self._post_batcher.num_batches)
+        self._write_batch_items.set_total(self._post_batcher.num_items)
+        self._open_circuits.set(len(self.circuit_breaker.open_circuits()))
+        for replica in self.replicas:
+            if replica.version is not None:
+                self._replica_versions.set(replica.version, replica.endpoint)
+        return Response(
+            content=metrics.REGISTRY.render() + self._metrics.render(),
+            media_type=metrics.CONTENT_TYPE
+        )
+
+    def _get_matcher_from_semantic_id(self, semantic_id: str) -> Optional[str]:
         """
         Finds the suiting `SemanticMatchingService` for the given `semantic_id`.
 
+        The answers of the resolver are cached per namespace (or per
+        `semantic_id`, depending on `resolver_cache_key`).
+
         :returns: The endpoint with which the `SemanticMatchingService` can be accessed
         """
+        if self.resolver_cache_key == "namespace":
+            key = semantic_id.split("/")[0]
+        else:
+            key = semantic_id
+        try:
+            return self._resolver_cache.get_or_load(key, lambda: self._request_resolver(semantic_id))
+        except requests.RequestException:
+            return None
+
+    def _request_resolver(self, semantic_id: str) -> Optional[str]:
+        """
+        Asks the resolver for the `SemanticMatchingService` of `semantic_id`
+
+        :returns: The endpoint of the `SemanticMatchingService`, or `None` if
+            the resolver does not know one
+        :raises requests.RequestException: If the resolver cannot be reached
+            before the deadline of the match requests it is asked for
+        """
         request_body = {"semantic_id": semantic_id}
-        endpoint = config['RESOLVER']['endpoint']
-        port = config['RESOLVER'].getint('port')
-        url = f"{endpoint}:{port}/get_semantic_matching_service"
-        response = requests.get(url, json=request_body)
+        resolver_endpoint = self.resolver_endpoint
+        if resolver_endpoint is None:
+            resolver_endpoint = f"{config['RESOLVER']['endpoint']}:{config['RESOLVER'].getint('port')}"
+        url = f"{resolver_endpoint}/get_semantic_matching_service"
+        timeout = self.remote_timeout
+        time_left = _time_left(_resolver_deadline.get())
+        if time_left is not None:
+            if time_left <= 0.:
+                raise requests.Timeout("The deadline of the match requests passed")
+            timeout = min(timeout, time_left)
+        try:
+            response = self._session.get(url, json=request_body, timeout=timeout)
+        except requests.RequestException:
+            metrics.RESOLVER_REQUESTS.inc(1., "error")
+            raise
 
         # Check if the response is successful (status code 200)
         if response.status_code == 200:
+            metrics.RESOLVER_REQUESTS.inc(1., "ok")
             # Parse the JSON response and construct SMSResponse object
             response_json = response.json()
             response_endpoint = response_json['semantic_matching_service_endpoint']
             return response_endpoint
 
+        metrics.RESOLVER_REQUESTS.inc(1., "not_found")
         return None
 
 
-if __name__ == '__main__':
-    import os
-    import configparser
-    from fastapi import FastAPI
-    import uvicorn
-
+def read_config() -> configparser.ConfigParser:
+    """
+    Reads the `config.ini.default`, overridden by the `config.ini` next to it
+    """
     config = configparser.ConfigParser()
     config.read([
         os.path.abspath(os.path.join(os.path.dirname(__file__), "../config.ini.default")),
         os.path.abspath(os.path.join(os.path.dirname(__file__), "../config.ini")),
     ])
+    return config
 
-    # Read in equivalence table
-    # Note, this construct takes the path in the config.ini relative to the
-    # location of the config.ini
-    EQUIVALENCES = model.EquivalenceTable.from_file(
-        filename=os.path.abspath(os.path.join(
-            os.path.dirname(__file__),
-            "..",
-            config["SERVICE"]["equivalence_table_file"]
-        ))
-    )
-    SEMANTIC_MATCHING_SERVICE = SemanticMatchingService(
-        endpoint=config["SERVICE"]["endpoint"],
-        equivalences=EQUIVALENCES
+
+def relative_to_config(filename: str) -> str:
+    """
+    Returns the absolute path of a `filename` that is given relative to the location of the config.ini
+    """
+    return os.path.abspath(os.path.join(os.path.dirname(__file__), "..", filename))
+
+
+TABLE_BACKENDS = {
+    "dict": model.EquivalenceTable,
+    "compact": compact.CompactEquivalenceTable,
+}
+
+
+def load_equivalence_table(
+        config: configparser.ConfigParser
+) -> Tuple[model.AbstractEquivalenceTable, Optional[wal.MutationLog]]:
+    """
+    Loads the equivalence table of the `config`, and the :class:`wal.MutationLog` if persistence is configured
+
+    If the `equivalence_table_file` is a directory, it is opened as
+    :class:`partitioned.PartitionedEquivalenceTable`, without loading any partition.
+    """
+    equivalence_table_file = relative_to_config(config["SERVICE"]["equivalence_table_file"])
+    is_partitioned = os.path.isdir(equivalence_table_file)
+    mutation_log = None
+    if config.has_section("PERSISTENCE") and config["PERSISTENCE"].get("log_file"):
+        snapshot_file = relative_to_config(config["PERSISTENCE"]["snapshot_file"])
+        # Once changes were made durable, the latest snapshot replaces the initial equivalence table. Partitioned
+        # tables write their changes to their own directory instead
+        if os.path.exists(snapshot_file) and not is_partitioned:
+            equivalence_table_file = snapshot_file
+        mutation_log = wal.MutationLog(
+            filename=relative_to_config(config["PERSISTENCE"]["log_file"]),
+            snapshot_file=snapshot_file,
+            fsync=config["PERSISTENCE"].getboolean("fsync", fallback=True)
+        )
+    if is_partitioned:
+        equivalences = partitioned.PartitionedEquivalenceTable(
+            equivalence_table_file,
+            backend=TABLE_BACKENDS[config["SERVICE"].get("table_backend", "dict")],
+            max_bytes=(
+                config["SERVICE"].getint("partition_memory_limit")
+                if config["SERVICE"].get("partition_memory_limit") else None
+            ),
+            partition_format=config["SERVICE"].get("partition_format", "snapshot")
+        )
+    elif equivalence_table_file.endswith(snapshot.SUFFIX):
+        # Snapshots are memory-mapped and always use the compact backend
+        equivalences = snapshot.load(equivalence_table_file)
+    else:
+        equivalences = TABLE_BACKENDS[config["SERVICE"].get("table_backend", "dict")].from_file(
+            filename=equivalence_table_file
+        )
+    if mutation_log is not None:
+        mutation_log.replay(equivalences)
+        mutation_log.start_compaction(
+            equivalences,
+            interval=config["PERSISTENCE"].getfloat("compaction_interval", fallback=300.)
+        )
+    enable_closure_index(config, equivalences)
+    return equivalences, mutation_log
+
+
+def enable_closure_index(config: configparser.ConfigParser, equivalences: model.AbstractEquivalenceTable) -> None:
+    """
+    Enables the closure index of `equivalences`, if the `config` sets a `closure_index_floor`
+    """
+    if config["SERVICE"].get("closure_index_floor"):
+        equivalences.enable_closure_index(
+            floor_score=config["SERVICE"].getfloat("closure_index_floor"),
+            precompute=config["SERVICE"].getboolean("closure_index_precompute", fallback=False)
+        )
+
+
+def create_service(
+        config: configparser.ConfigParser,
+        equivalences: model.AbstractEquivalenceTable,
+        mutation_log: Optional[wal.MutationLog] = None,
+        worker_options: WorkerOptions = WorkerOptions()
+) -> SemanticMatchingService:
+    """
+    Creates the :class:`~.SemanticMatchingService` of the `config` for `equivalences`
+
+    :param mutation_log: See :class:`~.PersistenceOptions`
+    :param worker_options: The role of the service in a multi-process deployment, which :mod:`workers` assigns
+    """
+    service_config = config["SERVICE"]
+    nlp_options = NLPOptions()
+    if config.has_section("NLP") and config["NLP"].get("descriptions_file"):
+        nlp_options = NLPOptions(
+            index=nlp.NgramIndex.from_file(
+                relative_to_config(config["NLP"]["descriptions_file"]),
+                n=config["NLP"].getint("ngram_size", fallback=3),
+                max_column_length=config["NLP"].getint("max_column_length", fallback=50000)
+            ),
+            max_results=config["NLP"].getint("max_results", fallback=10)
+        )
+    replication_options = ReplicationOptions()
+    if config.has_section("REPLICATION"):
+        replicas = []
+        # One "endpoint namespace..." per line
+        for line in config["REPLICATION"].get("follow", "").splitlines():
+            if line.strip():
+                endpoint, *namespaces = line.split()
+                replicas.append(replication.Replica(
+                    endpoint,
+                    namespaces,
+                    timeout=service_config.getfloat("remote_timeout", fallback=5.)
+                ))
+        replication_options = ReplicationOptions(
+            replicas=tuple(replicas),
+            interval=config["REPLICATION"].getfloat("interval", fallback=5.),
+            change_feed_size=config["REPLICATION"].getint("change_feed_size", fallback=100000)
+        )
+    return SemanticMatchingService(
+        endpoint=service_config["endpoint"],
+        equivalences=equivalences,
+        update_policy=model.UpdatePolicy(service_config.get("update_policy", "replace")),
+        federation_options=FederationOptions(
+            remote_concurrency=service_config.getint("remote_concurrency", fallback=16),
+            remote_timeout=service_config.getfloat("remote_timeout", fallback=5.),
+            max_federation_hops=service_config.getint("max_federation_hops", fallback=5),
+            request_timeout=(
+                service_config.getfloat("request_timeout") if service_config.get("request_timeout") else None
+            ),
+            deadline_margin=service_config.getfloat("deadline_margin", fallback=0.05),
+            resolver_endpoint=f"{config['RESOLVER']['endpoint']}:{config['RESOLVER'].getint('port')}",
+            trusted_peers=tuple(service_config.get("trusted_peers", "").split()),
+            circuit_breaker=circuit.CircuitBreaker(
+                failure_threshold=service_config.getint("circuit_failure_threshold", fallback=5),
+                reset_timeout=service_config.getfloat("circuit_reset_timeout", fallback=30.)
+            )
+        ),
+        cache_options=CacheOptions(
+            resolver_cache=cache.TTLCache(
+                maxsize=config["RESOLVER"].getint("cache_size", fallback=10000),
+                ttl=config["RESOLVER"].getfloat("cache_ttl", fallback=3600.),
+                negative_ttl=config["RESOLVER"].getfloat("cache_negative_ttl", fallback=60.)
+            ),
+            resolver_cache_key=config["RESOLVER"].get("cache_key", "namespace"),
+            result_cache_size=service_config.getint("result_cache_size", fallback=10000),
+            remote_result_ttl=service_config.getfloat("remote_result_ttl", fallback=60.),
+            encoding_cache_size=service_config.getint("encoding_cache_size", fallback=100000),
+            served_queries=cache.TTLCache(
+                maxsize=service_config.getint("served_queries_cache_size", fallback=100000),
+                ttl=service_config.getfloat("served_queries_ttl", fallback=300.),
+                negative_ttl=service_config.getfloat("served_queries_ttl", fallback=300.)
+            )
+        ),
+        persistence_options=PersistenceOptions(
+            mutation_log=mutation_log,
+            write_batch_window=service_config.getfloat("write_batch_window", fallback=0.001)
+        ),
+        worker_options=worker_options,
+        replication_options=replication_options,
+        nlp_options=nlp_options
     )
-    APP = FastAPI()
-    APP.include_router(
-        SEMANTIC_MATCHING_SERVICE.router
+
+
+def create_app(semantic_matching_service: SemanticMatchingService) -> FastAPI:
+    app = FastAPI()
+    app.include_router(
+        semantic_matching_service.router
     )
-    uvicorn.run(APP, host=config["SERVICE"]["LISTEN_ADDRESS"], port=int(config["SERVICE"]["PORT"]))
+    return app
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    config = read_config()
+    EQUIVALENCES, MUTATION_LOG = load_equivalence_table(config)
+    if config.has_section("WORKERS") and config["WORKERS"].getint("num_workers", fallback=1) > 1:
+        from semantic_matcher import workers
+        workers.serve(config, EQUIVALENCES, MUTATION_LOG)
+    else:
+        SEMANTIC_MATCHING_SERVICE = create_service(config, EQUIVALENCES, mutation_log=MUTATION_LOG)
+        uvicorn.run(
+            create_app(SEMANTIC_MATCHING_SERVICE),
+            host=config["SERVICE"]["LISTEN_ADDRESS"],
+            port=int(config["SERVICE"]["PORT"])
+        )
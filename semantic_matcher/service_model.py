@@ -1,6 +1,6 @@
-from typing import Optional, List
+from typing import Dict, Optional, List
 
-from pydantic import BaseModel
+from pydantic import BaseModel, PositiveFloat, PositiveInt
 
 from semantic_matcher import model
 
@@ -13,13 +13,138 @@ class MatchRequest(BaseModel):
     :ivar local_only: If `True`, only check at the local service and do not request other services
     :ivar name: Optional name of the resolved semantic ID for NLP matching
     :ivar definition: Optional definition of the resolved semantic ID for NLP matching
+    :ivar query_id: Identifies all requests that services send to each other to answer the same client request.
+        Set by the first service, clients do not need to set it
+    :ivar visited_services: The endpoints of the services that already worked on this query, these are not requested
+        again
+    :ivar max_hops: How many more times the request may be passed on to remote services. If `None`, the default of
+        the requested service is used
+    :ivar direction: Whether matches from the `semantic_id`, to it or both are followed, see :class:`model.Direction`
+    :ivar max_results: If given, only the best `max_results` matches are returned. Remote services are only
+        requested if their matches can be among them
+    :ivar timeout: The time in seconds within which the answer is needed. Remote services and the resolver are only
+        given what is left of it. If it runs out, the matches received until then are returned and the remote
+        services that did not answer are listed in :attr:`MatchesList.cut_off_services`
     """
     semantic_id: str
     score_limit: float
     local_only: bool = True
     name: Optional[str] = None
     definition: Optional[str] = None
+    query_id: Optional[str] = None
+    visited_services: List[str] = []
+    max_hops: Optional[int] = None
+    direction: model.Direction = model.Direction.OUTBOUND
+    max_results: Optional[PositiveInt] = None
+    timeout: Optional[PositiveFloat] = None
 
 
 class MatchesList(BaseModel):
+    """
+    :ivar matches: The matches
+    :ivar cut_off_services: The endpoints of the remote services, or `"resolver"`, whose matches are missing, as they
+        did not answer in time or are skipped after failing repeatedly. Left out of responses if empty
+    :ivar truncated: `True` if matches of remote services are missing, as the federated query was not passed on to
+        them because it ran out of hops, was already served by a service or already visited them. Left out of
+        responses if `False`
+    """
+    matches: List[model.SemanticMatch]
+    cut_off_services: List[str] = []
+    truncated: bool = False
+
+
+class MatchRequestBatch(BaseModel):
+    """
+    Request body for the :func:`service.SemanticMatchingService.get_matches_batch`
+
+    :ivar requests: The :class:`~.MatchRequest`s that are answered together
+    """
+    requests: List[MatchRequest]
+
+
+class MatchesListBatch(BaseModel):
+    """
+    Response of the :func:`service.SemanticMatchingService.get_matches_batch`
+
+    :ivar results: One :class:`~.MatchesList` per request, in the order of the requests
+    """
+    results: List[MatchesList]
+
+
+class MatchesPage(BaseModel):
+    """
+    Response of the :func:`service.SemanticMatchingService.get_all_matches` if a `limit` or `cursor` is given
+
+    :ivar matches: The matches of this page
+    :ivar next_cursor: The `cursor` of the next page, `None` if this is the last page
+    """
     matches: List[model.SemanticMatch]
+    next_cursor: Optional[str] = None
+
+
+class ChangesPage(BaseModel):
+    """
+    Response of the :func:`service.SemanticMatchingService.get_changes`
+
+    :ivar epoch: Identifies the history of the equivalence table. Versions of different epochs, e.g. from before a
+        restart of the service, cannot be compared
+    :ivar version: The version of the equivalence table after the returned changes
+    :ivar changes: The changes after the requested version, as records of a :class:`wal.MutationLog`, each with the
+        `version` of the table after it
+    :ivar reset: If `True`, the changes after the requested version are not known anymore. The follower needs to load
+        all matches again and can follow the changes after `version` from then on
+    :ivar has_more: Whether there are further changes after `version`
+    """
+    epoch: str
+    version: int
+    changes: List[Dict] = []
+    reset: bool = False
+    has_more: bool = False
+
+
+class IngestError(BaseModel):
+    """
+    A line of a streaming ingest that was not added
+
+    :ivar line: The number of the line, starting at 1
+    :ivar error: Why the line was not added
+    """
+    line: int
+    error: str
+
+
+class IngestResult(BaseModel):
+    """
+    Response of the :func:`service.SemanticMatchingService.post_matches_stream`
+
+    :ivar num_lines: The number of non-empty lines
+    :ivar num_added: The number of matches that changed the equivalence table
+    :ivar num_errors: The number of lines that were not added
+    :ivar errors: The first of these lines
+    """
+    num_lines: int = 0
+    num_added: int = 0
+    num_errors: int = 0
+    errors: List[IngestError] = []
+
+    def add_error(self, line: int, error: str, max_reported_errors: int) -> None:
+        self.num_errors += 1
+        if len(self.errors) < max_reported_errors:
+            self.errors.append(IngestError(line=line, error=error))
+
+
+class SemanticIDDescription(BaseModel):
+    """
+    The name and definition of a semantic ID, which the NLP fallback compares with those of requests
+
+    :ivar semantic_id: The described semantic ID
+    :ivar name: The name of the semantic ID
+    :ivar definition: The definition of the semantic ID
+    """
+    semantic_id: str
+    name: Optional[str] = None
+    definition: Optional[str] = None
+
+
+class DescriptionsList(BaseModel):
+    descriptions: List[SemanticIDDescription]
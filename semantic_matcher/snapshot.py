@@ -0,0 +1,262 @@
+"""
+A compact binary snapshot format for equivalence tables, that can be memory-mapped and served from without parsing it
+
+A snapshot is a little-endian file with a fixed size header followed by 8 byte aligned sections:
+
+- `string_offsets` (uint64) and `string_data` (UTF-8): All semantic IDs, sorted by their UTF-8 encoding, so that the
+  integer ID of a semantic ID can be found by bisection. The integer ID of a semantic ID is its position.
+- `csr_offsets` (int64), `targets` (uint32), `scores` (float64) and `meta_ids` (uint32): The matches in CSR form, as
+  in :class:`compact.CSRAdjacency`
+- `meta_offsets` (uint64) and `meta_data` (UTF-8): The deduplicated `meta_information` dicts as canonical JSON
+
+Convert between JSON files and snapshots with
+`python -m semantic_matcher.snapshot {to-snapshot,to-json} INPUT OUTPUT`
+"""
+import argparse
+import json
+import mmap
+import struct
+import sys
+from array import array
+from typing import Dict, List, Optional, Union
+
+from semantic_matcher import compact, model
+
+
+MAGIC = b"SMTSNAP1"
+# Magic, number of semantic IDs, matches and meta information, followed by the offsets of the eight sections
+HEADER = struct.Struct("<8s11Q")
+SUFFIX = ".snapshot"
+
+
+def _canonical_json(meta_information: Dict) -> str:
+    return json.dumps(meta_information, sort_keys=True, separators=(",", ":"))
+
+
+class MappedStringInterner(compact.StringInterner):
+    """
+    A :class:`compact.StringInterner` that reads the semantic IDs of a snapshot from memory-mapped, sorted sections
+    and keeps semantic IDs added later in memory
+    """
+    def __init__(self, offsets: memoryview, data: memoryview):
+        super().__init__()
+        self._mapped_offsets: memoryview = offsets
+        self._mapped_data: memoryview = data
+        self._num_mapped: int = len(offsets) - 1
+
+    def get(self, string: str) -> Optional[int]:
+        string_id = self._ids.get(string)
+        if string_id is not None:
+            return string_id
+        encoded = string.encode("utf-8")
+        low, high = 0, self._num_mapped
+        while low < high:
+            middle = (low + high) // 2
+            mapped = self._mapped_bytes(middle)
+            if mapped < encoded:
+                low = middle + 1
+            elif mapped > encoded:
+                high = middle
+            else:
+                return middle
+        return None
+
+    def intern(self, string: str) -> int:
+        string_id = self.get(string)
+        if string_id is None:
+            string_id = len(self)
+            # Store the string before publishing its ID, concurrent readers may look it up right away
+            self._strings.append(string)
+            self._ids[string] = string_id
+        return string_id
+
+    def __getitem__(self, string_id: int) -> str:
+        if string_id < self._num_mapped:
+            return self._mapped_bytes(string_id).decode("utf-8")
+        return self._strings[string_id - self._num_mapped]
+
+    def __len__(self) -> int:
+        return self._num_mapped + len(self._strings)
+
+    def _mapped_bytes(self, string_id: int) -> bytes:
+        return self._mapped_data[self._mapped_offsets[string_id]:self._mapped_offsets[string_id + 1]].tobytes()
+
+
+class MappedMetaInformationPool(compact.MetaInformationPool):
+    """
+    A :class:`compact.MetaInformationPool` that decodes the meta information of a snapshot on first access
+
+    The index of all meta information, which is only needed to add new matches, is built on the first write.
+    """
+    def __init__(self, offsets: memoryview, data: memoryview):
+        super().__init__()
+        self._mapped_offsets: memoryview = offsets
+        self._mapped_data: memoryview = data
+        self._num_mapped: int = len(offsets) - 1
+        self._decoded: Dict[int, Dict] = {}
+        self._indexed: bool = False
+
+    def intern(self, meta_information: Dict) -> int:
+        self._index()
+        key = _canonical_json(meta_information)
+        meta_id = self._ids.get(key)
+        if meta_id is None:
+            meta_id = len(self)
+            self._pool.append(meta_information)
+            self._ids[key] = meta_id
+        return meta_id
+
+    def get(self, meta_information: Dict) -> Optional[int]:
+        self._index()
+        return self._ids.get(_canonical_json(meta_information))
+
+    def __getitem__(self, meta_id: int) -> Dict:
+        if meta_id >= self._num_mapped:
+            return self._pool[meta_id - self._num_mapped]
+        meta_information = self._decoded.get(meta_id)
+        if meta_information is None:
+            meta_information = json.loads(self._mapped_json(meta_id))
+            self._decoded[meta_id] = meta_information
+        return meta_information
+
+    def __len__(self) -> int:
+        return self._num_mapped + len(self._pool)
+
+    def _index(self) -> None:
+        if not self._indexed:
+            for meta_id in range(self._num_mapped):
+                self._ids[self._mapped_json(meta_id)] = meta_id
+            self._indexed = True
+
+    def _mapped_json(self, meta_id: int) -> str:
+        return self._mapped_data[self._mapped_offsets[meta_id]:self._mapped_offsets[meta_id + 1]].tobytes().decode()
+
+
+def write_snapshot(table: model.AbstractEquivalenceTable, filename: str) -> None:
+    """
+    Writes the matches of `table` as snapshot to `filename`
+    """
+    write_sections(encode_sections(table), filename)
+
+
+def encode_sections(table: model.AbstractEquivalenceTable) -> List[Union[array, bytes]]:
+    """
+    Encodes the matches of `table` as the sections of a snapshot in memory, so that the table only needs to stay
+    unchanged while they are encoded, not while they are written by :func:`~.write_sections`
+    """
+    # First pass: Collect and sort the semantic IDs and deduplicate the meta information
+    strings = set()
+    meta_ids: Dict[str, int] = {}
+    base_semantic_ids = set()
+    for base_semantic_id in table._get_base_semantic_ids():
+        base_semantic_ids.add(base_semantic_id)
+        strings.add(base_semantic_id)
+        for target, _, meta_information in table._get_neighbours(base_semantic_id):
+            strings.add(target)
+            meta_ids.setdefault(_canonical_json(meta_information), len(meta_ids))
+    sorted_strings: List[bytes] = sorted(string.encode("utf-8") for string in strings)
+    string_ids = {string.decode("utf-8"): string_id for string_id, string in enumerate(sorted_strings)}
+
+    # Second pass: Build the CSR arrays in the order of the integer IDs
+    csr_offsets, targets, scores, edge_meta_ids = array("q", [0]), array("I"), array("d"), array("I")
+    for string in sorted_strings:
+        semantic_id = string.decode("utf-8")
+        if semantic_id in base_semantic_ids:
+            row = sorted(
+                (string_ids[target], score, meta_ids[_canonical_json(meta_information)])
+                for target, score, meta_information in table._get_neighbours(semantic_id)
+            )
+            for target, score, meta_id in row:
+                targets.append(target)
+                scores.append(score)
+                edge_meta_ids.append(meta_id)
+        csr_offsets.append(len(targets))
+
+    return [
+        _offsets_array(sorted_strings),
+        b"".join(sorted_strings),
+        csr_offsets,
+        targets,
+        scores,
+        edge_meta_ids,
+        _offsets_array([key.encode("utf-8") for key in meta_ids]),
+        "".join(meta_ids).encode("utf-8"),
+    ]
+
+
+def write_sections(sections: List[Union[array, bytes]], filename: str) -> None:
+    """
+    Writes the `sections` returned by :func:`~.encode_sections` as snapshot to `filename`
+    """
+    with open(filename, "wb") as file:
+        file.write(b"\0" * HEADER.size)
+        section_offsets = []
+        for section in sections:
+            file.write(b"\0" * (-file.tell() % 8))
+            section_offsets.append(file.tell())
+            if isinstance(section, array):
+                if sys.byteorder == "big":
+                    section.byteswap()
+                section = section.tobytes()
+            file.write(section)
+        file.seek(0)
+        file.write(HEADER.pack(
+            MAGIC, len(sections[0]) - 1, len(sections[3]), len(sections[6]) - 1, *section_offsets
+        ))
+
+
+def load(filename: str) -> compact.CompactEquivalenceTable:
+    """
+    Memory-maps the snapshot `filename` as :class:`compact.CompactEquivalenceTable`
+
+    Only the header is read, all other data is read from the memory map on access. Matches added to the table are
+    kept in memory and do not change the file.
+    """
+    if sys.byteorder == "big":
+        raise ValueError("Snapshots can only be memory-mapped on little-endian platforms")
+    with open(filename, "rb") as file:
+        mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(mapped)
+    magic, num_strings, num_matches, num_metas, *section_offsets = HEADER.unpack_from(view)
+    if magic != MAGIC:
+        raise ValueError(f"{filename} is not an equivalence table snapshot")
+
+    def section(index: int, length: int, item_format: str) -> memoryview:
+        start = section_offsets[index]
+        return view[start:start + length * struct.calcsize(item_format)].cast(item_format)
+
+    string_offsets = section(0, num_strings + 1, "Q")
+    meta_offsets = section(6, num_metas + 1, "Q")
+    return compact.CompactEquivalenceTable(
+        semantic_ids=MappedStringInterner(string_offsets, section(1, string_offsets[-1], "B")),
+        meta_information=MappedMetaInformationPool(meta_offsets, section(7, meta_offsets[-1], "B")),
+        adjacency=compact.CSRAdjacency(
+            offsets=section(2, num_strings + 1, "q"),
+            targets=section(3, num_matches, "I"),
+            scores=section(4, num_matches, "d"),
+            meta_ids=section(5, num_matches, "I"),
+        )
+    )
+
+
+def _offsets_array(items: List[bytes]) -> array:
+    offsets = array("Q", [0])
+    for item in items:
+        offsets.append(offsets[-1] + len(item))
+    return offsets
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Converts equivalence tables between JSON files and snapshots")
+    parser.add_argument("direction", choices=["to-snapshot", "to-json"])
+    parser.add_argument("input")
+    parser.add_argument("output")
+    args = parser.parse_args()
+    if args.direction == "to-snapshot":
+        write_snapshot(compact.CompactEquivalenceTable.from_file(args.input), args.output)
+    else:
+        load(args.input).to_file(args.output)
+
+
+if __name__ == '__main__':
+    main()
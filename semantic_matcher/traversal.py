@@ -0,0 +1,114 @@
+import heapq
+import itertools
+import math
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from semantic_matcher import metrics
+
+
+Neighbours = Callable[[str], Iterable[Tuple[str, float, Dict]]]
+"""
+A function returning the outgoing edges of a semantic ID as
+`(match_semantic_id, score, meta_information)` tuples
+"""
+
+
+class PathResult(NamedTuple):
+    """
+    The best path from a source semantic ID to one reachable semantic ID
+
+    :ivar target: The reached semantic ID
+    :ivar score: The product of all edge scores along the path
+    :ivar path: The intermediate semantic IDs between source and target
+    :ivar meta_information: The meta information of the last edge of the path
+    """
+    target: str
+    score: float
+    path: Tuple[str, ...]
+    meta_information: Dict
+
+
+def best_first_paths(
+        source: str,
+        neighbours: Neighbours,
+        score_limit: float,
+        max_results: Optional[int] = None
+) -> Iterator[PathResult]:
+    """
+    Iterates the best path from `source` to every semantic ID reachable with a
+    product score above `score_limit`, in descending order of score.
+
+    This is Dijkstra's algorithm over the edge weights `-log(score)`: Since
+    every score is at most `1.`, extending a path never increases its score,
+    so the first time a semantic ID is taken from the queue, its best path is
+    known. Paths are only queued while their score is above `score_limit`, so
+    the search stops as soon as no remaining path can satisfy the limit.
+    Cycles are harmless, as every semantic ID is expanded at most once.
+
+    If `max_results` is given, only the best `max_results` paths are
+    iterated. The first score found for a semantic ID is a lower bound of its
+    best score, so once `max_results` semantic IDs were found, paths that do
+    not beat the lowest of the `max_results` best first scores are not queued
+    anymore.
+
+    The `source` itself is never part of the result.
+
+    The expanded semantic IDs and scanned matches are counted in
+    :data:`metrics.TRAVERSAL_NODES_EXPANDED` and
+    :data:`metrics.TRAVERSAL_EDGES_SCANNED` once the iteration ends.
+    """
+    settled = {source}
+    best: Dict[str, float] = {}
+    # The counter keeps the order stable for equal scores and avoids comparing
+    # the meta information dicts
+    counter = itertools.count()
+    queue: List[Tuple[float, int, str, Tuple[str, ...], Dict]] = []
+    # The best `max_results` first scores of the found semantic IDs
+    top_first_scores: List[float] = []
+    threshold = score_limit
+    num_expanded = 0
+    num_scanned = 0
+
+    def expand(node: str, node_score: float, node_path: Tuple[str, ...]) -> None:
+        nonlocal threshold, num_expanded, num_scanned
+        num_expanded += 1
+        for target, edge_score, meta_information in neighbours(node):
+            num_scanned += 1
+            if target in settled:
+                continue
+            score = node_score * edge_score
+            if score <= threshold:
+                continue
+            previous_score = best.get(target)
+            if previous_score is not None and score <= previous_score:
+                continue
+            best[target] = score
+            heapq.heappush(queue, (-score, next(counter), target, node_path, meta_information))
+            if max_results is not None and previous_score is None:
+                if len(top_first_scores) < max_results:
+                    heapq.heappush(top_first_scores, score)
+                else:
+                    heapq.heappushpop(top_first_scores, score)
+                if len(top_first_scores) == max_results:
+                    # Paths scoring exactly the threshold could still tie with the last result
+                    threshold = max(threshold, math.nextafter(top_first_scores[0], 0.))
+
+    if max_results is not None and max_results <= 0:
+        return
+    try:
+        expand(source, 1., ())
+        num_results = 0
+        while queue:
+            negative_score, _, target, path, meta_information = heapq.heappop(queue)
+            if target in settled:
+                continue
+            settled.add(target)
+            score = -negative_score
+            yield PathResult(target, score, path, meta_information)
+            num_results += 1
+            if num_results == max_results:
+                return
+            expand(target, score, path + (target,))
+    finally:
+        metrics.TRAVERSAL_NODES_EXPANDED.inc(num_expanded)
+        metrics.TRAVERSAL_EDGES_SCANNED.inc(num_scanned)
@@ -0,0 +1,237 @@
+import json
+import os
+import threading
+from typing import Dict, List, Optional
+
+from semantic_matcher import model, partitioned, snapshot
+
+
+def add_record(match: model.SemanticMatch) -> Dict:
+    return {"op": "add", "match": match.model_dump()}
+
+
+def remove_record(match: model.SemanticMatch) -> Dict:
+    return {"op": "remove", "base_semantic_id": match.base_semantic_id, "match_semantic_id": match.match_semantic_id}
+
+
+def clear_record() -> Dict:
+    return {"op": "clear"}
+
+
+def apply_record(table: model.AbstractEquivalenceTable, record: Dict) -> None:
+    """
+    Applies one change record of a :class:`~.MutationLog` to `table`
+    """
+    if record["op"] == "add":
+        table.add_semantic_match(model.SemanticMatch.model_validate(record["match"]))
+    elif record["op"] == "remove":
+        table.remove_semantic_match(model.SemanticMatch(
+            base_semantic_id=record["base_semantic_id"],
+            match_semantic_id=record["match_semantic_id"],
+            score=0.,
+            meta_information={}
+        ))
+    elif record["op"] == "clear":
+        table.remove_all_semantic_matches()
+    else:
+        raise ValueError(f"Unknown mutation log record {record}")
+
+
+class MutationLog:
+    """
+    An append-only log of all changes to an equivalence table, that makes them durable without rewriting the table
+
+    Each change is one NDJSON record:
+
+    - `{"op": "add", "match": {...}}`: The match was added or replaced an existing one
+    - `{"op": "remove", "base_semantic_id": ..., "match_semantic_id": ...}`
+    - `{"op": "clear"}`
+
+    The records of one batch of changes are written and fsynced together, so
+    the cost of a write depends on the size of the batch, not of the table.
+    :func:`~.MutationLog.compact` writes the whole table to `snapshot_file`
+    and drops the records it contains from the log. Replaying the log onto the
+    latest snapshot restores the table. Replaying is idempotent, so a crash
+    between writing the snapshot and dropping the records loses nothing.
+
+    Changes to the table need to go through this class, so that the table and
+    the log cannot diverge.
+
+    :ivar filename: The file of the log
+    :ivar snapshot_file: The file of the snapshot. If it ends with
+        :data:`snapshot.SUFFIX`, a binary snapshot is written, otherwise JSON
+    :ivar fsync: If `False`, records are only flushed to the operating system
+    """
+    def __init__(self, filename: str, snapshot_file: str, fsync: bool = True):
+        self.filename: str = filename
+        self.snapshot_file: str = snapshot_file
+        self.fsync: bool = fsync
+        self._lock = threading.Lock()
+        self._compaction_lock = threading.Lock()
+        self._file = open(self.filename, "a", encoding="utf-8")
+        self._num_records: int = 0
+        self._compaction_thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def add_semantic_matches(
+            self,
+            table: model.AbstractEquivalenceTable,
+            matches: List[model.SemanticMatch],
+            update_policy: model.UpdatePolicy = model.UpdatePolicy.REPLACE
+    ) -> List[model.SemanticMatch]:
+        """
+        Adds the `matches` to the `table` and logs the ones that changed it
+
+        :raises model.DuplicateMatchError: See :func:`model.AbstractEquivalenceTable.add_semantic_matches`
+        """
+        with self._lock:
+            changed = table.add_semantic_matches(matches, update_policy)
+            self._append([add_record(match) for match in changed])
+        return changed
+
+    def remove_semantic_matches(
+            self,
+            table: model.AbstractEquivalenceTable,
+            matches: List[model.SemanticMatch]
+    ) -> List[model.SemanticMatch]:
+        """
+        Removes the `matches` from the `table` and logs the ones that were removed
+        """
+        with self._lock:
+            removed = [match for match in matches if table.remove_semantic_match(match)]
+            self._append([remove_record(match) for match in removed])
+        return removed
+
+    def remove_semantic_matches_of(
+            self,
+            table: model.AbstractEquivalenceTable,
+            semantic_id: str
+    ) -> List[model.SemanticMatch]:
+        """
+        Removes all matches from and to `semantic_id` from the `table` and logs them
+        """
+        with self._lock:
+            removed = table.remove_semantic_matches_of(semantic_id)
+            self._append([remove_record(match) for match in removed])
+        return removed
+
+    def remove_all_semantic_matches(self, table: model.AbstractEquivalenceTable) -> None:
+        with self._lock:
+            table.remove_all_semantic_matches()
+            self._append([clear_record()])
+
+    def replay(self, table: model.AbstractEquivalenceTable) -> int:
+        """
+        Applies all logged changes to `table`, e.g. after loading the latest snapshot on startup
+
+        A last record that was only partially written before a crash is ignored
+        and cut off the file, so that the next record does not continue it.
+
+        :returns: The number of replayed records
+        """
+        num_records = 0
+        with self._lock:
+            end_of_last_record = 0
+            with open(self.filename, "rb") as file:
+                lines = iter(file)
+                for line in lines:
+                    try:
+                        if not line.endswith(b"\n"):
+                            raise ValueError(f"Mutation log record {line!r} is not terminated")
+                        record: Dict = json.loads(line)
+                    except ValueError:
+                        if next(lines, None) is None:
+                            break
+                        raise
+                    apply_record(table, record)
+                    end_of_last_record += len(line)
+                    num_records += 1
+            if end_of_last_record < os.path.getsize(self.filename):
+                self._file.close()
+                os.truncate(self.filename, end_of_last_record)
+                self._file = open(self.filename, "a", encoding="utf-8")
+            self._num_records += num_records
+        return num_records
+
+    def compact(self, table: model.AbstractEquivalenceTable) -> None:
+        """
+        Writes `table` to the `snapshot_file` and drops the records it contains from the log
+
+        A :class:`partitioned.PartitionedEquivalenceTable` writes its changed
+        partitions instead, its directory takes the place of the snapshot.
+        The snapshot is written without holding the log, so changes to the
+        table do not wait for it. It may already contain some of the changes
+        that are logged meanwhile, they are kept in the log and replayed again.
+        """
+        with self._compaction_lock:
+            with self._lock:
+                if self._num_records == 0 and (
+                        isinstance(table, partitioned.PartitionedEquivalenceTable)
+                        or os.path.exists(self.snapshot_file)):
+                    return
+                self._file.flush()
+                compacted_size = os.path.getsize(self.filename)
+            if isinstance(table, partitioned.PartitionedEquivalenceTable):
+                table.flush()
+            else:
+                temporary_file = self.snapshot_file + ".tmp"
+                if self.snapshot_file.endswith(snapshot.SUFFIX):
+                    snapshot.write_snapshot(table, temporary_file)
+                else:
+                    table.to_file(temporary_file)
+                with open(temporary_file, "rb") as file:
+                    os.fsync(file.fileno())
+                os.replace(temporary_file, self.snapshot_file)
+            with self._lock:
+                self._drop_records(compacted_size)
+
+    def start_compaction(self, table: model.AbstractEquivalenceTable, interval: float) -> None:
+        """
+        Compacts the log every `interval` seconds in a background thread
+        """
+        def run() -> None:
+            while not self._stop.wait(interval):
+                self.compact(table)
+
+        self._compaction_thread = threading.Thread(target=run, name="mutation_log_compaction", daemon=True)
+        self._compaction_thread.start()
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._compaction_thread is not None:
+            self._compaction_thread.join()
+        with self._lock:
+            self._file.close()
+
+    def __len__(self) -> int:
+        """
+        Returns the number of records since the last compaction
+        """
+        return self._num_records
+
+    def _drop_records(self, size: int) -> None:
+        """
+        Replaces the log with the records after its first `size` bytes
+        """
+        self._file.flush()
+        with open(self.filename, "rb") as file:
+            file.seek(size)
+            remaining = file.read()
+        temporary_file = self.filename + ".tmp"
+        with open(temporary_file, "wb") as file:
+            file.write(remaining)
+            file.flush()
+            os.fsync(file.fileno())
+        self._file.close()
+        os.replace(temporary_file, self.filename)
+        self._file = open(self.filename, "a", encoding="utf-8")
+        self._num_records = remaining.count(b"\n")
+
+    def _append(self, records: List[Dict]) -> None:
+        if not records:
+            return
+        self._file.write("".join(json.dumps(record) + "\n" for record in records))
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        self._num_records += len(records)
@@ -0,0 +1,126 @@
+"""
+Serves the semantic matching service from several processes, so that matching is not limited to one CPU core
+
+The process started with `num_workers > 1` in the `WORKERS` section of the config becomes the writer: It owns the
+equivalence table and the mutation log, receives all changes on `127.0.0.1:writer_port` and publishes the changed
+table as :mod:`segments` every `publish_interval` seconds. It starts `num_workers` worker processes, which all accept
+the requests on the public port. Each worker memory-maps the latest segment, so the table is held in memory once, not
+once per worker. Workers answer reads themselves and forward changes to the writer. A change is visible to reads after
+at most `publish_interval` plus `poll_interval` seconds.
+"""
+import configparser
+import multiprocessing
+import multiprocessing.connection
+import socket
+import threading
+from typing import Dict, Optional
+
+import uvicorn
+
+from semantic_matcher import model, segments, service, wal
+
+
+def serve(
+        config: configparser.ConfigParser,
+        equivalences: model.AbstractEquivalenceTable,
+        mutation_log: Optional[wal.MutationLog] = None,
+        listening_socket: Optional[socket.socket] = None
+) -> None:
+    """
+    Runs the writer with `equivalences` and the workers of the `config` until the writer is stopped
+
+    :param listening_socket: The socket the workers accept the requests on. If not given, it is bound to the address
+        and port of the `SERVICE` section of the config
+    """
+    workers_config = config["WORKERS"]
+    segment_directory = service.relative_to_config(workers_config.get("segment_directory", "./resources/segments"))
+    publisher = segments.SegmentPublisher(segment_directory)
+    publisher.publish(equivalences)
+    # With `writer_port = 0`, the operating system picks a free port
+    writer_socket = uvicorn.Config(
+        app=None,
+        host="127.0.0.1",
+        port=workers_config.getint("writer_port", fallback=8001)
+    ).bind_socket()
+    writer_port = writer_socket.getsockname()[1]
+    if listening_socket is None:
+        listening_socket = uvicorn.Config(
+            app=None,
+            host=config["SERVICE"]["LISTEN_ADDRESS"],
+            port=int(config["SERVICE"]["PORT"])
+        ).bind_socket()
+    # Workers are spawned, not forked, so that they do not inherit a copy of the table of the writer
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(
+            target=run_worker,
+            args=(
+                {section: dict(config[section]) for section in config.sections()},
+                listening_socket,
+                segment_directory,
+                f"http://127.0.0.1:{writer_port}",
+            ),
+            name=f"semantic_matching_worker_{number}",
+            daemon=True
+        )
+        for number in range(workers_config.getint("num_workers"))
+    ]
+    for process in processes:
+        process.start()
+    listening_socket.close()
+    writer = service.create_service(
+        config,
+        equivalences,
+        mutation_log=mutation_log,
+        worker_options=service.WorkerOptions(
+            segment_publisher=publisher,
+            publish_interval=workers_config.getfloat("publish_interval", fallback=1.)
+        )
+    )
+    try:
+        uvicorn.Server(uvicorn.Config(service.create_app(writer))).run(sockets=[writer_socket])
+    finally:
+        publisher.close()
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join()
+
+
+def run_worker(
+        config_sections: Dict[str, Dict[str, str]],
+        listening_socket: socket.socket,
+        segment_directory: str,
+        writer_endpoint: str
+) -> None:
+    """
+    Serves the requests accepted on `listening_socket` from the segments in `segment_directory`
+
+    :param config_sections: The sections of the config, as the config itself cannot be passed to a new process
+    """
+    config = configparser.ConfigParser()
+    config.read_dict(config_sections)
+    follower = segments.SegmentFollower(segment_directory)
+
+    def load(equivalences: model.AbstractEquivalenceTable) -> model.AbstractEquivalenceTable:
+        service.enable_closure_index(config, equivalences)
+        return equivalences
+
+    worker = service.create_service(
+        config,
+        load(follower.load()),
+        worker_options=service.WorkerOptions(writer_endpoint=writer_endpoint)
+    )
+    follower.start(
+        lambda equivalences: worker.replace_equivalence_table(load(equivalences)),
+        interval=config["WORKERS"].getfloat("poll_interval", fallback=0.1)
+    )
+    server = uvicorn.Server(uvicorn.Config(service.create_app(worker)))
+
+    def stop_with_writer() -> None:
+        # The writer cannot always stop its workers, e.g. if it is killed by a signal
+        multiprocessing.connection.wait([multiprocessing.parent_process().sentinel])
+        server.should_exit = True
+
+    threading.Thread(target=stop_with_writer, name="writer_watch", daemon=True).start()
+    server.run(sockets=[listening_socket])
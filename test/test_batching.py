@@ -0,0 +1,68 @@
+import threading
+import unittest
+
+from semantic_matcher.batching import WriteBatcher
+
+
+class TestWriteBatcher(unittest.TestCase):
+
+    def test_concurrent_submissions_are_batched(self):
+        batches = []
+        release = threading.Event()
+
+        def apply(items):
+            batches.append(items)
+            release.wait()
+            return [item * 2 for item in items]
+
+        batcher = WriteBatcher(apply)
+        results = {}
+        threads = [threading.Thread(target=lambda i=i: results.update({i: batcher.submit(i)})) for i in range(5)]
+        threads[0].start()
+        # The first item is applied alone, the others arrive while it is applied and form the next batch
+        while not batches:
+            pass
+        for thread in threads[1:]:
+            thread.start()
+        while len(batcher._queue) < 4:
+            pass
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual({i: i * 2 for i in range(5)}, results)
+        self.assertEqual([[0], [1, 2, 3, 4]], [batches[0], sorted(batches[1])])
+
+    def test_failing_item_only_fails_its_submission(self):
+        def apply(items):
+            if "bad" in items:
+                raise ValueError("bad")
+            return items
+
+        batcher = WriteBatcher(apply)
+        with self.assertRaises(ValueError):
+            batcher.submit("bad")
+        batcher._apply_lock.acquire()
+        results = []
+        threads = [
+            threading.Thread(target=lambda item=item: results.append(self._submit(batcher, item)))
+            for item in ["a", "bad", "b"]
+        ]
+        for thread in threads:
+            thread.start()
+        while len(batcher._queue) < 3:
+            pass
+        batcher._apply_lock.release()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(["a", "b", "error"], sorted(results))
+
+    @staticmethod
+    def _submit(batcher, item):
+        try:
+            return batcher.submit(item)
+        except ValueError:
+            return "error"
+
+
+if __name__ == '__main__':
+    unittest.main()
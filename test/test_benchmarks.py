@@ -0,0 +1,50 @@
+import unittest
+
+from semantic_matcher.benchmarks import generator, results
+
+
+class TestGenerator(unittest.TestCase):
+
+    def test_generate_matches(self):
+        matches = generator.generate_matches(num_ids=300, fan_out=3, num_namespaces=3, seed=1)
+        self.assertEqual(
+            [(match.base_semantic_id, match.match_semantic_id, match.score) for match in matches],
+            [(match.base_semantic_id, match.match_semantic_id, match.score)
+             for match in generator.generate_matches(num_ids=300, fan_out=3, num_namespaces=3, seed=1)]
+        )
+        namespaces = {match.base_semantic_id.split("/")[0] for match in matches}
+        self.assertEqual({generator.namespace(number) for number in range(3)}, namespaces)
+        self.assertTrue(all(0.5 <= match.score <= 1. for match in matches))
+        self.assertTrue(all(match.base_semantic_id != match.match_semantic_id for match in matches))
+        self.assertTrue(any(
+            match.base_semantic_id.split("/")[0] != match.match_semantic_id.split("/")[0] for match in matches
+        ))
+
+    def test_cycle_density(self):
+        def num_back_matches(cycle_density: float) -> int:
+            return sum(
+                int(match.match_semantic_id.rsplit("/", 1)[1]) < int(match.base_semantic_id.rsplit("/", 1)[1])
+                for match in generator.generate_matches(num_ids=200, fan_out=2, cycle_density=cycle_density)
+                # The last semantic ID has no choice but to match back
+                if match.base_semantic_id != generator.semantic_id(0, 199)
+            )
+        self.assertEqual(0, num_back_matches(0.))
+        self.assertLess(num_back_matches(0.1), num_back_matches(0.5))
+
+    def test_generate_table(self):
+        for backend in generator.TABLE_FACTORIES:
+            table = generator.generate_table(backend, num_ids=100, fan_out=2)
+            self.assertEqual(len(generator.generate_matches(num_ids=100, fan_out=2)), table.stats()["matches"])
+
+
+class TestResults(unittest.TestCase):
+
+    def test_percentile(self):
+        values = [float(value) for value in range(1, 101)]
+        self.assertEqual(50., results.percentile(values, 50.))
+        self.assertEqual(99., results.percentile(values, 99.))
+        self.assertEqual(1., results.percentile(values, 0.))
+
+
+if __name__ == '__main__':
+    unittest.main()
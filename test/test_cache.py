@@ -0,0 +1,109 @@
+import threading
+import unittest
+
+from semantic_matcher.cache import ResultCache, TTLCache
+from semantic_matcher.model import SemanticMatch
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TestTTLCache(unittest.TestCase):
+
+    def test_ttl(self):
+        clock = FakeClock()
+        cache = TTLCache(maxsize=10, ttl=10., negative_ttl=1., clock=clock)
+        self.assertEqual("a", cache.get_or_load("key", lambda: "a"))
+        self.assertEqual("a", cache.get_or_load("key", lambda: "b"))
+        clock.now = 11.
+        self.assertEqual("b", cache.get_or_load("key", lambda: "b"))
+        self.assertEqual({"size": 1, "hits": 1, "misses": 2, "coalesced": 0}, cache.stats())
+
+    def test_negative_ttl(self):
+        clock = FakeClock()
+        cache = TTLCache(maxsize=10, ttl=10., negative_ttl=1., clock=clock)
+        self.assertIsNone(cache.get_or_load("key", lambda: None))
+        self.assertIsNone(cache.get_or_load("key", lambda: "a"))
+        clock.now = 2.
+        self.assertEqual("a", cache.get_or_load("key", lambda: "a"))
+
+    def test_lru_eviction(self):
+        cache = TTLCache(maxsize=2, ttl=10., negative_ttl=1.)
+        cache.get_or_load("a", lambda: "a")
+        cache.get_or_load("b", lambda: "b")
+        cache.get_or_load("a", lambda: "a")
+        cache.get_or_load("c", lambda: "c")
+        self.assertEqual("a", cache.get_or_load("a", lambda: "new"))
+        self.assertEqual("new", cache.get_or_load("b", lambda: "new"))
+
+    def test_errors_are_not_cached(self):
+        cache = TTLCache(maxsize=2, ttl=10., negative_ttl=1.)
+
+        def fail():
+            raise ConnectionError()
+
+        with self.assertRaises(ConnectionError):
+            cache.get_or_load("a", fail)
+        self.assertEqual("a", cache.get_or_load("a", lambda: "a"))
+
+    def test_concurrent_loads_are_coalesced(self):
+        cache = TTLCache(maxsize=2, ttl=10., negative_ttl=1.)
+        release = threading.Event()
+        calls = []
+
+        def load():
+            calls.append(1)
+            release.wait()
+            return "a"
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(cache.get_or_load("key", load)))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        while cache.misses + cache.coalesced < 5:
+            pass
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(["a"] * 5, results)
+        self.assertEqual(1, len(calls))
+
+
+def _match(match_semantic_id: str, score: float) -> SemanticMatch:
+    return SemanticMatch(
+        base_semantic_id="a",
+        match_semantic_id=match_semantic_id,
+        score=score,
+        meta_information={}
+    )
+
+
+class TestResultCache(unittest.TestCase):
+
+    def test_higher_score_limit_is_filtered(self):
+        cache = ResultCache(maxsize=10)
+        cache.put("a", 0.5, 1, [_match("b", 0.9), _match("c", 0.6)])
+        self.assertEqual(["b"], [m.match_semantic_id for m in cache.get("a", 0.7, lambda tag: tag == 1)])
+        self.assertIsNone(cache.get("a", 0.4, lambda tag: tag == 1))
+        self.assertIsNone(cache.get("a", 0.7, lambda tag: tag == 2))
+        self.assertAlmostEqual(1 / 3, cache.stats()["hit_ratio"])
+
+    def test_lru_eviction(self):
+        cache = ResultCache(maxsize=1)
+        cache.put("a", 0.5, 1, [_match("b", 0.9)])
+        cache.put("b", 0.5, 1, [_match("b", 0.9)])
+        self.assertIsNone(cache.get("a", 0.5, lambda tag: True))
+        self.assertEqual(1, cache.stats()["size"])
+        self.assertEqual(ResultCache.MATCH_OVERHEAD + 2, cache.stats()["approximate_bytes"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,32 @@
+import unittest
+
+from semantic_matcher.circuit import CircuitBreaker
+
+
+class TestCircuitBreaker(unittest.TestCase):
+
+    def test_open_and_close(self):
+        now = [0.]
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10., clock=lambda: now[0])
+        breaker.record_failure("http://a.com")
+        self.assertTrue(breaker.allow("http://a.com"))
+        breaker.record_failure("http://a.com")
+        self.assertFalse(breaker.allow("http://a.com"))
+        self.assertTrue(breaker.allow("http://b.com"))
+        self.assertEqual(["http://a.com"], breaker.open_circuits())
+        # After the reset timeout, a single trial request is allowed
+        now[0] = 10.
+        self.assertTrue(breaker.allow("http://a.com"))
+        self.assertFalse(breaker.allow("http://a.com"))
+        breaker.record_failure("http://a.com")
+        now[0] = 15.
+        self.assertFalse(breaker.allow("http://a.com"))
+        now[0] = 20.
+        self.assertTrue(breaker.allow("http://a.com"))
+        breaker.record_success("http://a.com")
+        self.assertTrue(breaker.allow("http://a.com"))
+        self.assertEqual([], breaker.open_circuits())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import json
+import unittest
+
+from semantic_matcher import encoding
+from semantic_matcher.model import SemanticMatch
+from semantic_matcher.service_model import MatchesList, MatchesListBatch
+
+
+def _match(base: str, match: str, score: float) -> SemanticMatch:
+    return SemanticMatch(
+        base_semantic_id=base,
+        match_semantic_id=match,
+        score=score,
+        meta_information={"matchSource": "Defined by UnitTest", "path": ["a.com/2"]}
+    )
+
+
+class TestMatchEncoder(unittest.TestCase):
+
+    def test_encode(self):
+        encoder = encoding.MatchEncoder()
+        matches_list = MatchesList(matches=[_match("a.com/1", "a.com/3", 0.5), _match("a.com/1", "b.com/1", 1.)])
+        encoded = encoder.encode_matches_list(matches_list)
+        self.assertEqual(
+            {"matches": json.loads(matches_list.model_dump_json())["matches"]},
+            json.loads(encoded)
+        )
+        self.assertEqual({"size": 2, "hits": 0, "misses": 2}, encoder.stats())
+        # The same match objects are not encoded again
+        batch = MatchesListBatch(results=[
+            MatchesList(matches=matches_list.matches[1:], cut_off_services=["http://c.com"]),
+            MatchesList(matches=[], truncated=True)
+        ])
+        self.assertEqual(
+            {"results": [
+                {"matches": json.loads(encoded)["matches"][1:], "cut_off_services": ["http://c.com"]},
+                {"matches": [], "truncated": True}
+            ]},
+            json.loads(encoder.encode_matches_list_batch(batch))
+        )
+        self.assertEqual({"size": 2, "hits": 1, "misses": 2}, encoder.stats())
+
+    def test_maxsize(self):
+        encoder = encoding.MatchEncoder(maxsize=2)
+        encoder.encode_matches([_match("a.com/1", f"a.com/{i}", 0.5) for i in range(3)])
+        self.assertEqual(1, encoder.stats()["size"])
+
+
+class TestParse(unittest.TestCase):
+
+    def test_trusted(self):
+        matches_list = MatchesList(
+            matches=[_match("a.com/1", "a.com/3", 0.5)],
+            cut_off_services=["http://c.com"],
+            truncated=True
+        )
+        text = matches_list.model_dump_json()
+        batch_text = MatchesListBatch(results=[matches_list]).model_dump_json()
+        for trusted in [False, True]:
+            parsed = encoding.parse_matches_list(text, trusted)
+            self.assertEqual(matches_list, parsed)
+            self.assertEqual(text, parsed.model_dump_json())
+            batch = encoding.parse_matches_list_batch(batch_text, trusted)
+            self.assertEqual([matches_list], batch.results)
+        # Matches with other fields are validated
+        with self.assertRaises(ValueError):
+            encoding.parse_matches_list('{"matches": [{"base_semantic_id": "a.com/1"}]}', trusted=True)
+
+    def test_trusted_match_behaves_like_a_validated_one(self):
+        validated = _match("a.com/1", "a.com/3", 0.5)
+        parsed = encoding.parse_matches_list(MatchesList(matches=[validated]).model_dump_json(), trusted=True)
+        match = parsed.matches[0]
+        self.assertIs(SemanticMatch, type(match))
+        self.assertEqual(validated.model_dump(), match.model_dump())
+        self.assertEqual(validated, match)
+        self.assertEqual(match, validated)
+        self.assertEqual(validated.model_fields_set, match.model_fields_set)
+        self.assertEqual(validated, match.model_copy())
+        self.assertEqual(_match("a.com/1", "a.com/3", 0.7), match.model_copy(update={"score": 0.7}))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import io
+import json
+import unittest
+
+from semantic_matcher import ingest
+
+
+MATCHES = [
+    {"base_semantic_id": "a", "match_semantic_id": "b", "score": 0.5, "meta_information": {"path": ["x"]}},
+    {"base_semantic_id": "a", "match_semantic_id": "c", "score": 1, "meta_information": {}},
+    {"base_semantic_id": "b", "match_semantic_id": "c", "score": 0.25, "meta_information": {}},
+]
+
+
+class TestIngest(unittest.TestCase):
+
+    def test_iter_json_table(self):
+        table = {"version": [1, {"x": 2}], "matches": {"a": MATCHES[:2], "b": MATCHES[2:], "c": []}}
+        for indent in [None, 4]:
+            document = json.dumps(table, indent=indent)
+            for chunk_size in [1, 3, 7, 1000]:
+                self.assertEqual(MATCHES, list(ingest.iter_json_table(io.StringIO(document), chunk_size)))
+        self.assertEqual([], list(ingest.iter_json_table(io.StringIO('{"matches": {}}'))))
+
+    def test_iter_json_table_invalid(self):
+        with self.assertRaises(ValueError):
+            list(ingest.iter_json_table(io.StringIO(json.dumps({"matches": {"b": [1]}}))))
+        with self.assertRaises(ValueError):
+            list(ingest.iter_json_table(io.StringIO('{"matches": {"a": [' + json.dumps(MATCHES[0]))))
+
+    def test_iter_json_table_match_under_other_key(self):
+        # The match is loaded by its own base_semantic_id, as before tables were loaded incrementally
+        document = json.dumps({"matches": {"b": MATCHES[:1]}})
+        self.assertEqual(MATCHES[:1], list(ingest.iter_json_table(io.StringIO(document))))
+
+    def test_iter_ndjson(self):
+        document = "\n".join(json.dumps(match) for match in MATCHES) + "\n\n"
+        self.assertEqual(MATCHES, list(ingest.iter_ndjson(io.StringIO(document))))
+
+    def test_line_splitter(self):
+        splitter = ingest.LineSplitter(max_line_length=8)
+        self.assertEqual([], splitter.feed(b"ab"))
+        self.assertEqual([b"abc", b""], splitter.feed(b"c\n\nd"))
+        self.assertEqual([b"d"], splitter.close())
+        with self.assertRaises(ValueError):
+            splitter.feed(b"123456789")
+
+
+if __name__ == '__main__':
+    unittest.main()
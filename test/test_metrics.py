@@ -0,0 +1,60 @@
+import unittest
+
+from semantic_matcher import metrics, traversal
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_render(self):
+        registry = metrics.Registry()
+        counter = registry.register(metrics.Counter("requests_total", "Requests", ("outcome",)))
+        histogram = registry.register(metrics.Histogram("latency_seconds", "Latency", buckets=(0.1, 1.)))
+        counter.inc(1., "ok")
+        counter.inc(2., "ok")
+        counter.inc(1., 'say "hi"')
+        histogram.observe(0.05)
+        histogram.observe(0.1)
+        histogram.observe(5.)
+        self.assertEqual(
+            "# HELP requests_total Requests\n"
+            "# TYPE requests_total counter\n"
+            'requests_total{outcome="ok"} 3.0\n'
+            'requests_total{outcome="say \\"hi\\""} 1.0\n'
+            "# HELP latency_seconds Latency\n"
+            "# TYPE latency_seconds histogram\n"
+            'latency_seconds_bucket{le="0.1"} 2\n'
+            'latency_seconds_bucket{le="1.0"} 2\n'
+            'latency_seconds_bucket{le="+Inf"} 3\n'
+            "latency_seconds_sum 5.15\n"
+            "latency_seconds_count 3\n",
+            registry.render()
+        )
+
+    def test_trace(self):
+        with metrics.trace() as trace:
+            with metrics.stage("local"):
+                pass
+            with metrics.stage("local"):
+                pass
+            with metrics.stage("remote"):
+                pass
+        with metrics.stage("outside"):
+            pass
+        self.assertEqual(["local", "remote"], list(trace.stages))
+        self.assertEqual(
+            ["local", "remote", "total"],
+            [timing.split(";")[0] for timing in trace.server_timing(1.).split(", ")]
+        )
+
+    def test_traversal_is_counted(self):
+        edges = {"a": [("b", 1., {}), ("c", 0.5, {})], "b": [("c", 1., {})]}
+        nodes_expanded = metrics.TRAVERSAL_NODES_EXPANDED.get()
+        edges_scanned = metrics.TRAVERSAL_EDGES_SCANNED.get()
+        results = traversal.best_first_paths("a", lambda node: edges.get(node, []), 0., max_results=1)
+        self.assertEqual(["b"], [result.target for result in results])
+        self.assertEqual(nodes_expanded + 1, metrics.TRAVERSAL_NODES_EXPANDED.get())
+        self.assertEqual(edges_scanned + 2, metrics.TRAVERSAL_EDGES_SCANNED.get())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,280 @@
+import os
+import random
+import tempfile
+import time
+import unittest
+
+from semantic_matcher import snapshot
+from semantic_matcher.compact import CompactEquivalenceTable
+from semantic_matcher.model import Direction, DuplicateMatchError, SemanticMatch, EquivalenceTable, UpdatePolicy
+
+
+def _match(base: str, match: str, score: float) -> SemanticMatch:
+    return SemanticMatch(
+        base_semantic_id=base,
+        match_semantic_id=match,
+        score=score,
+        meta_information={"matchSource": "Defined by UnitTest"}
+    )
+
+
+class TestEquivalenceTable(unittest.TestCase):
+
+    def new_table(self):
+        return EquivalenceTable(matches={})
+
+    def test_get_local_matches_cycle(self):
+        table = self.new_table()
+        table.add_semantic_match(_match("a", "b", 1.))
+        table.add_semantic_match(_match("b", "a", 1.))
+        table.add_semantic_match(_match("b", "c", 0.9))
+        matches = table.get_local_matches("a", 0.5)
+        self.assertEqual(["b", "c"], [m.match_semantic_id for m in matches])
+        self.assertEqual(["b"], matches[1].meta_information["path"])
+
+    def test_get_local_matches_best_path(self):
+        table = self.new_table()
+        table.add_semantic_match(_match("a", "b", 0.6))
+        table.add_semantic_match(_match("b", "d", 1.))
+        table.add_semantic_match(_match("a", "c", 0.9))
+        table.add_semantic_match(_match("c", "d", 0.9))
+        matches = table.get_local_matches("a", 0.)
+        self.assertEqual(["c", "d", "b"], [m.match_semantic_id for m in matches])
+        self.assertAlmostEqual(0.81, matches[1].score)
+        self.assertEqual(["c"], matches[1].meta_information["path"])
+        self.assertEqual("a", matches[1].base_semantic_id)
+
+    def test_get_local_matches_score_limit(self):
+        table = self.new_table()
+        table.add_semantic_match(_match("a", "b", 0.8))
+        table.add_semantic_match(_match("b", "c", 0.8))
+        self.assertEqual(["b"], [m.match_semantic_id for m in table.get_local_matches("a", 0.7)])
+
+    def test_get_local_matches_does_not_modify_table(self):
+        table = self.new_table()
+        table.add_semantic_match(_match("a", "b", 0.8))
+        table.add_semantic_match(_match("b", "c", 0.5))
+        before = table.get_all_matches()
+        table.get_local_matches("a", 0.)
+        table.get_local_matches("a", 0.)
+        self.assertEqual(before, table.get_all_matches())
+
+    def test_closure_index_is_updated(self):
+        table = self.new_table()
+        table.add_semantic_match(_match("a", "b", 0.9))
+        table.add_semantic_match(_match("b", "c", 0.9))
+        table.enable_closure_index(floor_score=0.5)
+        self.assertEqual(["b", "c"], [m.match_semantic_id for m in table.get_local_matches("a", 0.5)])
+        table.add_semantic_match(_match("c", "d", 0.9))
+        self.assertEqual(["b", "c", "d"], [m.match_semantic_id for m in table.get_local_matches("a", 0.5)])
+        table.remove_semantic_match(_match("b", "c", 0.9))
+        self.assertEqual(["b"], [m.match_semantic_id for m in table.get_local_matches("a", 0.5)])
+        # Below the floor score, the table falls back to traversal
+        table.add_semantic_match(_match("b", "e", 0.5))
+        self.assertEqual(["b", "e"], [m.match_semantic_id for m in table.get_local_matches("a", 0.4)])
+        self.assertEqual(["b"], [m.match_semantic_id for m in table.get_local_matches("a", 0.5)])
+
+    def test_update_policy(self):
+        table = self.new_table()
+        self.assertTrue(table.add_semantic_match(_match("a", "b", 0.5)))
+        self.assertFalse(table.add_semantic_match(_match("a", "b", 0.5), UpdatePolicy.REJECT))
+        with self.assertRaises(DuplicateMatchError):
+            table.add_semantic_match(_match("a", "b", 0.6), UpdatePolicy.REJECT)
+        self.assertTrue(table.add_semantic_match(_match("a", "b", 0.7), UpdatePolicy.KEEP_MAX))
+        self.assertFalse(table.add_semantic_match(_match("a", "b", 0.6), UpdatePolicy.KEEP_MAX))
+        self.assertEqual(0.7, table.get_semantic_match("a", "b").score)
+        self.assertTrue(table.add_semantic_match(_match("a", "b", 0.6)))
+        self.assertEqual(0.6, table.get_semantic_match("a", "b").score)
+        self.assertEqual(1, len(table.get_all_matches()["a"]))
+
+    def test_add_semantic_matches_reject_is_atomic(self):
+        table = self.new_table()
+        table.add_semantic_match(_match("a", "b", 0.5))
+        with self.assertRaises(DuplicateMatchError):
+            table.add_semantic_matches([_match("a", "c", 0.5), _match("a", "b", 0.6)], UpdatePolicy.REJECT)
+        self.assertIsNone(table.get_semantic_match("a", "c"))
+        self.assertEqual(
+            [_match("a", "c", 0.5)],
+            table.add_semantic_matches([_match("a", "c", 0.5), _match("a", "b", 0.5)])
+        )
+
+    def test_remove_semantic_match(self):
+        table = self.new_table()
+        for target in ["b", "c", "d"]:
+            table.add_semantic_match(_match("a", target, 0.5))
+        self.assertTrue(table.remove_semantic_match(_match("a", "b", 0.5)))
+        self.assertFalse(table.remove_semantic_match(_match("a", "b", 0.5)))
+        self.assertEqual({"c", "d"}, {m.match_semantic_id for m in table.get_all_matches()["a"]})
+        self.assertIsNotNone(table.get_semantic_match("a", "d"))
+        table.remove_semantic_match(_match("a", "c", 0.5))
+        table.remove_semantic_match(_match("a", "d", 0.5))
+        self.assertNotIn("a", table.get_all_matches())
+
+    def test_remove_semantic_match_from_hub(self):
+        table = self.new_table()
+        for i in range(100):
+            table.add_semantic_match(_match("hub", str(i), 0.5))
+        removed = set(range(0, 100, 3)) | set(range(50, 100))
+        for i in sorted(removed):
+            self.assertTrue(table.remove_semantic_match(_match("hub", str(i), 0.5)))
+        table.add_semantic_match(_match("hub", "3", 0.7))
+        table.add_semantic_match(_match("hub", "1", 0.7))
+        expected = {str(i): 0.5 for i in range(100) if i not in removed}
+        expected.update({"3": 0.7, "1": 0.7})
+        self.assertEqual(expected, {m.match_semantic_id: m.score for m in table.get_all_matches()["hub"]})
+        for i in range(100):
+            self.assertEqual(str(i) in expected, table.get_semantic_match("hub", str(i)) is not None)
+        self.assertEqual(len(expected), len(table.get_local_matches("hub", 0.)))
+
+    def test_hub_changes_do_not_slow_down(self):
+        # Changing the matches of a hub must not copy them, which made loading a table with a large hub quadratic
+        table = self.new_table()
+        durations = []
+        for chunk in range(10):
+            start = time.perf_counter()
+            for i in range(chunk * 2000, (chunk + 1) * 2000):
+                table.add_semantic_match(_match("hub", f"out{i}", 0.5))
+                table.add_semantic_match(_match(f"in{i}", "hub", 0.5))
+            durations.append(time.perf_counter() - start)
+        self.assertLess(min(durations[-3:]), 3 * min(durations[:3]))
+
+    def test_get_local_matches_max_results(self):
+        table = self.new_table()
+        generator = random.Random(0)
+        for _ in range(300):
+            table.add_semantic_match(_match(str(generator.randrange(50)), str(generator.randrange(50)),
+                                            generator.uniform(0.5, 1.)))
+        for direction in Direction:
+            for max_results in [1, 5, 20, 100]:
+                self.assertEqual(
+                    table.get_local_matches("0", 0.1, direction)[:max_results],
+                    table.get_local_matches("0", 0.1, direction, max_results)
+                )
+        table.enable_closure_index(0.)
+        self.assertEqual(table.get_local_matches("0", 0.1)[:5], table.get_local_matches("0", 0.1, max_results=5))
+
+    def test_get_local_matches_direction(self):
+        table = self.new_table()
+        table.add_semantic_match(_match("a", "b", 0.8))
+        table.add_semantic_match(_match("b", "c", 0.5))
+        table.add_semantic_match(_match("d", "b", 0.9))
+        self.assertEqual(
+            [("b", 0.5), ("d", 0.45), ("a", 0.4)],
+            [(m.match_semantic_id, m.score) for m in table.get_local_matches("c", 0., Direction.INBOUND)]
+        )
+        self.assertEqual(["b"], table.get_local_matches("c", 0., Direction.INBOUND)[2].meta_information["path"])
+        matches = table.get_local_matches("a", 0., Direction.BOTH)
+        self.assertEqual(["b", "d", "c"], [m.match_semantic_id for m in matches])
+        self.assertAlmostEqual(0.72, matches[1].score)
+
+    def test_remove_semantic_matches_of(self):
+        table = self.new_table()
+        for base, target in [("a", "b"), ("b", "c"), ("d", "b"), ("b", "b"), ("c", "d")]:
+            table.add_semantic_match(_match(base, target, 0.5))
+        self.assertEqual(
+            {("b", "c"), ("b", "b"), ("a", "b"), ("d", "b")},
+            {(m.base_semantic_id, m.match_semantic_id) for m in table.remove_semantic_matches_of("b")}
+        )
+        self.assertEqual({"c": [_match("c", "d", 0.5)]}, table.get_all_matches())
+        self.assertEqual([], list(table._get_inbound("b")))
+        self.assertEqual([], table.remove_semantic_matches_of("b"))
+
+    def test_iter_semantic_matches(self):
+        table = self.new_table()
+        for base, target in [("a/1", "b"), ("a/1", "c"), ("b/1", "c"), ("a/2", "d")]:
+            table.add_semantic_match(_match(base, target, 0.5))
+        all_matches = list(table.iter_semantic_matches())
+        self.assertEqual(4, len(all_matches))
+        # Continuing after each position yields the remaining matches
+        for index, (position, _) in enumerate(all_matches):
+            self.assertEqual(all_matches[index + 1:], list(table.iter_semantic_matches(position)))
+        self.assertEqual(
+            {("a/1", "b"), ("a/1", "c"), ("a/2", "d")},
+            {(m.base_semantic_id, m.match_semantic_id) for _, m in table.iter_semantic_matches(prefix="a/")}
+        )
+
+    def test_iter_semantic_matches_while_changing_table(self):
+        table = self.new_table()
+        for base in ["a", "b", "c"]:
+            table.add_semantic_match(_match(base, "x", 0.5))
+        seen = []
+        for _, match in table.iter_semantic_matches():
+            seen.append(match.base_semantic_id)
+            table.add_semantic_match(_match(match.base_semantic_id + "_new", "x", 0.5))
+            if len(seen) > 10:
+                break
+        self.assertIn("a", seen)
+
+
+class TestCompactEquivalenceTable(TestEquivalenceTable):
+
+    def new_table(self):
+        return CompactEquivalenceTable()
+
+    def test_compaction(self):
+        table = self.new_table()
+        table.COMPACTION_MIN_CHANGES = 2
+        for i in range(10):
+            table.add_semantic_match(_match("a", f"b{i}", 0.9))
+        table.remove_semantic_match(_match("a", "b3", 0.9))
+        table.add_semantic_match(_match("a", "b0", 0.9))
+        self.assertEqual(9, len(table))
+        self.assertEqual(9, len(table.get_all_matches()["a"]))
+        self.assertNotIn("b3", [m.match_semantic_id for m in table.get_local_matches("a", 0.5)])
+
+    def test_file_round_trip(self):
+        filename = os.path.join(os.path.dirname(__file__), "../test_resources/equivalence_table.json")
+        table = CompactEquivalenceTable.from_file(filename)
+        self.assertEqual(
+            EquivalenceTable.from_file(filename).get_all_matches(),
+            table.get_all_matches()
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            table.to_file(os.path.join(directory, "equivalence_table.json"))
+            self.assertEqual(
+                table.get_all_matches(),
+                EquivalenceTable.from_file(os.path.join(directory, "equivalence_table.json")).get_all_matches()
+            )
+            with open(os.path.join(directory, "equivalence_table.ndjson"), "w") as file:
+                for _, match in table.iter_semantic_matches():
+                    file.write(match.model_dump_json() + "\n")
+            self.assertEqual(
+                table.get_all_matches(),
+                type(table).from_file(os.path.join(directory, "equivalence_table.ndjson")).get_all_matches()
+            )
+
+
+class TestSnapshotEquivalenceTable(TestCompactEquivalenceTable):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def new_table(self):
+        # Semantic IDs and meta information of the snapshot mix with new ones added in memory
+        filename = os.path.join(self.directory.name, f"{len(os.listdir(self.directory.name))}.snapshot")
+        table = EquivalenceTable(matches={})
+        table.add_semantic_match(_match("x", "b", 0.5))
+        table.add_semantic_match(_match("b", "y", 0.5))
+        snapshot.write_snapshot(table, filename)
+        table = snapshot.load(filename)
+        table.remove_semantic_match(_match("x", "b", 0.5))
+        table.remove_semantic_match(_match("b", "y", 0.5))
+        return table
+
+    def test_snapshot_round_trip(self):
+        filename = os.path.join(os.path.dirname(__file__), "../test_resources/equivalence_table.json")
+        table = EquivalenceTable.from_file(filename)
+        snapshot.write_snapshot(table, os.path.join(self.directory.name, "table.snapshot"))
+        mapped_table = snapshot.load(os.path.join(self.directory.name, "table.snapshot"))
+        self.assertEqual(table.get_all_matches(), mapped_table.get_all_matches())
+        self.assertEqual(
+            table.get_local_matches("s-heppner.com/semanticID/one", 0.5),
+            mapped_table.get_local_matches("s-heppner.com/semanticID/one", 0.5)
+        )
+        self.assertIsNone(mapped_table.get_semantic_match("s-heppner.com/semanticID/one", "unknown"))
+
+if __name__ == '__main__':
+    unittest.main()
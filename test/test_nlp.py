@@ -0,0 +1,86 @@
+import os
+import tempfile
+import unittest
+
+from semantic_matcher.nlp import NgramIndex, count_ngrams
+
+
+TEXTS = {
+    "a.com/speed": "Rotational speed of the motor",
+    "a.com/torque": "Maximum torque",
+    "b.com/speed": "Motor rotation speed",
+    "b.com/serial": "Serial number",
+}
+
+
+class TestNgramIndex(unittest.TestCase):
+
+    def test_count_ngrams(self):
+        self.assertEqual({" ab": 1, "ab ": 1, "b a": 1, " a ": 1}, count_ngrams("AB\t a", 3))
+
+    def test_query(self):
+        index = NgramIndex()
+        index.build(TEXTS)
+        # Scanning all scores and only the scores of the texts sharing an n-gram with the query
+        for dense_scan_ratio in [NgramIndex.DENSE_SCAN_RATIO, 0]:
+            index.DENSE_SCAN_RATIO = dense_scan_ratio
+            result = index.query("rotation speed", 0.1, 10)
+            self.assertEqual(["b.com/speed", "a.com/speed"], [semantic_id for semantic_id, _ in result])
+            self.assertAlmostEqual(1., index.query("Maximum torque", 0.1, 1)[0][1], places=5)
+            self.assertEqual([], index.query("xyz", 0.1, 10))
+            self.assertEqual(
+                [[("b.com/speed", result[0][1])], []],
+                index.query_batch(["rotation speed", "xyz"], 0.1, 1)
+            )
+
+    def test_add_and_rebuild(self):
+        index = NgramIndex()
+        index.build(TEXTS)
+        index.add("c.com/torque", "max torque")
+        index.add("b.com/speed", "Serial no")
+        self.assertEqual("c.com/torque", index.query("max torque", 0.1, 1)[0][0])
+        self.assertNotIn("b.com/speed", [semantic_id for semantic_id, _ in index.query("rotation speed", 0.1, 10)])
+        before_rebuild = index.query_batch(["max torque", "serial number", "rotation speed"], 0.1, 10)
+        index.rebuild()
+        after_rebuild = index.query_batch(["max torque", "serial number", "rotation speed"], 0.1, 10)
+        self.assertEqual(
+            [[semantic_id for semantic_id, _ in result] for result in before_rebuild],
+            [[semantic_id for semantic_id, _ in result] for result in after_rebuild]
+        )
+        self.assertEqual(5, len(index))
+
+    def test_rebuild_in_background(self):
+        index = NgramIndex()
+        index.REBUILD_MIN_CHANGES = 2
+        index.build(TEXTS)
+        index.add("c.com/torque", "max torque")
+        self.assertIsNone(index._rebuild_thread)
+        index.add("b.com/speed", "Serial no")
+        # The rebuild may already be done
+        rebuild_thread = index._rebuild_thread
+        if rebuild_thread is not None:
+            rebuild_thread.join()
+        self.assertEqual({}, index._pending)
+        self.assertIsNone(index._rebuild_thread)
+        self.assertEqual("c.com/torque", index.query("max torque", 0.1, 1)[0][0])
+        self.assertNotIn("b.com/speed", [semantic_id for semantic_id, _ in index.query("rotation speed", 0.1, 10)])
+
+    def test_frequent_ngrams_are_ignored(self):
+        index = NgramIndex(max_column_length=1)
+        index.build({"a": "abc", "b": "abc", "c": "abd"})
+        result = index.query("abd", 0.1, 10)
+        self.assertEqual(["c"], [semantic_id for semantic_id, _ in result])
+        self.assertAlmostEqual(1., result[0][1], places=5)
+
+    def test_from_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "descriptions.ndjson")
+            with open(filename, "w") as file:
+                file.write('{"semantic_id": "a.com/torque", "name": "Maximum torque", "definition": "In Nm"}\n')
+                file.write('{"semantic_id": "a.com/speed", "name": "Speed"}\n')
+            index = NgramIndex.from_file(filename)
+        self.assertEqual("a.com/torque", index.query("torque", 0.1, 1)[0][0])
+
+
+if __name__ == '__main__':
+    unittest.main()
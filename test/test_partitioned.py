@@ -0,0 +1,130 @@
+import os
+import tempfile
+import unittest
+
+from semantic_matcher import compact, partitioned
+from semantic_matcher.model import Direction, EquivalenceTable, SemanticMatch
+from semantic_matcher.wal import MutationLog
+
+
+def _match(base: str, match: str, score: float) -> SemanticMatch:
+    return SemanticMatch(
+        base_semantic_id=base,
+        match_semantic_id=match,
+        score=score,
+        meta_information={"matchSource": "Defined by UnitTest"}
+    )
+
+
+MATCHES = [
+    _match("a.com/1", "a.com/2", 0.9),
+    _match("a.com/2", "a.com/3", 0.8),
+    _match("a.com/3", "b.com/1", 0.9),
+    _match("b.com/1", "b.com/2", 0.7),
+    _match("c.com/1", "a.com/1", 0.6),
+]
+
+
+class TestPartitionedEquivalenceTable(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        partitioned.write_partitions(MATCHES, self.directory.name)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_partitions_are_loaded_lazily(self):
+        table = partitioned.PartitionedEquivalenceTable(self.directory.name)
+        self.assertEqual(
+            {"matches": 5, "approximate_bytes": 0, "partitions": 3, "loaded_partitions": 0},
+            table.stats()
+        )
+        reference = EquivalenceTable(matches={})
+        reference.add_semantic_matches(MATCHES)
+        self.assertEqual(
+            reference.get_local_matches("a.com/1", score_limit=0.5),
+            table.get_local_matches("a.com/1", score_limit=0.5)
+        )
+        self.assertEqual(2, table.stats()["loaded_partitions"])
+        self.assertEqual(
+            ["a.com/2", "a.com/1"],
+            [match.match_semantic_id for match in table.get_local_matches(
+                "a.com/3", score_limit=0.5, direction=Direction.INBOUND
+            )]
+        )
+        # c.com refers to a.com
+        self.assertEqual(
+            reference.get_local_matches("a.com/2", score_limit=0.1, direction=Direction.INBOUND),
+            table.get_local_matches("a.com/2", score_limit=0.1, direction=Direction.INBOUND)
+        )
+        self.assertEqual(3, table.loads)
+        self.assertEqual(reference.get_all_matches(), table.get_all_matches())
+        self.assertEqual(
+            ["b.com/2"],
+            [match.match_semantic_id for _, match in table.iter_semantic_matches(prefix="b.com/")]
+        )
+
+    def test_least_recently_used_partitions_are_evicted(self):
+        table = partitioned.PartitionedEquivalenceTable(
+            self.directory.name,
+            backend=compact.CompactEquivalenceTable,
+            max_bytes=1,
+            partition_format="ndjson"
+        )
+        table.get_local_matches("a.com/1", score_limit=0.5)
+        self.assertEqual(1, table.stats()["loaded_partitions"])
+        self.assertGreater(table.evictions, 0)
+        table.add_semantic_match(_match("b.com/2", "b.com/3", 0.9))
+        table.remove_semantic_match(_match("c.com/1", "a.com/1", 0.))
+        table.add_semantic_match(_match("d.com/1", "a.com/1", 0.5))
+        # Changed partitions of b.com, c.com and d.com stay in memory until they are flushed
+        self.assertEqual(["b.com/2", "b.com/3"], [
+            match.match_semantic_id for match in table.get_local_matches("b.com/1", score_limit=0.5)
+        ])
+        self.assertEqual(3, table.stats()["loaded_partitions"])
+        table.flush()
+        self.assertEqual(1, table.stats()["loaded_partitions"])
+        self.assertIsNotNone(table.get_semantic_match("b.com/2", "b.com/3"))
+
+        reopened = partitioned.PartitionedEquivalenceTable(self.directory.name)
+        self.assertEqual(6, reopened.stats()["matches"])
+        self.assertIsNone(reopened.get_semantic_match("c.com/1", "a.com/1"))
+        # d.com became a referrer of a.com
+        self.assertEqual(["d.com/1"], [
+            match.match_semantic_id
+            for match in reopened.get_local_matches("a.com/1", score_limit=0.4, direction=Direction.INBOUND)
+        ])
+
+    def test_mutation_log_flushes_partitions(self):
+        table = partitioned.PartitionedEquivalenceTable(self.directory.name)
+        log = MutationLog(os.path.join(self.directory.name, "mutations.ndjson"), "unused")
+        try:
+            log.add_semantic_matches(table, [_match("a.com/1", "a.com/4", 0.5), _match("e.com/1", "e.com/2", 0.5)])
+            log.compact(table)
+            self.assertEqual(0, len(log))
+            flushed = partitioned.PartitionedEquivalenceTable(self.directory.name)
+            self.assertIsNotNone(flushed.get_semantic_match("a.com/1", "a.com/4"))
+            log.remove_all_semantic_matches(table)
+            log.add_semantic_matches(table, [_match("e.com/1", "e.com/3", 0.5)])
+        finally:
+            log.close()
+
+        # Changed partitions are written in the new format
+        reopened = partitioned.PartitionedEquivalenceTable(self.directory.name, partition_format="ndjson")
+        self.assertEqual(7, reopened.stats()["matches"])
+        log = MutationLog(os.path.join(self.directory.name, "mutations.ndjson"), "unused")
+        try:
+            log.replay(reopened)
+        finally:
+            log.close()
+        self.assertEqual({"e.com/1": [_match("e.com/1", "e.com/3", 0.5)]}, reopened.get_all_matches())
+        reopened.flush()
+        self.assertEqual(
+            ["partition-e.com.ndjson", "partitions.json"],
+            sorted(file for file in os.listdir(self.directory.name) if file.startswith("partition"))
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
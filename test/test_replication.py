@@ -0,0 +1,177 @@
+import unittest
+
+from semantic_matcher import wal
+from semantic_matcher.model import Direction, EquivalenceTable, SemanticMatch
+from semantic_matcher.replication import ChangeFeed, Replica
+from semantic_matcher.service import PersistenceOptions, SemanticMatchingService
+from semantic_matcher.service_model import MatchesList, MatchRequest
+
+
+def _match(base: str, match: str, score: float) -> SemanticMatch:
+    return SemanticMatch(
+        base_semantic_id=base,
+        match_semantic_id=match,
+        score=score,
+        meta_information={"matchSource": "Defined by UnitTest"}
+    )
+
+
+class InProcessSession:
+    """
+    Routes the requests of a :class:`Replica` directly to a :class:`SemanticMatchingService`
+    """
+    def __init__(self, service: SemanticMatchingService):
+        self.service = service
+        self.paths = []
+
+    def get(self, url, params, timeout, stream=False):
+        path = url.rsplit("/", 1)[1]
+        self.paths.append(path)
+        if path == "changes":
+            text = self.service.get_changes(
+                since=int(params["since"]) if "since" in params else None,
+                epoch=params.get("epoch"),
+                limit=params["limit"]
+            ).model_dump_json()
+            lines = []
+        else:
+            matches = self.service.get_all_matches(namespace=params["namespace"])
+            text = ""
+            lines = [match.model_dump_json().encode() for row in matches.values() for match in row]
+
+        class Response:
+            status_code = 200
+
+            def raise_for_status(self):
+                pass
+
+            def iter_lines(self):
+                return iter(lines)
+        response = Response()
+        response.text = text
+        return response
+
+
+class TestChangeFeed(unittest.TestCase):
+
+    def test_changes_since(self):
+        feed = ChangeFeed(version=3, maxsize=4)
+        feed.append(5, [wal.add_record(_match("a", "b", 0.5)), wal.add_record(_match("a", "c", 0.5))])
+        feed.append(6, [wal.clear_record()])
+        page = feed.changes_since(3, feed.epoch)
+        self.assertFalse(page.reset)
+        self.assertEqual(6, page.version)
+        self.assertEqual([4, 5, 6], [change["version"] for change in page.changes])
+        self.assertEqual("clear", page.changes[2]["op"])
+        page = feed.changes_since(3, feed.epoch, limit=2)
+        self.assertEqual((5, True), (page.version, page.has_more))
+        page = feed.changes_since(5, feed.epoch)
+        self.assertEqual(([6], False), ([change["version"] for change in page.changes], page.has_more))
+        self.assertEqual([], feed.changes_since(6, feed.epoch).changes)
+        # Unknown versions and other epochs need a reset
+        for since, epoch in [(2, feed.epoch), (7, feed.epoch), (5, "other"), (None, None)]:
+            page = feed.changes_since(since, epoch)
+            self.assertTrue(page.reset)
+            self.assertEqual((feed.epoch, 6), (page.epoch, page.version))
+
+    def test_old_changes_are_dropped(self):
+        feed = ChangeFeed(version=0, maxsize=4)
+        for version in range(1, 11):
+            feed.append(version, [wal.add_record(_match("a", str(version), 0.5))])
+        self.assertTrue(feed.changes_since(0, feed.epoch).reset)
+        page = feed.changes_since(6, feed.epoch)
+        self.assertEqual([7, 8, 9, 10], [change["version"] for change in page.changes])
+
+
+class TestReplica(unittest.TestCase):
+
+    def setUp(self):
+        table = EquivalenceTable(matches={})
+        table.add_semantic_matches([
+            _match("a.com/1", "a.com/2", 0.9),
+            _match("a.com/2", "a.com/3", 0.9),
+            _match("a.com/3", "b.com/1", 0.9),
+            _match("c.com/1", "a.com/1", 0.9),
+        ])
+        self.remote = SemanticMatchingService(
+            endpoint="http://a.com",
+            equivalences=table,
+            persistence_options=PersistenceOptions(write_batch_window=0.)
+        )
+        self.session = InProcessSession(self.remote)
+        self.replica = Replica("http://a.com", ["a.com"], session=self.session)
+
+    def test_sync(self):
+        self.assertEqual(0, self.replica.sync())
+        self.assertEqual(["changes", "all_matches", "changes"], self.session.paths)
+        self.assertEqual(
+            {"a.com/1", "a.com/2", "a.com/3"},
+            set(self.replica.table.get_all_matches().keys())
+        )
+        self.remote.post_matches(MatchesList(matches=[
+            _match("a.com/1", "a.com/4", 0.8),
+            _match("c.com/2", "a.com/4", 0.8)
+        ]))
+        self.remote.remove_matches_of("a.com/3")
+        self.session.paths.clear()
+        self.assertEqual(4, self.replica.sync())
+        self.assertEqual(["changes"], self.session.paths)
+        self.assertEqual(self.remote.equivalence_table.version, self.replica.version)
+        self.assertIsNotNone(self.replica.table.get_semantic_match("a.com/1", "a.com/4"))
+        self.assertIsNone(self.replica.table.get_semantic_match("c.com/2", "a.com/4"))
+        self.assertIsNone(self.replica.table.get_semantic_match("a.com/2", "a.com/3"))
+        self.remote.remove_all_matches()
+        self.replica.sync()
+        self.assertEqual({}, self.replica.table.get_all_matches())
+
+    def test_get_local_matches(self):
+        self.assertIsNone(self.replica.get_local_matches(MatchRequest(semantic_id="a.com/1", score_limit=0.5)))
+        self.replica.sync()
+        self.assertEqual(
+            ["a.com/2", "a.com/3"],
+            [match.match_semantic_id for match in self.replica.get_local_matches(
+                MatchRequest(semantic_id="a.com/1", score_limit=0.8)
+            )]
+        )
+        # The remote service would pass the request on to b.com
+        self.assertIsNone(self.replica.get_local_matches(MatchRequest(semantic_id="a.com/1", score_limit=0.5)))
+        self.assertIsNone(self.replica.get_local_matches(MatchRequest(semantic_id="c.com/1", score_limit=0.5)))
+
+    def test_inbound_requests_are_not_answered(self):
+        self.replica.sync()
+        # c.com/1 -> a.com/1 is not replicated, but the remote service would return it
+        for direction in [Direction.INBOUND, Direction.BOTH]:
+            self.assertIsNone(self.replica.get_local_matches(
+                MatchRequest(semantic_id="a.com/2", score_limit=0.5, direction=direction)
+            ))
+        self.assertEqual(
+            {"a.com/1", "c.com/1"},
+            {match.match_semantic_id for match in self.remote.get_matches(
+                MatchRequest(semantic_id="a.com/2", score_limit=0.5, direction=Direction.INBOUND)
+            ).matches}
+        )
+
+    def test_service_answers_from_replica(self):
+        self.replica.sync()
+        table = EquivalenceTable(matches={})
+        table.add_semantic_match(_match("local.com/1", "a.com/1", 0.9))
+        service = SemanticMatchingService(endpoint="http://local.com", equivalences=table)
+        # The replica is synced by hand
+        service.replicas.append(self.replica)
+        service._replicas_by_namespace["a.com"] = self.replica
+
+        def no_resolver(semantic_id):
+            raise AssertionError("The resolver must not be asked")
+        service._get_matcher_from_semantic_id = no_resolver
+        result = service.get_matches(MatchRequest(semantic_id="local.com/1", score_limit=0.7, local_only=False))
+        self.assertEqual(
+            ["a.com/1", "a.com/2", "a.com/3"],
+            [match.match_semantic_id for match in result.matches]
+        )
+        # As answered by the remote service, relative to a.com/1
+        self.assertEqual("a.com/1", result.matches[2].base_semantic_id)
+        self.assertAlmostEqual(0.81, result.matches[2].score)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,168 @@
+import configparser
+import multiprocessing
+import os
+import socket
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import requests
+
+from semantic_matcher import segments
+from semantic_matcher.model import EquivalenceTable, SemanticMatch
+
+
+def _match(base: str, match: str, score: float) -> SemanticMatch:
+    return SemanticMatch(
+        base_semantic_id=base,
+        match_semantic_id=match,
+        score=score,
+        meta_information={"matchSource": "Defined by UnitTest"}
+    )
+
+
+class TestSegments(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_follow_published_segments(self):
+        table = EquivalenceTable(matches={})
+        table.add_semantic_match(_match("a", "b", 0.5))
+        publisher = segments.SegmentPublisher(self.directory.name, keep=2)
+        publisher.publish(table)
+        follower = segments.SegmentFollower(self.directory.name)
+        self.assertEqual({"a": [_match("a", "b", 0.5)]}, follower.load().get_all_matches())
+        self.assertIsNone(follower.poll())
+
+        table.add_semantic_match(_match("b", "c", 0.8))
+        publisher.publish(table)
+        self.assertEqual(
+            {"a": [_match("a", "b", 0.5)], "b": [_match("b", "c", 0.8)]},
+            follower.poll().get_all_matches()
+        )
+        self.assertIsNone(follower.poll())
+
+        table.remove_all_semantic_matches()
+        publisher.publish(table)
+        self.assertEqual(3, publisher.generation)
+        self.assertEqual(2, len([name for name in os.listdir(self.directory.name) if name.startswith("segment-")]))
+        self.assertEqual({}, follower.poll().get_all_matches())
+        # A new publisher continues with the generations found in the directory
+        self.assertEqual(3, segments.SegmentPublisher(self.directory.name).generation)
+
+    def test_old_segments_that_cannot_be_removed_are_kept(self):
+        table = EquivalenceTable(matches={})
+        publisher = segments.SegmentPublisher(self.directory.name, keep=1)
+        publisher.publish(table)
+        # Windows does not remove files that are still memory-mapped
+        with mock.patch("os.remove", side_effect=PermissionError):
+            publisher.publish(table)
+        self.assertEqual(2, len([name for name in os.listdir(self.directory.name) if name.startswith("segment-")]))
+        publisher.publish(table)
+        self.assertEqual(
+            [segments._segment_name(3)],
+            [name for name in os.listdir(self.directory.name) if name.startswith("segment-")]
+        )
+
+    def test_publish_changes_in_background(self):
+        table = EquivalenceTable(matches={})
+        publisher = segments.SegmentPublisher(self.directory.name)
+        publisher.publish(table)
+        follower = segments.SegmentFollower(self.directory.name)
+        follower.load()
+        loaded = []
+        lock = multiprocessing.Lock()
+        publisher.start(table, lock, interval=0.01)
+        follower.start(loaded.append, interval=0.01)
+        try:
+            with lock:
+                table.add_semantic_match(_match("a", "b", 0.5))
+            deadline = time.monotonic() + 5.
+            while not loaded and time.monotonic() < deadline:
+                time.sleep(0.01)
+            generation = publisher.generation
+            time.sleep(0.1)
+        finally:
+            publisher.close()
+            follower.close()
+        self.assertEqual({"a": [_match("a", "b", 0.5)]}, loaded[0].get_all_matches())
+        # Unchanged tables are not published again
+        self.assertEqual(generation, publisher.generation)
+
+
+def run_workers(segment_directory: str, listening_socket: socket.socket):
+    from semantic_matcher import service, workers
+
+    config = configparser.ConfigParser()
+    config.read_dict({
+        "SERVICE": {
+            "endpoint": "http://127.0.0.1",
+            "LISTEN_ADDRESS": "127.0.0.1",
+            "port": "0",
+            "equivalence_table_file": "./test_resources/equivalence_table.json",
+        },
+        "WORKERS": {
+            "num_workers": "2",
+            "writer_port": "0",
+            "segment_directory": segment_directory,
+            "publish_interval": "0.05",
+            "poll_interval": "0.05",
+        },
+        "RESOLVER": {
+            "endpoint": "http://semantic_id_resolver",
+            "port": "8125",
+        },
+    })
+    equivalences, mutation_log = service.load_equivalence_table(config)
+    workers.serve(config, equivalences, mutation_log, listening_socket)
+
+
+class TestWorkers(unittest.TestCase):
+
+    def test_changes_are_forwarded_and_published(self):
+        with tempfile.TemporaryDirectory() as directory, socket.socket() as listening_socket:
+            listening_socket.bind(("127.0.0.1", 0))
+            endpoint = f"http://127.0.0.1:{listening_socket.getsockname()[1]}"
+            process = multiprocessing.Process(target=run_workers, args=(directory, listening_socket))
+            process.start()
+            try:
+                all_matches = None
+                deadline = time.monotonic() + 30.
+                while all_matches is None and time.monotonic() < deadline:
+                    try:
+                        all_matches = requests.get(f"{endpoint}/all_matches").json()
+                    except requests.ConnectionError:
+                        time.sleep(0.1)
+                self.assertIn("s-heppner.com/semanticID/one", all_matches)
+
+                response = requests.post(
+                    f"{endpoint}/post_matches",
+                    json={"matches": [_match("test.com/a", "test.com/b", 0.9).model_dump()]}
+                )
+                self.assertEqual(200, response.status_code)
+                matches = []
+                while not matches and time.monotonic() < deadline:
+                    time.sleep(0.05)
+                    matches = requests.get(
+                        f"{endpoint}/get_matches",
+                        json={"semantic_id": "test.com/a", "score_limit": 0., "local_only": True}
+                    ).json()["matches"]
+                self.assertEqual([_match("test.com/a", "test.com/b", 0.9).model_dump()], matches)
+
+                response = requests.post(
+                    f"{endpoint}/post_matches_stream",
+                    data=_match("test.com/c", "test.com/d", 0.7).model_dump_json() + "\n"
+                )
+                self.assertEqual(1, response.json()["num_added"])
+            finally:
+                process.terminate()
+                process.join()
+
+
+if __name__ == '__main__':
+    unittest.main()
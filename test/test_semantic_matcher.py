@@ -8,9 +8,12 @@ import unittest
 from fastapi import FastAPI
 import uvicorn
 
-from semantic_matcher import model
+from semantic_matcher import circuit, model, nlp
 from semantic_matcher.model import SemanticMatch
-from semantic_matcher.service import SemanticMatchingService
+from semantic_matcher.service import FederationOptions, NLPOptions, SemanticMatchingService
+from semantic_matcher.service_model import (
+    DescriptionsList, MatchesList, MatchRequest, MatchRequestBatch, SemanticIDDescription
+)
 
 from contextlib import contextmanager
 import signal
@@ -48,14 +51,14 @@ def run_server():
     SemanticMatchingService._get_matcher_from_semantic_id = mock_get_matcher
 
     # Mock remote service
-    original_requests_get = requests.get
+    original_session_get = requests.Session.get
 
     class SimpleResponse:
         def __init__(self, content: str, status_code: int = 200):
             self.text = content
             self.status_code = status_code
 
-    def mock_requests_get(url, json):
+    def mock_session_get(self, url, **kwargs):
         if url == "http://remote-service:8000/get_matches":
             match_one = SemanticMatch(
                 base_semantic_id="s-heppner.com/semanticID/three",
@@ -70,9 +73,9 @@ def run_server():
             matches_json = js.dumps(matches_data)
             return SimpleResponse(content=matches_json)
         else:
-            return original_requests_get(url, json=json)
+            return original_session_get(self, url, **kwargs)
 
-    requests.get = mock_requests_get
+    requests.Session.get = mock_session_get
 
     # Run server
     app = FastAPI()
@@ -299,6 +302,138 @@ class TestSemanticMatchingService(unittest.TestCase):
             actual_matches = response.json()
             self.assertEqual(expected_matches, actual_matches)
 
+    def test_get_matches_batch(self):
+        with run_server_context():
+            batch_request = {
+                "requests": [
+                    {
+                        "semantic_id": "s-heppner.com/semanticID/one",
+                        "score_limit": 0.9,
+                        "local_only": True
+                    },
+                    {
+                        "semantic_id": "s-heppner.com/semanticID/one",
+                        "score_limit": 0.5,
+                        "local_only": True
+                    },
+                    {
+                        "semantic_id": "s-heppner.com/semanticID/three",
+                        "score_limit": 0.7,
+                        "local_only": False
+                    }
+                ]
+            }
+            response = requests.get("http://localhost:8000/get_matches_batch", json=batch_request)
+            results = response.json()["results"]
+            self.assertEqual(3, len(results))
+            self.assertEqual(
+                ["s-heppner.com/semanticID/1"],
+                [match["match_semantic_id"] for match in results[0]["matches"]]
+            )
+            self.assertEqual(
+                ["s-heppner.com/semanticID/1", "s-heppner.com/semanticID/two", "s-heppner.com/semanticID/2"],
+                [match["match_semantic_id"] for match in results[1]["matches"]]
+            )
+            self.assertEqual(
+                ["remote-service.com/semanticID/trois", "remote-service.com/semanticID/tres"],
+                [match["match_semantic_id"] for match in results[2]["matches"]]
+            )
+
+    def test_get_all_matches_paginated(self):
+        with run_server_context():
+            matches = []
+            params = {"limit": 2}
+            while True:
+                response = requests.get("http://localhost:8000/all_matches", params=params)
+                page = response.json()
+                self.assertLessEqual(len(page["matches"]), 2)
+                matches.extend(match["match_semantic_id"] for match in page["matches"])
+                if page["next_cursor"] is None:
+                    break
+                params["cursor"] = page["next_cursor"]
+            self.assertEqual(
+                [
+                    "s-heppner.com/semanticID/1",
+                    "s-heppner.com/semanticID/two",
+                    "s-heppner.com/semanticID/2",
+                    "remote-service.com/semanticID/trois",
+                ],
+                matches
+            )
+            response = requests.get("http://localhost:8000/all_matches", params={"cursor": "invalid"})
+            self.assertEqual(400, response.status_code)
+
+    def test_get_all_matches_streamed(self):
+        with run_server_context():
+            response = requests.get(
+                "http://localhost:8000/all_matches",
+                params={"stream": True, "prefix": "s-heppner.com/semanticID/t"},
+            )
+            self.assertEqual("application/x-ndjson", response.headers["content-type"])
+            matches = [js.loads(line) for line in response.text.splitlines()]
+            self.assertEqual(
+                ["s-heppner.com/semanticID/two", "s-heppner.com/semanticID/three"],
+                [match["base_semantic_id"] for match in matches]
+            )
+
+    def test_post_matches_stream(self):
+        with run_server_context():
+            lines = [
+                SemanticMatch(
+                    base_semantic_id="s-heppner.com/semanticID/new",
+                    match_semantic_id=f"s-heppner.com/semanticID/{i}",
+                    score=0.5,
+                    meta_information={"matchSource": "Defined by UnitTest"}
+                ).model_dump_json()
+                for i in range(5)
+            ]
+            lines.insert(2, '{"base_semantic_id": "s-heppner.com/semanticID/new"}')
+            lines.insert(4, "")
+            body = ("\n".join(lines) + "\n").encode()
+            response = requests.post(
+                "http://localhost:8000/post_matches_stream",
+                data=(body[i:i + 50] for i in range(0, len(body), 50)),
+                headers={"Content-Type": "application/x-ndjson"}
+            )
+            result = response.json()
+            self.assertEqual(6, result["num_lines"])
+            self.assertEqual(5, result["num_added"])
+            self.assertEqual(1, result["num_errors"])
+            self.assertEqual(3, result["errors"][0]["line"])
+            response = requests.get("http://localhost:8000/all_matches")
+            self.assertEqual(5, len(response.json()["s-heppner.com/semanticID/new"]))
+
+    def test_get_matches_inbound(self):
+        with run_server_context():
+            match_request = {
+                "semantic_id": "s-heppner.com/semanticID/2",
+                "score_limit": 0.5,
+                "local_only": True,
+                "direction": "inbound"
+            }
+            response = requests.get("http://localhost:8000/get_matches", json=match_request)
+            self.assertEqual(
+                [("s-heppner.com/semanticID/two", 1.0), ("s-heppner.com/semanticID/one", 0.8)],
+                [(match["match_semantic_id"], match["score"]) for match in response.json()["matches"]]
+            )
+
+    def test_remove_matches_of(self):
+        with run_server_context():
+            response = requests.post(
+                "http://localhost:8000/remove_matches_of",
+                params={"semantic_id": "s-heppner.com/semanticID/two"}
+            )
+            self.assertEqual(
+                {
+                    ("s-heppner.com/semanticID/two", "s-heppner.com/semanticID/2"),
+                    ("s-heppner.com/semanticID/one", "s-heppner.com/semanticID/two"),
+                },
+                {(match["base_semantic_id"], match["match_semantic_id"]) for match in response.json()["matches"]}
+            )
+            response = requests.get("http://localhost:8000/all_matches")
+            self.assertNotIn("s-heppner.com/semanticID/two", response.json())
+            self.assertEqual(1, len(response.json()["s-heppner.com/semanticID/one"]))
+
     def test_remove_all_matches(self):
         with run_server_context():
             requests.post("http://localhost:8000/clear")
@@ -307,6 +442,415 @@ class TestSemanticMatchingService(unittest.TestCase):
             actual_matches = response.json()
             self.assertEqual(expected_matches, actual_matches)
 
+    def test_metrics(self):
+        with run_server_context():
+            response = requests.get(
+                "http://localhost:8000/get_matches",
+                json={"semantic_id": "s-heppner.com/semanticID/one", "score_limit": 0.5, "local_only": True},
+                headers={"X-Debug-Timing": "1"}
+            )
+            stages = [timing.split(";")[0] for timing in response.headers["Server-Timing"].split(", ")]
+            self.assertEqual(["local", "nlp", "serialize", "total"], stages)
+            response = requests.get("http://localhost:8000/get_matches_batch", json={"requests": []})
+            self.assertNotIn("Server-Timing", response.headers)
+
+            response = requests.get("http://localhost:8000/metrics")
+            self.assertTrue(response.headers["content-type"].startswith("text/plain"))
+            lines = response.text.splitlines()
+            self.assertIn('semantic_matcher_request_seconds_count{route="/get_matches"} 1', lines)
+            self.assertIn("semantic_matcher_table_matches 4.0", lines)
+            self.assertIn("# TYPE semantic_matcher_cache_hits_total counter", lines)
+            self.assertIn("# TYPE semantic_matcher_cache_entries gauge", lines)
+            # The server process may inherit the values of the module level metrics from other tests
+            for name in ['semantic_matcher_stage_seconds_count{stage="local"}',
+                         "semantic_matcher_traversal_nodes_expanded_total"]:
+                self.assertTrue(any(line.startswith(name + " ") for line in lines), name)
+
+
+class FakeSession:
+    """
+    Records the requests to remote services and answers each with one match per requested semantic ID
+    """
+    def __init__(self):
+        self.urls = []
+        self.bodies = []
+
+    def get(self, url, json, timeout):
+        self.urls.append(url)
+        self.bodies.append(json)
+        requests_list = json["requests"] if url.endswith("/get_matches_batch") else [json]
+        results = [
+            {"matches": [SemanticMatch(
+                base_semantic_id=request["semantic_id"],
+                match_semantic_id=request["semantic_id"] + "/remote",
+                score=1.0,
+                meta_information={}
+            ).model_dump()]}
+            for request in requests_list
+        ]
+        body = {"results": results} if url.endswith("/get_matches_batch") else results[0]
+
+        class Response:
+            status_code = 200
+            text = js.dumps(body)
+        return Response()
+
+
+def _table(matches):
+    """
+    Returns an equivalence table with the `matches`, given as `(base_semantic_id, match_semantic_id, score)` tuples
+    """
+    table = model.EquivalenceTable(matches={})
+    for base_semantic_id, match_semantic_id, score in matches:
+        table.add_semantic_match(SemanticMatch(
+            base_semantic_id=base_semantic_id,
+            match_semantic_id=match_semantic_id,
+            score=score,
+            meta_information={}
+        ))
+    return table
+
+
+def _connect(service, session):
+    """
+    Makes the `service` request remote services with the `session` and resolve each semantic ID to the service named
+    like its namespace
+    """
+    service._session = session
+    service._get_matcher_from_semantic_id = lambda semantic_id: "http://" + semantic_id.split("/")[0]
+    return service
+
+
+class TestRemoteMatching(unittest.TestCase):
+
+    def test_remote_requests_are_batched_per_service(self):
+        service = _connect(SemanticMatchingService(
+            endpoint="http://local.com",
+            equivalences=_table([
+                ("local.com/1", target, 0.9) for target in ["remote-a.com/1", "remote-a.com/2", "remote-b.com/1"]
+            ])
+        ), FakeSession())
+        result = service.get_matches(MatchRequest(semantic_id="local.com/1", score_limit=0.5, local_only=False))
+        self.assertEqual(
+            ["http://remote-a.com/get_matches_batch", "http://remote-b.com/get_matches"],
+            sorted(service._session.urls)
+        )
+        self.assertEqual(
+            ["remote-a.com/1", "remote-a.com/2", "remote-b.com/1",
+             "remote-a.com/1/remote", "remote-a.com/2/remote", "remote-b.com/1/remote"],
+            [match.match_semantic_id for match in result.matches]
+        )
+
+    def test_results_are_cached(self):
+        service = _connect(SemanticMatchingService(
+            endpoint="http://local.com",
+            equivalences=_table([("local.com/1", "remote-a.com/1", 0.9)])
+        ), FakeSession())
+        service.get_matches(MatchRequest(semantic_id="local.com/1", score_limit=0.5, local_only=False))
+        result = service.get_matches(MatchRequest(semantic_id="local.com/1", score_limit=0.6, local_only=False))
+        self.assertEqual(1, len(service._session.urls))
+        self.assertEqual(2, len(result.matches))
+        # A change of the table invalidates the cached local results
+        service.equivalence_table.add_semantic_match(SemanticMatch(
+            base_semantic_id="local.com/1",
+            match_semantic_id="local.com/2",
+            score=0.9,
+            meta_information={}
+        ))
+        result = service.get_matches(MatchRequest(semantic_id="local.com/1", score_limit=0.6, local_only=True))
+        self.assertEqual(["remote-a.com/1", "local.com/2"], [match.match_semantic_id for match in result.matches])
+
+    def test_max_results_skips_hopeless_remotes(self):
+        service = _connect(SemanticMatchingService(
+            endpoint="http://local.com",
+            equivalences=_table([
+                ("local.com/1", "remote-a.com/1", 0.95),
+                ("local.com/1", "local.com/2", 0.9),
+                ("local.com/1", "remote-b.com/1", 0.8),
+            ])
+        ), FakeSession())
+        result = service.get_matches(MatchRequest(
+            semantic_id="local.com/1",
+            score_limit=0.5,
+            local_only=False,
+            max_results=2
+        ))
+        # remote-b.com/1 is not among the two best matches, so its service is not requested
+        self.assertEqual(["http://remote-a.com/get_matches"], service._session.urls)
+        self.assertEqual(
+            ["remote-a.com/1", "remote-a.com/1/remote"],
+            [match.match_semantic_id for match in result.matches]
+        )
+        # Matches via remote-a.com/1 cannot beat remote-a.com/1 itself
+        result = service.get_matches(MatchRequest(
+            semantic_id="local.com/1",
+            score_limit=0.5,
+            local_only=False,
+            max_results=1
+        ))
+        self.assertEqual(1, len(service._session.urls))
+        self.assertEqual(["remote-a.com/1"], [match.match_semantic_id for match in result.matches])
+
+    def test_max_results_ranks_remote_matches_by_combined_score(self):
+        service = _connect(SemanticMatchingService(
+            endpoint="http://local.com",
+            equivalences=_table([
+                ("local.com/1", "remote-a.com/1", 0.95),
+                ("local.com/1", "local.com/2", 0.93),
+                ("local.com/1", "local.com/3", 0.9),
+            ])
+        ), FakeSession())
+
+        def request_remote_service(endpoint, remote_requests, deadline=None):
+            return [MatchesList(matches=[
+                SemanticMatch(
+                    base_semantic_id="remote-a.com/1",
+                    match_semantic_id=f"remote-a.com/{target}",
+                    score=score,
+                    meta_information={}
+                )
+                for target, score in [(2, 0.99), (3, 0.98)]
+            ])]
+        service._request_remote_service = request_remote_service
+        result = service.get_matches(MatchRequest(
+            semantic_id="local.com/1",
+            score_limit=0.5,
+            local_only=False,
+            max_results=2
+        ))
+        # The remote scores are relative to remote-a.com/1, so they rank at 0.95 * 0.99 and 0.95 * 0.98
+        self.assertEqual(
+            ["remote-a.com/1", "remote-a.com/2"],
+            [match.match_semantic_id for match in result.matches]
+        )
+
+    def test_batch_shares_remote_requests(self):
+        service = _connect(SemanticMatchingService(
+            endpoint="http://local.com",
+            equivalences=_table([("local.com/1", "remote-a.com/1", 0.9), ("local.com/2", "remote-a.com/1", 0.6)])
+        ), FakeSession())
+        results = service.get_matches_batch(MatchRequestBatch(requests=[
+            MatchRequest(semantic_id="local.com/1", score_limit=0.5, local_only=False),
+            MatchRequest(semantic_id="local.com/2", score_limit=0.5, local_only=False),
+        ])).results
+        # Both requests need remote-a.com/1, which is requested once with the lower score limit
+        self.assertEqual(["http://remote-a.com/get_matches"], service._session.urls)
+        self.assertAlmostEqual(0.5 / 0.9, service._session.bodies[0]["score_limit"])
+        for result in results:
+            self.assertEqual(
+                ["remote-a.com/1", "remote-a.com/1/remote"],
+                [match.match_semantic_id for match in result.matches]
+            )
+
+    def test_remote_results_are_deduplicated(self):
+        service = _connect(SemanticMatchingService(
+            endpoint="http://local.com",
+            equivalences=_table([("local.com/1", "remote-a.com/1", 0.9), ("local.com/1", "remote-b.com/1", 0.9)])
+        ), FakeSession())
+
+        def request_remote_service(endpoint, remote_requests, deadline=None):
+            # Both remote services passed the query on to shared.com
+            score = 0.9 if endpoint == "http://remote-a.com" else 0.7
+            return [MatchesList(matches=[SemanticMatch(
+                base_semantic_id="shared.com/1",
+                match_semantic_id="shared.com/2",
+                score=score,
+                meta_information={}
+            )])]
+        service._request_remote_service = request_remote_service
+        result = service.get_matches(MatchRequest(semantic_id="local.com/1", score_limit=0.5, local_only=False))
+        self.assertEqual(
+            [("remote-a.com/1", 0.9), ("remote-b.com/1", 0.9), ("shared.com/2", 0.9)],
+            [(match.match_semantic_id, match.score) for match in result.matches]
+        )
+
+    def test_timeout_cuts_off_slow_remotes(self):
+        session = FakeSession()
+        timeouts = []
+
+        def get(url, json, timeout):
+            timeouts.append(json["timeout"])
+            if url.startswith("http://remote-b.com"):
+                time.sleep(1.)
+            return FakeSession.get(session, url, json, timeout)
+
+        session.get = get
+        service = _connect(SemanticMatchingService(
+            endpoint="http://local.com",
+            equivalences=_table([("local.com/1", "remote-a.com/1", 0.9), ("local.com/1", "remote-b.com/1", 0.9)])
+        ), session)
+        start = time.monotonic()
+        result = service.get_matches(MatchRequest(
+            semantic_id="local.com/1",
+            score_limit=0.5,
+            local_only=False,
+            timeout=0.3
+        ))
+        self.assertLess(time.monotonic() - start, 0.9)
+        self.assertEqual(
+            ["remote-a.com/1", "remote-b.com/1", "remote-a.com/1/remote"],
+            [match.match_semantic_id for match in result.matches]
+        )
+        self.assertEqual(["http://remote-b.com"], result.cut_off_services)
+        # The remote services are given the time left, less the deadline margin
+        self.assertTrue(all(0. < timeout < 0.3 - service.deadline_margin for timeout in timeouts))
+
+    def test_failing_remotes_are_skipped(self):
+        urls = []
+
+        class FailingSession:
+            def get(self, url, json, timeout):
+                urls.append(url)
+                raise requests.ConnectionError()
+
+        service = _connect(SemanticMatchingService(
+            endpoint="http://local.com",
+            equivalences=_table([("local.com/1", "remote-a.com/1", 0.9)]),
+            federation_options=FederationOptions(circuit_breaker=circuit.CircuitBreaker(failure_threshold=2))
+        ), FailingSession())
+        request_body = MatchRequest(semantic_id="local.com/1", score_limit=0.5, local_only=False)
+        for _ in range(2):
+            result = service.get_matches(request_body)
+            self.assertEqual([], result.cut_off_services)
+        result = service.get_matches(request_body)
+        self.assertEqual(2, len(urls))
+        self.assertEqual(["remote-a.com/1"], [match.match_semantic_id for match in result.matches])
+        self.assertEqual(["http://remote-a.com"], result.cut_off_services)
+
+
+class TestNLPMatching(unittest.TestCase):
+
+    def test_nlp_fallback(self):
+        table = model.EquivalenceTable(matches={})
+        table.add_semantic_match(SemanticMatch(
+            base_semantic_id="local.com/torque",
+            match_semantic_id="local.com/max_torque",
+            score=0.9,
+            meta_information={}
+        ))
+        index = nlp.NgramIndex()
+        index.build({"local.com/torque": "Maximum torque", "local.com/speed": "Rotational speed"})
+        service = SemanticMatchingService(
+            endpoint="http://local.com",
+            equivalences=table,
+            nlp_options=NLPOptions(index=index)
+        )
+        service.post_descriptions(DescriptionsList(descriptions=[
+            SemanticIDDescription(semantic_id="local.com/rpm", name="Rotation speed", definition="Per minute")
+        ]))
+        result = service.get_matches(MatchRequest(
+            semantic_id="other.com/1",
+            score_limit=0.3,
+            name="rotation speed",
+            definition="per minute"
+        ))
+        self.assertEqual(["local.com/rpm", "local.com/speed"], [match.match_semantic_id for match in result.matches])
+        self.assertEqual(nlp.METHOD, result.matches[0].meta_information["method"])
+        # Semantic IDs with local matches are not matched by NLP
+        result = service.get_matches(MatchRequest(semantic_id="local.com/torque", score_limit=0.3, name="speed"))
+        self.assertEqual(["local.com/max_torque"], [match.match_semantic_id for match in result.matches])
+
+
+class InProcessSession:
+    """
+    Routes requests to remote services directly to the :class:`SemanticMatchingService` with the requested endpoint
+    """
+    def __init__(self, services):
+        self.services = services
+        self.urls = []
+
+    def get(self, url, json, timeout):
+        self.urls.append(url)
+        endpoint, operation = url.rsplit("/", 1)
+        service = self.services[endpoint]
+        if operation == "get_matches_batch":
+            body = service.get_matches_batch(MatchRequestBatch.model_validate(json))
+        else:
+            body = service.get_matches(MatchRequest.model_validate(json))
+
+        class Response:
+            status_code = 200
+            text = body.model_dump_json()
+        return Response()
+
+
+class TestFederation(unittest.TestCase):
+
+    def test_services_pointing_into_each_other_terminate(self):
+        services = {}
+        session = InProcessSession(services)
+        for namespace, other_namespace in [("a.com", "b.com"), ("b.com", "a.com")]:
+            matches = [
+                (f"{namespace}/{i}", match_semantic_id, 1.0)
+                for i in range(3)
+                for match_semantic_id in [f"{other_namespace}/{i}", f"{namespace}/{(i + 1) % 3}"]
+            ]
+            services[f"http://{namespace}"] = _connect(SemanticMatchingService(
+                endpoint=f"http://{namespace}",
+                equivalences=_table(matches)
+            ), session)
+        result = services["http://a.com"].get_matches(
+            MatchRequest(semantic_id="a.com/0", score_limit=0.5, local_only=False)
+        )
+        # a.com only asks b.com once, b.com must not ask a.com again
+        self.assertEqual(["http://b.com/get_matches_batch"], session.urls)
+        self.assertEqual(
+            {"a.com/0", "a.com/1", "a.com/2", "b.com/0", "b.com/1", "b.com/2"},
+            {match.match_semantic_id for match in result.matches}
+        )
+
+    def test_max_hops(self):
+        service = _connect(SemanticMatchingService(
+            endpoint="http://local.com",
+            equivalences=_table([("local.com/1", "remote-a.com/1", 0.9)])
+        ), FakeSession())
+        service.get_matches(MatchRequest(semantic_id="local.com/1", score_limit=0.5, local_only=False, max_hops=0))
+        self.assertEqual([], service._session.urls)
+        service.get_matches(MatchRequest(semantic_id="local.com/1", score_limit=0.5, local_only=False, max_hops=1))
+        self.assertEqual(["http://remote-a.com/get_matches"], service._session.urls)
+
+    def test_query_is_passed_on_once_per_max_results(self):
+        service = _connect(SemanticMatchingService(
+            endpoint="http://local.com",
+            equivalences=_table([("local.com/1", "remote-a.com/1", 0.9)])
+        ), FakeSession())
+        for max_results in [None, None, 5]:
+            result = service.get_matches(MatchRequest(
+                semantic_id="local.com/1",
+                score_limit=0.5,
+                local_only=False,
+                query_id="query",
+                max_results=max_results
+            ))
+        # The repeated query is not passed on again, the one with a different `max_results` is
+        self.assertEqual(["http://remote-a.com/get_matches"] * 2, service._session.urls)
+        self.assertFalse(result.truncated)
+
+    def test_truncated_results_are_not_cached(self):
+        services = {}
+        session = InProcessSession(services)
+        for namespace, match_semantic_id in [("c.com", "d.com/1"), ("d.com", "e.com/1"), ("e.com", "e.com/2")]:
+            services[f"http://{namespace}"] = _connect(SemanticMatchingService(
+                endpoint=f"http://{namespace}",
+                equivalences=_table([(f"{namespace}/1", match_semantic_id, 1.0)])
+            ), session)
+        # d.com runs out of hops and leaves out the matches of e.com
+        result = services["http://c.com"].get_matches(
+            MatchRequest(semantic_id="c.com/1", score_limit=0.5, local_only=False, max_hops=1)
+        )
+        self.assertEqual(["d.com/1", "e.com/1"], [match.match_semantic_id for match in result.matches])
+        self.assertTrue(result.truncated)
+        # A separate query with more hops must not get the truncated answer of d.com from the cache
+        result = services["http://c.com"].get_matches(
+            MatchRequest(semantic_id="c.com/1", score_limit=0.5, local_only=False, max_hops=2)
+        )
+        self.assertEqual(["d.com/1", "e.com/1", "e.com/2"], [match.match_semantic_id for match in result.matches])
+        self.assertFalse(result.truncated)
+        self.assertEqual(
+            ["http://d.com/get_matches", "http://d.com/get_matches", "http://e.com/get_matches"],
+            session.urls
+        )
+
 
 if __name__ == '__main__':
     unittest.main()
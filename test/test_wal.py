@@ -0,0 +1,133 @@
+import os
+import tempfile
+import unittest
+
+from semantic_matcher import snapshot
+from semantic_matcher.model import EquivalenceTable, SemanticMatch
+from semantic_matcher.wal import MutationLog
+
+
+def _match(base: str, match: str, score: float) -> SemanticMatch:
+    return SemanticMatch(
+        base_semantic_id=base,
+        match_semantic_id=match,
+        score=score,
+        meta_information={"matchSource": "Defined by UnitTest"}
+    )
+
+
+def _replay(log_file: str, table: EquivalenceTable) -> int:
+    log = MutationLog(log_file, "unused")
+    try:
+        return log.replay(table)
+    finally:
+        log.close()
+
+
+class TestMutationLog(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.log_file = os.path.join(self.directory.name, "mutations.ndjson")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_replay(self):
+        table = EquivalenceTable(matches={})
+        log = MutationLog(self.log_file, os.path.join(self.directory.name, "table.json"))
+        try:
+            log.add_semantic_matches(table, [_match("a", "b", 0.5), _match("a", "c", 0.5)])
+            log.remove_all_semantic_matches(table)
+            log.add_semantic_matches(table, [_match("a", "b", 0.7), _match("b", "c", 0.5)])
+            log.add_semantic_matches(table, [_match("a", "b", 0.7)])
+            log.remove_semantic_matches(table, [_match("b", "c", 0.5), _match("x", "y", 0.5)])
+            self.assertEqual(6, len(log))
+        finally:
+            log.close()
+
+        replayed_table = EquivalenceTable(matches={})
+        self.assertEqual(6, _replay(self.log_file, replayed_table))
+        self.assertEqual(table.get_all_matches(), replayed_table.get_all_matches())
+
+    def test_partially_written_last_record_is_ignored(self):
+        table = EquivalenceTable(matches={})
+        log = MutationLog(self.log_file, os.path.join(self.directory.name, "table.json"))
+        try:
+            log.add_semantic_matches(table, [_match("a", "b", 0.5)])
+        finally:
+            log.close()
+        with open(self.log_file, "a") as file:
+            file.write('{"op": "add", "ma')
+        replayed_table = EquivalenceTable(matches={})
+        self.assertEqual(1, _replay(self.log_file, replayed_table))
+        self.assertEqual(table.get_all_matches(), replayed_table.get_all_matches())
+
+    def test_append_after_partially_written_last_record(self):
+        table = EquivalenceTable(matches={})
+        log = MutationLog(self.log_file, "unused")
+        try:
+            log.add_semantic_matches(table, [_match("a", "b", 0.5)])
+        finally:
+            log.close()
+        with open(self.log_file, "a") as file:
+            file.write('{"op": "add", "ma')
+
+        log = MutationLog(self.log_file, "unused")
+        try:
+            self.assertEqual(1, log.replay(table))
+            log.add_semantic_matches(table, [_match("a", "c", 0.5)])
+            self.assertEqual(2, len(log))
+        finally:
+            log.close()
+        replayed_table = EquivalenceTable(matches={})
+        self.assertEqual(2, _replay(self.log_file, replayed_table))
+        self.assertEqual(table.get_all_matches(), replayed_table.get_all_matches())
+
+    def test_compact(self):
+        for snapshot_name in ["table.json", "table.snapshot"]:
+            snapshot_file = os.path.join(self.directory.name, snapshot_name)
+            table = EquivalenceTable(matches={})
+            log = MutationLog(self.log_file, snapshot_file)
+            try:
+                log.add_semantic_matches(table, [_match("a", "b", 0.5)])
+                log.compact(table)
+                self.assertEqual(0, len(log))
+                self.assertEqual(0, os.path.getsize(self.log_file))
+                log.add_semantic_matches(table, [_match("a", "c", 0.5)])
+            finally:
+                log.close()
+
+            if snapshot_file.endswith(snapshot.SUFFIX):
+                restored_table = snapshot.load(snapshot_file)
+            else:
+                restored_table = EquivalenceTable.from_file(snapshot_file)
+            _replay(self.log_file, restored_table)
+            self.assertEqual(table.get_all_matches(), restored_table.get_all_matches())
+            os.remove(self.log_file)
+
+    def test_changes_during_compaction_stay_in_the_log(self):
+        snapshot_file = os.path.join(self.directory.name, "table.json")
+
+        class ConcurrentlyChangedTable(EquivalenceTable):
+            def to_file(self, filename: str) -> None:
+                # Would deadlock if the snapshot was written while holding the log
+                log.add_semantic_matches(self, [_match("a", "c", 0.5)])
+                super().to_file(filename)
+
+        table = ConcurrentlyChangedTable(matches={})
+        log = MutationLog(self.log_file, snapshot_file)
+        try:
+            log.add_semantic_matches(table, [_match("a", "b", 0.5)])
+            log.compact(table)
+            self.assertEqual(1, len(log))
+        finally:
+            log.close()
+
+        restored_table = EquivalenceTable.from_file(snapshot_file)
+        self.assertEqual(1, _replay(self.log_file, restored_table))
+        self.assertEqual(table.get_all_matches(), restored_table.get_all_matches())
+
+
+if __name__ == '__main__':
+    unittest.main()